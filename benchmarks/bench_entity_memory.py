@@ -0,0 +1,63 @@
+"""
+Benchmark: memory per entity of the slotted entity classes against the previous __dict__ based ones.
+Run from the project root: python benchmarks/bench_entity_memory.py
+"""
+import tracemalloc
+
+from src.domain.entities import Client, Movie, Rental
+
+
+class DictClient:
+    """
+    The previous Client layout (a per-instance __dict__), kept here for comparison.
+    """
+
+    def __init__(self, client_id, name):
+        self.__client_id = client_id
+        self.__name = name
+
+
+class DictMovie:
+    def __init__(self, movie_id, title, description, genre):
+        self.__movie_id = movie_id
+        self.__title = title
+        self.__description = description
+        self.__genre = genre
+
+
+class DictRental:
+    def __init__(self, rental_id, movie_id, client_id, rented_date, due_date, returned_date):
+        self.__rental_id = rental_id
+        self.__movie_id = movie_id
+        self.__client_id = client_id
+        self.__rented_date = rented_date
+        self.__due_date = due_date
+        self.__returned_date = returned_date
+
+
+def bytes_per_entity(make_entity, count=100000):
+    """
+    The attribute values are created up front, so only the entity objects themselves are measured.
+    """
+    ids = [str(index) for index in range(count)]
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    entities = [make_entity(entity_id) for entity_id in ids]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    # the list holding the entities is not part of the entity
+    return (allocated - 8 * len(entities)) / count
+
+
+if __name__ == '__main__':
+    print("%8s %16s %16s" % ("entity", "__dict__ (B)", "__slots__ (B)"))
+    rows = [
+        ("client", lambda entity_id: DictClient(entity_id, "name"), lambda entity_id: Client(entity_id, "name")),
+        ("movie", lambda entity_id: DictMovie(entity_id, "title", "description", "genre"),
+         lambda entity_id: Movie(entity_id, "title", "description", "genre")),
+        ("rental", lambda entity_id: DictRental(entity_id, "1", "2", "10.10.2010", "11.10.2010", "N.A."),
+         lambda entity_id: Rental(entity_id, "1", "2", "10.10.2010", "11.10.2010", "N.A.")),
+    ]
+    for name, make_dict_entity, make_slots_entity in rows:
+        print("%8s %16.1f %16.1f" % (name, bytes_per_entity(make_dict_entity), bytes_per_entity(make_slots_entity)))
@@ -0,0 +1,55 @@
+"""
+Benchmark: memory and statistics scan time of RentalRepository against RentalColumnarRepository.
+Run from the project root: python benchmarks/bench_rental_storage.py
+"""
+import datetime
+import random
+import time
+import tracemalloc
+
+from src.domain.entities import Rental, ordinal_to_date
+from src.domain.validators import RentalValidator
+from src.repository.rental_repository import RentalRepository, RentalColumnarRepository
+
+
+def make_rentals(count):
+    today = datetime.date.today().toordinal()
+    rentals = []
+    for index in range(count):
+        rented = today - random.randint(10, 5000)
+        returned = random.choice([None, rented + random.randint(0, 9)])
+        rentals.append(Rental(str(index + 1), str(random.randint(1, 1000)), str(random.randint(1, 1000)),
+                              ordinal_to_date(rented), ordinal_to_date(rented + 7),
+                              "N.A." if returned is None else ordinal_to_date(returned)))
+    return rentals
+
+
+def measure(repository_class, rentals):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    repository = repository_class(RentalValidator)
+    for rental in rentals:
+        # the columnar repository does not keep the entity, the in-memory one does
+        repository.add_entity(Rental(rental.rental_id, rental.movie_id, rental.client_id, rental.rented_date,
+                                     rental.due_date, rental.returned_date))
+    memory = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    today = datetime.date.today().toordinal()
+    start = time.perf_counter()
+    repository.days_rented_per_movie(today)
+    repository.days_rented_per_client(today)
+    repository.find_overdue(today)
+    return memory, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    random.seed(8)
+    print("%9s %22s %14s %22s %14s" % ("rentals", "in-memory (B/rental)", "stats (s)", "columnar (B/rental)",
+                                       "stats (s)"))
+    for count in [10 ** 4, 10 ** 5]:
+        rentals = make_rentals(count)
+        memory, seconds = measure(RentalRepository, rentals)
+        columnar_memory, columnar_seconds = measure(RentalColumnarRepository, rentals)
+        print("%9d %22.1f %14.4f %22.1f %14.4f" % (count, memory / count, seconds, columnar_memory / count,
+                                                   columnar_seconds))
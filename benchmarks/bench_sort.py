@@ -0,0 +1,55 @@
+"""
+Benchmark: the merge sort behind my_sort against the gnome sort it replaced.
+Run from the project root: python benchmarks/bench_sort.py
+"""
+import random
+import timeit
+
+from src.iterable_data_structure import MyIterator, my_sort
+
+
+def gnome_sort(collection, comparison):
+    """
+    The previous my_sort implementation, kept here for comparison.
+    """
+    index = 0
+    while index < len(collection):
+        if index == 0 or comparison(collection[index - 1], collection[index]):
+            index = index + 1
+        else:
+            collection[index - 1], collection[index] = collection[index], collection[index - 1]
+            index = index - 1
+
+
+def make_statistics(size):
+    """
+    Random [days, entity] rows, shaped like the output of the RentalService statistics.
+    """
+    statistics = MyIterator()
+    for index in range(size):
+        statistics.append([random.randint(0, 10 * size), str(index)])
+    return statistics
+
+
+def time_sort(sort, size, repeat=3):
+    best = None
+    for _ in range(repeat):
+        statistics = make_statistics(size)
+        seconds = timeit.timeit(lambda: sort(statistics), number=1)
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+if __name__ == '__main__':
+    random.seed(3)
+    print("%8s %14s %14s %14s" % ("rows", "gnome sort", "merge (cmp)", "merge (key)"))
+    for size in [250, 500, 1000, 2000, 4000]:
+        gnome = time_sort(lambda collection: gnome_sort(collection, lambda x, y: x[0] >= y[0]), size, repeat=1)
+        merge_comparison = time_sort(lambda collection: my_sort(collection, lambda x, y: x[0] >= y[0]), size)
+        merge_key = time_sort(lambda collection: my_sort(collection, key=lambda x: x[0], reverse=True), size)
+        print("%8d %13.4fs %13.4fs %13.4fs" % (size, gnome, merge_comparison, merge_key))
+
+    print("\nmerge sort only:")
+    for size in [10 ** 4, 10 ** 5]:
+        merge_key = time_sort(lambda collection: my_sort(collection, key=lambda x: x[0], reverse=True), size, repeat=1)
+        print("%8d %13.4fs" % (size, merge_key))
@@ -1,7 +1,58 @@
+import datetime
+from functools import lru_cache
+
+
+@lru_cache(maxsize=4096)
+def date_to_ordinal(date):
+    """
+    Parses a date of the form dd.mm.yyyy (the day and month may have one digit, as with strptime's "%d.%m.%Y").
+    :return: the proleptic Gregorian ordinal of the date, or None if the string is not a valid date
+    """
+    if not isinstance(date, str):
+        return None
+
+    parts = date.split('.')
+    if len(parts) != 3:
+        return None
+
+    day, month, year = parts
+    if not (0 < len(day) <= 2 and 0 < len(month) <= 2 and len(year) == 4):
+        return None
+
+    if not (day.isdigit() and month.isdigit() and year.isdigit()):
+        return None
+
+    try:
+        return datetime.date(int(year), int(month), int(day)).toordinal()
+    except ValueError:
+        return None
+
+
+def ordinal_to_date(ordinal):
+    """
+    Inverse of date_to_ordinal.
+    :return: the date as a dd.mm.yyyy string
+    """
+    date = datetime.date.fromordinal(ordinal)
+    return "%02d.%02d.%04d" % (date.day, date.month, date.year)
+
+
+def _set_slots_state(entity, state):
+    """
+    Restores a pickled entity. The state is (None, {slot: value}) for slotted entities, or the instance __dict__
+    for entities pickled before the classes were slotted (both use the same name-mangled attribute names).
+    """
+    if isinstance(state, tuple):
+        state = state[1]
+    for name, value in state.items():
+        object.__setattr__(entity, name, value)
+
+
 class Movie:
     """
     Class for the movie entities
     """
+    __slots__ = ('__movie_id', '__title', '__description', '__genre')
 
     def __init__(self, movie_id, title, description, genre):
         self.__movie_id = movie_id
@@ -9,6 +60,9 @@ class Movie:
         self.__description = description
         self.__genre = genre
 
+    def __setstate__(self, state):
+        _set_slots_state(self, state)
+
     @property
     def movie_id(self):
         return self.__movie_id
@@ -50,14 +104,25 @@ class Rental:
     """
     Class for the rental entities
     """
+    __slots__ = ('__rental_id', '__movie_id', '__client_id', '__rented_date', '__due_date', '__returned_date',
+                 '__rented_ordinal', '__due_ordinal', '__returned_ordinal')
 
     def __init__(self, rental_id, movie_id, client_id, rented_date, due_date, returned_date):
         self.__rental_id = rental_id
         self.__movie_id = movie_id
         self.__client_id = client_id
-        self.__rented_date = rented_date
-        self.__due_date = due_date
-        self.__returned_date = returned_date
+        self.rented_date = rented_date
+        self.due_date = due_date
+        self.returned_date = returned_date
+
+    def __setstate__(self, state):
+        """
+        Unpickling: the ordinals are recomputed, so rentals pickled before they were cached load correctly.
+        """
+        _set_slots_state(self, state)
+        self.rented_date = self.__rented_date
+        self.due_date = self.__due_date
+        self.returned_date = self.__returned_date
 
     @property
     def rental_id(self):
@@ -90,6 +155,14 @@ class Rental:
     @rented_date.setter
     def rented_date(self, value):
         self.__rented_date = value
+        self.__rented_ordinal = date_to_ordinal(value)
+
+    @property
+    def rented_ordinal(self):
+        """
+        The rented date as a day number (see date_to_ordinal), None if the date is not valid
+        """
+        return self.__rented_ordinal
 
     @property
     def due_date(self):
@@ -98,6 +171,11 @@ class Rental:
     @due_date.setter
     def due_date(self, value):
         self.__due_date = value
+        self.__due_ordinal = date_to_ordinal(value)
+
+    @property
+    def due_ordinal(self):
+        return self.__due_ordinal
 
     @property
     def returned_date(self):
@@ -106,6 +184,14 @@ class Rental:
     @returned_date.setter
     def returned_date(self, value):
         self.__returned_date = value
+        self.__returned_ordinal = date_to_ordinal(value)
+
+    @property
+    def returned_ordinal(self):
+        """
+        None if the movie was not returned ("N.A.")
+        """
+        return self.__returned_ordinal
 
     def __str__(self):
         return "rental id: " + str(self.__rental_id) + ";   movie id: " + str(self.__movie_id) + \
@@ -117,11 +203,15 @@ class Client:
     """
     Class for the client entities
     """
+    __slots__ = ('__client_id', '__name')
 
     def __init__(self, client_id, name):
         self.__client_id = client_id
         self.__name = name
 
+    def __setstate__(self, state):
+        _set_slots_state(self, state)
+
     @property
     def client_id(self):
         return self.__client_id
@@ -143,6 +233,8 @@ class Client:
 
 
 class UndoRedoEntity:
+    __slots__ = ('__method', '__args')
+
     def __init__(self, method, *args):
         self.__method = method
         self.__args = args
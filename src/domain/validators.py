@@ -1,5 +1,7 @@
 import datetime
 
+from src.domain.entities import date_to_ordinal
+
 
 class MiscellaneousValidatorException(Exception):
     pass
@@ -44,9 +46,7 @@ class MiscellaneousValidator:
         Checks if a string can represent a valid date
         :param date: string
         """
-        try:
-            datetime.datetime.strptime(date, "%d.%m.%Y")
-        except ValueError:
+        if date_to_ordinal(date) is None:
             raise MiscellaneousValidatorException("The date is not valid.")
 
     @staticmethod
@@ -123,25 +123,20 @@ class RentalValidator:
         except MiscellaneousValidatorException:
             raise RentalValidatorException("The rental, movie and client ids have to be positive integers.")
 
-        try:
-            MiscellaneousValidator.is_valid_date(rental.rented_date)
-            MiscellaneousValidator.is_valid_date(rental.due_date)
-            if rental.returned_date == "N.A.":
-                pass
-            else:
-                MiscellaneousValidator.is_valid_date(rental.returned_date)
-        except MiscellaneousValidatorException:
+        # the dates are parsed once, by the entity
+        rented_ordinal = rental.rented_ordinal
+        due_ordinal = rental.due_ordinal
+        returned_ordinal = rental.returned_ordinal
+        if rented_ordinal is None or due_ordinal is None or \
+                (returned_ordinal is None and rental.returned_date != "N.A."):
             raise RentalValidatorException("The rented, due and returned dates must be valid "
                                            "and of the form: dd.mm.yyyy")
 
-        if datetime.datetime.strptime(rental.rented_date, "%d.%m.%Y") > datetime.datetime.now():
+        if rented_ordinal > datetime.date.today().toordinal():
             raise RentalValidatorException("The rented date must be before the current date.")
 
-        if datetime.datetime.strptime(rental.rented_date, "%d.%m.%Y") > datetime.datetime.strptime(rental.due_date,
-                                                                                                   "%d.%m.%Y"):
+        if rented_ordinal > due_ordinal:
             raise RentalValidatorException("The rented date must be before the due date.")
 
-        if rental.returned_date != "N.A.":
-            if datetime.datetime.strptime(rental.rented_date, "%d.%m.%Y") > datetime.datetime.strptime(
-                    rental.returned_date, "%d.%m.%Y"):
-                raise RentalValidatorException("The returned date must be after the rented date.")
+        if returned_ordinal is not None and rented_ordinal > returned_ordinal:
+            raise RentalValidatorException("The returned date must be after the rented date.")
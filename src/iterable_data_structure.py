@@ -38,9 +38,19 @@ class MyIterator:
     def remove(self, item):
         self._data.remove(item)
 
+    def remove_all(self, items):
+        """
+        Removes every given item (compared by identity) in a single pass over the data.
+        """
+        removed = set(id(item) for item in items)
+        self._data[:] = [item for item in self._data if id(item) not in removed]
+
     def append(self, item):
         self._data.append(item)
 
+    def extend(self, items):
+        self._data.extend(items)
+
     def pop(self):
         return self._data.pop()
 
@@ -48,18 +58,89 @@ class MyIterator:
         self._data.clear()
 
 
-def my_sort(collection, comparison):
+def my_sort(collection, comparison=None, key=None, reverse=False):
+    """
+    Stable natural merge sort, O(n log n): ascending runs (and strictly descending ones, reversed) are detected
+    first and then merged pairwise, bottom-up. The collection (MyIterator or list) is sorted in place.
+    :param comparison: function(x, y) that is true if x may come before y; both "<=" and "<" styles work
+    :param key: function(x) returning the value to sort by, used instead of comparison
+    :param reverse: sort in descending order, keeping equal items in their original order
+    """
+    if key is not None:
+        items = [(key(item), item) for item in collection]
+
+        def precedes(x, y):
+            return x[0] > y[0] if reverse else x[0] < y[0]
+    elif comparison is not None:
+        items = list(collection)
+
+        def precedes(x, y):
+            if reverse:
+                x, y = y, x
+            return comparison(x, y) and not comparison(y, x)
+    else:
+        raise ValueError("Either a comparison or a key function is required.")
+
+    result = _merge_runs(_find_runs(items, precedes), precedes)
+    for index in range(len(result)):
+        collection[index] = result[index][1] if key is not None else result[index]
+
+
+def _find_runs(items, precedes):
+    """
+    Splits the items into ascending runs. Strictly descending runs are reversed, which keeps the sort stable.
+    :param precedes: function(x, y) that is true if x must come strictly before y
+    """
+    runs = []
+    start = 0
+    length = len(items)
+    while start < length:
+        end = start + 1
+        if end < length and precedes(items[end], items[start]):
+            while end < length and precedes(items[end], items[end - 1]):
+                end = end + 1
+            run = items[start:end]
+            run.reverse()
+        else:
+            while end < length and not precedes(items[end], items[end - 1]):
+                end = end + 1
+            run = items[start:end]
+        runs.append(run)
+        start = end
+    return runs
+
+
+def _merge_runs(runs, precedes):
+    if len(runs) == 0:
+        return []
+
+    while len(runs) > 1:
+        merged_runs = []
+        for index in range(0, len(runs) - 1, 2):
+            merged_runs.append(_merge(runs[index], runs[index + 1], precedes))
+        if len(runs) % 2 == 1:
+            merged_runs.append(runs[-1])
+        runs = merged_runs
+    return runs[0]
+
+
+def _merge(left, right, precedes):
     """
-    Gnome Sort implementation.
-    The comparison function must work with "<=" or ">=". If it does not include the '=' sign: infinite loop.
+    Merges two sorted runs. On ties the item from the left run is taken first, so the merge is stable.
     """
-    index = 0
-    while index < len(collection):
-        if index == 0 or comparison(collection[index - 1], collection[index]):
-            index = index + 1
+    merged = []
+    left_index, right_index = 0, 0
+    left_length, right_length = len(left), len(right)
+    while left_index < left_length and right_index < right_length:
+        if precedes(right[right_index], left[left_index]):
+            merged.append(right[right_index])
+            right_index = right_index + 1
         else:
-            collection[index - 1], collection[index] = collection[index], collection[index - 1]
-            index = index - 1
+            merged.append(left[left_index])
+            left_index = left_index + 1
+    merged.extend(left[left_index:])
+    merged.extend(right[right_index:])
+    return merged
 
 
 def my_filter(collection, acceptance):
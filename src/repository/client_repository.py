@@ -1,9 +1,14 @@
 import os
 import pickle
+import sqlite3
 
 from domain.entities import Client
 from src.domain.validators import MiscellaneousValidator, MiscellaneousValidatorException, ClientValidatorException
 from src.iterable_data_structure import MyIterator
+from src.repository.struct_record_file import StructRecordFile, StructRecordFileException
+from src.repository.text_file_log import TextFileLog, TextFileLogException, replace_file
+from src.repository.text_index import TrigramIndex
+from src.repository.write_behind_buffer import DirectFileWriter
 
 
 class ClientRepositoryException(Exception):
@@ -15,6 +20,8 @@ class ClientRepository(object):
         self.__validator_class = validator_class
         # self.__entities = []
         self.__entities = MyIterator()
+        self.__entities_by_id = {}  # client id -> client, kept in sync with self.__entities
+        self.__name_index = TrigramIndex()  # of the clients in self.__entities_by_id
 
     def find_by_id(self, client_id):
         try:
@@ -22,19 +29,21 @@ class ClientRepository(object):
         except MiscellaneousValidatorException as mve:
             raise ClientRepositoryException("The client id is not valid:" + " - " + str(mve))
 
-        for client in self.__entities:
-            if client.client_id == client_id:
-                return client
-
-        return None
+        return self.__entities_by_id.get(client_id)
 
     def add_entity(self, client):
         try:
             self.__validator_class.validate(client)
-            self.__entities.append(client)
         except ClientValidatorException as cve:
             raise ClientRepositoryException("The client's attributes are not valid:" + " - " + str(cve))
 
+        if client.client_id in self.__entities_by_id:
+            raise ClientRepositoryException("The client already exists.")
+
+        self.__entities.append(client)
+        self.__entities_by_id[client.client_id] = client
+        self.__name_index.add(client.client_id, client, client.name)
+
     def remove_by_id(self, client_id):
         """
         :return: The removed client
@@ -52,20 +61,71 @@ class ClientRepository(object):
             raise ClientRepositoryException("The given client is not in the list.")
 
         self.__entities.remove(client)
+        del self.__entities_by_id[client_id]
+        self.__name_index.remove(client_id)
         return client
 
     def update_entity_by_id(self, client_id, updated_client):
         try:
             self.__validator_class.validate(updated_client)
-            self.find_by_id(client_id)
+            client = self.find_by_id(client_id)
         except ClientValidatorException as cve:
             raise ClientRepositoryException("The client's attributes are not valid:" + " - " + str(cve))
 
-        for client in self.__entities:
-            if client.client_id == client_id:
-                client.client_id = updated_client.client_id
-                client.name = updated_client.name
-                return
+        if client is None:
+            return
+
+        new_client_id = updated_client.client_id
+        if new_client_id != client_id and new_client_id in self.__entities_by_id:
+            raise ClientRepositoryException("The client already exists.")
+
+        self.__name_index.remove(client_id)
+        if new_client_id != client_id:
+            del self.__entities_by_id[client_id]
+            self.__entities_by_id[new_client_id] = client
+        client.client_id = new_client_id
+        client.name = updated_client.name
+        self.__name_index.add(new_client_id, client, client.name)
+
+    def bulk_load(self, clients):
+        """
+        Adds the clients in a single pass, skipping (and reporting) the invalid ones and the ones whose id is taken.
+        :return: (list of the added clients, list of (position, client, error message) for the rejected clients)
+        """
+        loaded = []
+        rejected = []
+        for position, client in enumerate(clients):
+            try:
+                self.__validator_class.validate(client)
+            except ClientValidatorException as cve:
+                rejected.append((position, client, "The client's attributes are not valid:" + " - " + str(cve)))
+                continue
+
+            error = "The client already exists." if client.client_id in self.__entities_by_id else \
+                self._storage_error(client)
+            if error is not None:
+                rejected.append((position, client, error))
+                continue
+
+            self.__entities_by_id[client.client_id] = client
+            self.__name_index.add(client.client_id, client, client.name)
+            loaded.append(client)
+
+        self.__entities.extend(loaded)
+        return loaded, rejected
+
+    def _storage_error(self, client):
+        """
+        :return: the reason the client can not be stored, None if it can
+        """
+        return None
+
+    def find_by_name_fragment(self, fragment):
+        """
+        Case-insensitive substring search over the names, through the trigram index.
+        :return: the clients whose name contains the fragment, None if the fragment is too short for the index
+        """
+        return self.__name_index.find(fragment)
 
     @property
     def get_all_entities(self):
@@ -76,75 +136,215 @@ class ClientRepository(object):
 
 
 class ClientTextFileRepository(ClientRepository):
-    def __init__(self, validator_class, file_name):
+    _FIELD_COUNT = 2  # client id, name
+
+    def __init__(self, validator_class, file_name, log_structured=False, compaction_threshold=1000,
+                 write_buffer=None):
+        """
+        :param log_structured: append every change to a "<file_name>.log" log, replayed on load, instead of
+        rewriting the file; the file is rewritten (compacted) once the log has compaction_threshold records
+        :param write_buffer: WriteBehindBuffer for the appended lines, None to write them at once
+        """
         super().__init__(validator_class)
         self._file_name = file_name
+        self._writer = DirectFileWriter() if write_buffer is None else write_buffer
+        self._log = None
+        if log_structured:
+            self._log = TextFileLog(file_name, self._FIELD_COUNT, compaction_threshold, write_buffer)
         self._load_data()
 
-    def _load_data(self):
-        with open(self._file_name) as file_pointer:
+    @staticmethod
+    def _to_fields(entity):
+        return [entity.client_id, entity.name]
+
+    @staticmethod
+    def _from_fields(attributes):
+        return Client(attributes[0], attributes[1])
+
+    @classmethod
+    def iter_file_entities(cls, file_name):
+        """
+        Yields the clients of a file one line at a time, without loading them into a repository. The changes in the
+        log of a log-structured repository are not included (compact it first).
+        """
+        with open(file_name) as file_pointer:
             for line in file_pointer:
-                attributes = line.strip().split(",")
-                entity = Client(attributes[0], attributes[1])
-                super().add_entity(entity)
+                yield cls._from_fields(line.strip().split(","))
+
+    def _load_data(self):
+        loaded, rejected = super().bulk_load(self.iter_file_entities(self._file_name))
+        if len(rejected) > 0:
+            position, entity, error = rejected[0]
+            raise ClientRepositoryException(self._file_name + ", line " + str(position + 1) + ": " + error)
+
+        if self._log is not None:
+            self._replay_log()
+
+    def _replay_log(self):
+        """
+        Applies the logged changes over the loaded snapshot (the log only yields the changes made to this
+        snapshot); the changes that do not apply to it are skipped.
+        """
+        try:
+            for operation, attributes in self._log.records():
+                if operation == TextFileLog.ADD:
+                    if super().find_by_id(attributes[0]) is None:
+                        super().add_entity(self._from_fields(attributes))
+                elif operation == TextFileLog.UPDATE:
+                    if super().find_by_id(attributes[0]) is not None:
+                        super().update_entity_by_id(attributes[0], self._from_fields(attributes[1:]))
+                elif operation == TextFileLog.DELETE:
+                    if super().find_by_id(attributes[0]) is not None:
+                        super().remove_by_id(attributes[0])
+        except TextFileLogException as error:
+            raise ClientRepositoryException(str(error))
+
+    def _log_change(self, operation, fields):
+        self._log.append(operation, fields)
+        if self._log.needs_compaction():
+            self.compact()
+
+    def compact(self):
+        """
+        Rewrites the file from memory and empties the log.
+        """
+        if self._log is not None:
+            self._log.compact(self._snapshot_lines())
 
     def _save_to_file(self, entity):
-        with open(self._file_name, 'a') as file_pointer:
-            entity_to_write = entity.client_id + "," + entity.name + '\n'
-            file_pointer.write(entity_to_write)
+        entity_to_write = ",".join(self._to_fields(entity)) + '\n'
+        self._writer.append(self._file_name, entity_to_write)
 
-    def _rewrite_file(self):
+    def _snapshot_lines(self):
         try:
             entities = super().get_all_entities
-            with open(self._file_name, "wt") as file_pointer:
-                for entity in entities:
-                    entity_to_write = entity.client_id + "," + entity.name + '\n'
-                    file_pointer.write(entity_to_write)
         except ClientRepositoryException:
-            open(self._file_name, 'wt').close()  # empty out the file
+            return []  # an empty file
+        return [",".join(self._to_fields(entity)) + '\n' for entity in entities]
+
+    def _rewrite_file(self):
+        replace_file(self._file_name, self._snapshot_lines(), self._writer)
+
+    def bulk_load(self, entities):
+        loaded, rejected = super().bulk_load(entities)
+        if self._log is not None:
+            self._log.append_all(TextFileLog.ADD, [self._to_fields(entity) for entity in loaded])
+            if self._log.needs_compaction():
+                self.compact()
+        elif len(loaded) > 0:
+            self._writer.append(self._file_name, "".join(",".join(self._to_fields(entity)) + '\n' for entity in loaded))
+        return loaded, rejected
 
     def add_entity(self, entity):
         super().add_entity(entity)
-        self._save_to_file(entity)
+        if self._log is not None:
+            self._log_change(TextFileLog.ADD, self._to_fields(entity))
+        else:
+            self._save_to_file(entity)
 
     def remove_by_id(self, entity_id):
         entity_removed = super().remove_by_id(entity_id)
-        self._rewrite_file()
+        if self._log is not None:
+            self._log_change(TextFileLog.DELETE, [entity_id])
+        else:
+            self._rewrite_file()
         return entity_removed
 
     def update_entity_by_id(self, entity_id, updated_entity):
         super().update_entity_by_id(entity_id, updated_entity)
-        self._rewrite_file()
+        if self._log is not None:
+            self._log_change(TextFileLog.UPDATE, [entity_id] + self._to_fields(updated_entity))
+        else:
+            self._rewrite_file()
 
 
 class ClientBinaryFileRepository(ClientRepository):
-    def __init__(self, validator_class, file_name):
+    """
+    Clients stored as fixed-width struct records (see StructRecordFile): updates and deletes are done in place.
+    Files written by the older versions, with pickled clients, are converted when they are loaded.
+    """
+    _RECORD_FIELDS = "qs"  # client id, name
+
+    def __init__(self, validator_class, file_name, write_buffer=None):
+        """
+        :param write_buffer: WriteBehindBuffer for the writes, None to write them at once
+        """
         super().__init__(validator_class)
         self._file_name = file_name
+        self._records = StructRecordFile(file_name, self._RECORD_FIELDS, write_buffer)
+        self._slots = {}  # client id -> slot of its record
         self._load_data()
 
+    @staticmethod
+    def _to_record(entity):
+        return int(entity.client_id), entity.name
+
+    @staticmethod
+    def _from_record(values):
+        return Client(str(values[0]), values[1])
+
     def _load_data(self):
-        if os.path.getsize(self._file_name) > 0:
-            with open(self._file_name, "rb") as file_pointer:
-                while True:
-                    try:
-                        entity = pickle.load(file_pointer)
-                        super().add_entity(entity)
-                    except EOFError:
-                        break
+        if not StructRecordFile.is_struct_file(self._file_name):
+            self._load_pickled_data()
+            self._rewrite_file()
+            return
+
+        records = self._records.read_all()
+        entities = [self._from_record(values) for slot, values in records]
+        loaded, rejected = super().bulk_load(entities)
+        if len(rejected) > 0:
+            position, entity, error = rejected[0]
+            raise ClientRepositoryException(self._file_name + ", record " + str(records[position][0]) + ": " + error)
+        self._slots = {entity.client_id: slot for (slot, values), entity in zip(records, entities)}
+
+    @classmethod
+    def iter_file_entities(cls, file_name):
+        """
+        Yields the clients of a binary file one record at a time, without loading them into a repository. Files in
+        the older pickle format are read too.
+        """
+        if StructRecordFile.is_struct_file(file_name):
+            for slot, values in StructRecordFile(file_name, cls._RECORD_FIELDS).iter_records():
+                yield cls._from_record(values)
+            return
+
+        with open(file_name, "rb") as file_pointer:
+            while True:
+                try:
+                    yield pickle.load(file_pointer)
+                except EOFError:
+                    break
+
+    def _load_pickled_data(self):
+        for entity in self.iter_file_entities(self._file_name):
+            super().add_entity(entity)
 
     def _save_to_file(self, entity_to_write):
-        with open(self._file_name, 'ab') as file_pointer:
-            pickle.dump(entity_to_write, file_pointer)
+        try:
+            self._slots[entity_to_write.client_id] = self._records.append(self._to_record(entity_to_write))
+        except StructRecordFileException as srfe:
+            super().remove_by_id(entity_to_write.client_id)
+            raise ClientRepositoryException(srfe)
 
     def _rewrite_file(self):
         try:
             entities = super().get_all_entities
-            with open(self._file_name, "wb") as file_pointer:
-                for entity in entities:
-                    pickle.dump(entity, file_pointer)
         except ClientRepositoryException:
-            open(self._file_name, 'wb').close()  # empty out the file
+            entities = []
+        slots = self._records.rewrite([self._to_record(entity) for entity in entities])
+        self._slots = {entity.client_id: slot for entity, slot in zip(entities, slots)}
+
+    def _storage_error(self, entity):
+        if not self._records.can_store(self._to_record(entity)):
+            return "The ids are too large for the binary file."
+        return None
+
+    def bulk_load(self, entities):
+        loaded, rejected = super().bulk_load(entities)
+        slots = self._records.append_all([self._to_record(entity) for entity in loaded])
+        for entity, slot in zip(loaded, slots):
+            self._slots[entity.client_id] = slot
+        return loaded, rejected
 
     def add_entity(self, entity):
         super().add_entity(entity)
@@ -152,9 +352,122 @@ class ClientBinaryFileRepository(ClientRepository):
 
     def remove_by_id(self, entity_id):
         entity_removed = super().remove_by_id(entity_id)
-        self._rewrite_file()
+        self._records.delete(self._slots.pop(entity_removed.client_id))
+        if self._records.needs_compaction():
+            self._rewrite_file()
         return entity_removed
 
     def update_entity_by_id(self, entity_id, updated_entity):
         super().update_entity_by_id(entity_id, updated_entity)
-        self._rewrite_file()
+        if entity_id not in self._slots:
+            return
+        slot = self._slots.pop(entity_id)
+        self._slots[updated_entity.client_id] = slot
+        try:
+            self._records.write(slot, self._to_record(updated_entity))
+        except StructRecordFileException as srfe:
+            raise ClientRepositoryException(srfe)
+        if self._records.needs_compaction():
+            self._rewrite_file()
+
+
+class ClientSqliteRepository(object):
+    """
+    Clients stored in the "clients" table of a SQLite database, through a SqliteConnectionPool.
+    The returned clients are copies: changes have to go through update_entity_by_id.
+    """
+
+    def __init__(self, validator_class, connection_pool):
+        self.__validator_class = validator_class
+        self.__connection_pool = connection_pool
+        with self.__connection_pool.connection() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS clients (client_id TEXT PRIMARY KEY, name TEXT NOT NULL)")
+
+    @staticmethod
+    def __validate_id(client_id):
+        try:
+            MiscellaneousValidator.is_positive_integer(client_id)
+        except MiscellaneousValidatorException as mve:
+            raise ClientRepositoryException("The client id is not valid:" + " - " + str(mve))
+
+    def find_by_id(self, client_id):
+        self.__validate_id(client_id)
+        with self.__connection_pool.connection() as connection:
+            row = connection.execute("SELECT client_id, name FROM clients WHERE client_id = ?",
+                                     (client_id,)).fetchone()
+        return None if row is None else Client(*row)
+
+    def add_entity(self, client):
+        try:
+            self.__validator_class.validate(client)
+        except ClientValidatorException as cve:
+            raise ClientRepositoryException("The client's attributes are not valid:" + " - " + str(cve))
+
+        try:
+            with self.__connection_pool.connection() as connection:
+                connection.execute("INSERT INTO clients (client_id, name) VALUES (?, ?)",
+                                   (client.client_id, client.name))
+        except sqlite3.IntegrityError:
+            raise ClientRepositoryException("The client already exists.")
+
+    def bulk_load(self, clients):
+        """
+        Adds the clients in a single transaction, skipping (and reporting) the invalid ones and the ones whose id is
+        taken.
+        :return: (list of the added clients, list of (position, client, error message) for the rejected clients)
+        """
+        loaded = []
+        rejected = []
+        with self.__connection_pool.connection() as connection:
+            for position, client in enumerate(clients):
+                try:
+                    self.__validator_class.validate(client)
+                except ClientValidatorException as cve:
+                    rejected.append((position, client, "The client's attributes are not valid:" + " - " + str(cve)))
+                    continue
+
+                try:
+                    connection.execute("INSERT INTO clients (client_id, name) VALUES (?, ?)",
+                                       (client.client_id, client.name))
+                    loaded.append(client)
+                except sqlite3.IntegrityError:
+                    rejected.append((position, client, "The client already exists."))
+        return loaded, rejected
+
+    def remove_by_id(self, client_id):
+        """
+        :return: The removed client
+        """
+        self.__validate_id(client_id)
+        client = self.find_by_id(client_id)
+        if client is None:
+            raise ClientRepositoryException("The given client is not in the list.")
+
+        with self.__connection_pool.connection() as connection:
+            connection.execute("DELETE FROM clients WHERE client_id = ?", (client_id,))
+        return client
+
+    def update_entity_by_id(self, client_id, updated_client):
+        try:
+            self.__validator_class.validate(updated_client)
+        except ClientValidatorException as cve:
+            raise ClientRepositoryException("The client's attributes are not valid:" + " - " + str(cve))
+        self.__validate_id(client_id)
+
+        try:
+            with self.__connection_pool.connection() as connection:
+                connection.execute("UPDATE clients SET client_id = ?, name = ? WHERE client_id = ?",
+                                   (updated_client.client_id, updated_client.name, client_id))
+        except sqlite3.IntegrityError:
+            raise ClientRepositoryException("The client already exists.")
+
+    @property
+    def get_all_entities(self):
+        entities = MyIterator()
+        with self.__connection_pool.connection() as connection:
+            for row in connection.execute("SELECT client_id, name FROM clients ORDER BY rowid"):
+                entities.append(Client(*row))
+        if len(entities) == 0:
+            raise ClientRepositoryException("The list of clients is empty.")
+
+        return entities
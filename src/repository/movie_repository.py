@@ -1,9 +1,14 @@
 import os
 import pickle
+import sqlite3
 
 from domain.entities import Movie
 from src.iterable_data_structure import MyIterator
 from src.domain.validators import MiscellaneousValidator, MiscellaneousValidatorException, MovieValidatorException
+from src.repository.struct_record_file import StructRecordFile, StructRecordFileException
+from src.repository.text_file_log import TextFileLog, TextFileLogException, replace_file
+from src.repository.text_index import TokenIndex
+from src.repository.write_behind_buffer import DirectFileWriter
 
 
 class MovieRepositoryException(Exception):
@@ -11,10 +16,32 @@ class MovieRepositoryException(Exception):
 
 
 class MovieRepository(object):
+    SEARCHABLE_ATTRIBUTES = ("title", "description", "genre")
+
     def __init__(self, validator_class):
         self.__validator_class = validator_class
         # self.__entities = []
         self.__entities = MyIterator()
+        self.__entities_by_id = {}  # movie id -> movie, kept in sync with self.__entities
+        # searchable attribute -> index of the words of the movies in self.__entities_by_id
+        self.__word_indexes = {attribute: TokenIndex() for attribute in self.SEARCHABLE_ATTRIBUTES}
+        self.__movies_by_genre = {}  # genre -> {movie id -> movie}, of the movies in self.__entities_by_id
+
+    def __index_movie(self, movie):
+        for attribute, index in self.__word_indexes.items():
+            index.add(movie.movie_id, movie, getattr(movie, attribute))
+        self.__movies_by_genre.setdefault(movie.genre, {})[movie.movie_id] = movie
+
+    def __unindex_movie(self, movie):
+        for attribute, index in self.__word_indexes.items():
+            index.remove(movie.movie_id, getattr(movie, attribute))
+        self.__remove_from_genre(movie)
+
+    def __remove_from_genre(self, movie):
+        movies = self.__movies_by_genre[movie.genre]
+        del movies[movie.movie_id]
+        if len(movies) == 0:
+            del self.__movies_by_genre[movie.genre]
 
     def find_by_id(self, movie_id):
         try:
@@ -22,19 +49,21 @@ class MovieRepository(object):
         except MiscellaneousValidatorException as mve:
             raise MovieRepositoryException("The movie id is not valid:" + " - " + str(mve))
 
-        for movie in self.__entities:
-            if movie.movie_id == movie_id:
-                return movie
-
-        return None
+        return self.__entities_by_id.get(movie_id)
 
     def add_entity(self, movie):
         try:
             self.__validator_class.validate(movie)
-            self.__entities.append(movie)
         except MovieValidatorException as mve:
             raise MovieRepositoryException("The movie's attributes are not valid.:" + " - " + str(mve))
 
+        if movie.movie_id in self.__entities_by_id:
+            raise MovieRepositoryException("The movie already exists.")
+
+        self.__entities.append(movie)
+        self.__entities_by_id[movie.movie_id] = movie
+        self.__index_movie(movie)
+
     def remove_by_id(self, movie_id):
         """
         :return: The removed movie
@@ -44,11 +73,13 @@ class MovieRepository(object):
         except MiscellaneousValidatorException as mve:
             raise MovieRepositoryException("The movie id is not valid:" + " - " + str(mve))
 
-        if self.find_by_id(movie_id) is None:
+        movie = self.find_by_id(movie_id)
+        if movie is None:
             raise MovieRepositoryException("The movie does not exist.")
 
-        movie = self.find_by_id(movie_id)
         self.__entities.remove(movie)
+        del self.__entities_by_id[movie_id]
+        self.__unindex_movie(movie)
         return movie
 
     def update_entity_by_id(self, movie_id, updated_movie):
@@ -57,15 +88,81 @@ class MovieRepository(object):
         except MovieValidatorException:
             raise MovieRepositoryException("The movie's attributes are not valid.")
 
-        self.find_by_id(movie_id)
+        movie = self.find_by_id(movie_id)
+        if movie is None:
+            return
+
+        new_movie_id = updated_movie.movie_id
+        if new_movie_id != movie_id and new_movie_id in self.__entities_by_id:
+            raise MovieRepositoryException("The movie already exists.")
+
+        for attribute, index in self.__word_indexes.items():
+            index.update(movie_id, new_movie_id, movie, getattr(movie, attribute), getattr(updated_movie, attribute))
+        if new_movie_id != movie_id or updated_movie.genre != movie.genre:
+            self.__remove_from_genre(movie)
+            self.__movies_by_genre.setdefault(updated_movie.genre, {})[new_movie_id] = movie
+        if new_movie_id != movie_id:
+            del self.__entities_by_id[movie_id]
+            self.__entities_by_id[new_movie_id] = movie
+        movie.movie_id = new_movie_id
+        movie.title = updated_movie.title
+        movie.description = updated_movie.description
+        movie.genre = updated_movie.genre
+
+    def bulk_load(self, movies):
+        """
+        Adds the movies in a single pass, skipping (and reporting) the invalid ones and the ones whose id is taken.
+        :return: (list of the added movies, list of (position, movie, error message) for the rejected movies)
+        """
+        loaded = []
+        rejected = []
+        for position, movie in enumerate(movies):
+            try:
+                self.__validator_class.validate(movie)
+            except MovieValidatorException as mve:
+                rejected.append((position, movie, "The movie's attributes are not valid.:" + " - " + str(mve)))
+                continue
+
+            error = "The movie already exists." if movie.movie_id in self.__entities_by_id else \
+                self._storage_error(movie)
+            if error is not None:
+                rejected.append((position, movie, error))
+                continue
+
+            self.__entities_by_id[movie.movie_id] = movie
+            self.__index_movie(movie)
+            loaded.append(movie)
+
+        self.__entities.extend(loaded)
+        return loaded, rejected
+
+    def _storage_error(self, movie):
+        """
+        :return: the reason the movie can not be stored, None if it can
+        """
+        return None
 
-        for movie in self.__entities:
-            if movie.movie_id == movie_id:
-                movie.movie_id = updated_movie.movie_id
-                movie.title = updated_movie.title
-                movie.description = updated_movie.description
-                movie.genre = updated_movie.genre
-                return
+    def find_by_words(self, attribute, text, prefix=False):
+        """
+        Looks the words of the text up in the index of the attribute (one of SEARCHABLE_ATTRIBUTES), case-insensitive.
+        :param prefix: match the words as prefixes of the movies' words, instead of as whole words
+        :return: the movies having every word of the text, None if the text has no words
+        """
+        if attribute not in self.__word_indexes:
+            raise MovieRepositoryException("The movies can not be searched by words of " + str(attribute) + ".")
+        return self.__word_indexes[attribute].find(text, prefix)
+
+    def find_by_genre(self, genre):
+        """
+        :return: list of the movies of exactly the given genre
+        """
+        return list(self.__movies_by_genre.get(genre, {}).values())
+
+    def genre_counts(self):
+        """
+        :return: dictionary genre -> number of movies of the genre
+        """
+        return {genre: len(movies) for genre, movies in self.__movies_by_genre.items()}
 
     @property
     def get_all_entities(self):
@@ -76,87 +173,406 @@ class MovieRepository(object):
 
 
 class MovieTextFileRepository(MovieRepository):
-    def __init__(self, validator_class, file_name):
+    _FIELD_COUNT = 4  # movie id, title, description, genre
+
+    def __init__(self, validator_class, file_name, log_structured=False, compaction_threshold=1000,
+                 write_buffer=None):
+        """
+        :param log_structured: append every change to a "<file_name>.log" log, replayed on load, instead of
+        rewriting the file; the file is rewritten (compacted) once the log has compaction_threshold records
+        :param write_buffer: WriteBehindBuffer for the appended lines, None to write them at once
+        """
         super().__init__(validator_class)
         self._file_name = file_name
+        self._writer = DirectFileWriter() if write_buffer is None else write_buffer
+        self._log = None
+        if log_structured:
+            self._log = TextFileLog(file_name, self._FIELD_COUNT, compaction_threshold, write_buffer)
         self._load_data()
 
-    def _load_data(self):
-        with open(self._file_name) as file_pointer:
+    @staticmethod
+    def _to_fields(entity):
+        return [entity.movie_id, entity.title, entity.description, entity.genre]
+
+    @staticmethod
+    def _from_fields(attributes):
+        return Movie(attributes[0], attributes[1], attributes[2], attributes[3])
+
+    @classmethod
+    def iter_file_entities(cls, file_name):
+        """
+        Yields the movies of a file one line at a time, without loading them into a repository. The changes in the
+        log of a log-structured repository are not included (compact it first).
+        """
+        with open(file_name) as file_pointer:
             for line in file_pointer:
-                attributes = line.strip().split(",")
-                entity = Movie(attributes[0], attributes[1], attributes[2], attributes[3])
-                super().add_entity(entity)
+                yield cls._from_fields(line.strip().split(","))
+
+    def _load_data(self):
+        loaded, rejected = super().bulk_load(self.iter_file_entities(self._file_name))
+        if len(rejected) > 0:
+            position, entity, error = rejected[0]
+            raise MovieRepositoryException(self._file_name + ", line " + str(position + 1) + ": " + error)
+
+        if self._log is not None:
+            self._replay_log()
+
+    def _replay_log(self):
+        """
+        Applies the logged changes over the loaded snapshot (the log only yields the changes made to this
+        snapshot); the changes that do not apply to it are skipped.
+        """
+        try:
+            for operation, attributes in self._log.records():
+                if operation == TextFileLog.ADD:
+                    if super().find_by_id(attributes[0]) is None:
+                        super().add_entity(self._from_fields(attributes))
+                elif operation == TextFileLog.UPDATE:
+                    if super().find_by_id(attributes[0]) is not None:
+                        super().update_entity_by_id(attributes[0], self._from_fields(attributes[1:]))
+                elif operation == TextFileLog.DELETE:
+                    if super().find_by_id(attributes[0]) is not None:
+                        super().remove_by_id(attributes[0])
+        except TextFileLogException as error:
+            raise MovieRepositoryException(str(error))
+
+    def _log_change(self, operation, fields):
+        self._log.append(operation, fields)
+        if self._log.needs_compaction():
+            self.compact()
+
+    def compact(self):
+        """
+        Rewrites the file from memory and empties the log.
+        """
+        if self._log is not None:
+            self._log.compact(self._snapshot_lines())
 
     def _save_to_file(self, entity):
-        with open(self._file_name, 'a') as file_pointer:
-            entity_to_write = entity.movie_id + "," + entity.title + "," + entity.description + "," + \
-                              entity.genre + '\n'
-            file_pointer.write(entity_to_write)
+        entity_to_write = ",".join(self._to_fields(entity)) + '\n'
+        self._writer.append(self._file_name, entity_to_write)
 
-    def _rewrite_file(self):
+    def _snapshot_lines(self):
         try:
             entities = super().get_all_entities
-            with open(self._file_name, "wt") as file_pointer:
-                for entity in entities:
-                    entity_to_write = entity.movie_id + "," + entity.title + "," + entity.description + "," + \
-                                      entity.genre + '\n'
-                    file_pointer.write(entity_to_write)
         except MovieRepositoryException:
-            open(self._file_name, 'wt').close()  # empty out the file
+            return []  # an empty file
+        return [",".join(self._to_fields(entity)) + '\n' for entity in entities]
+
+    def _rewrite_file(self):
+        replace_file(self._file_name, self._snapshot_lines(), self._writer)
+
+    def bulk_load(self, entities):
+        loaded, rejected = super().bulk_load(entities)
+        if self._log is not None:
+            self._log.append_all(TextFileLog.ADD, [self._to_fields(entity) for entity in loaded])
+            if self._log.needs_compaction():
+                self.compact()
+        elif len(loaded) > 0:
+            self._writer.append(self._file_name, "".join(",".join(self._to_fields(entity)) + '\n' for entity in loaded))
+        return loaded, rejected
 
     def add_entity(self, entity):
         super().add_entity(entity)
-        self._save_to_file(entity)
+        if self._log is not None:
+            self._log_change(TextFileLog.ADD, self._to_fields(entity))
+        else:
+            self._save_to_file(entity)
 
     def remove_by_id(self, entity_id):
         entity_removed = super().remove_by_id(entity_id)
-        self._rewrite_file()
+        if self._log is not None:
+            self._log_change(TextFileLog.DELETE, [entity_id])
+        else:
+            self._rewrite_file()
         return entity_removed
 
     def update_entity_by_id(self, entity_id, updated_entity):
         super().update_entity_by_id(entity_id, updated_entity)
-        self._rewrite_file()
+        if self._log is not None:
+            self._log_change(TextFileLog.UPDATE, [entity_id] + self._to_fields(updated_entity))
+        else:
+            self._rewrite_file()
 
 
 class MovieBinaryFileRepository(MovieRepository):
-    def __init__(self, validator_class, file_name):
+    """
+    Movies stored as fixed-width struct records (see StructRecordFile): updates and deletes are done in place.
+    Files written by the older versions, with pickled movies, are converted when they are loaded.
+    With memory_mapped, the files are mapped read-only and the movies are decoded on access (see MappedRecordList),
+    so get_all_entities returns copies; the first change, or query needing the indexes, loads every movie.
+    """
+    _RECORD_FIELDS = "qsss"  # movie id, title, description, genre
+
+    def __init__(self, validator_class, file_name, memory_mapped=False, write_buffer=None):
+        """
+        :param write_buffer: WriteBehindBuffer for the writes, None to write them at once
+        """
         super().__init__(validator_class)
         self._file_name = file_name
-        self._load_data()
+        self._records = StructRecordFile(file_name, self._RECORD_FIELDS, write_buffer)
+        self._slots = {}  # movie id -> slot of its record
+        self._mapped = None
+        if memory_mapped and StructRecordFile.is_struct_file(file_name):
+            self._mapped = self._records.open_mapped(self._from_record)
+        else:
+            self._load_data()
+
+    @staticmethod
+    def _to_record(entity):
+        return int(entity.movie_id), entity.title, entity.description, entity.genre
+
+    @staticmethod
+    def _from_record(values):
+        return Movie(str(values[0]), values[1], values[2], values[3])
 
     def _load_data(self):
-        if os.path.getsize(self._file_name) > 0:
-            with open(self._file_name, "rb") as file_pointer:
-                while True:
-                    try:
-                        entity = pickle.load(file_pointer)
-                        super().add_entity(entity)
-                    except EOFError:
-                        break
+        if not StructRecordFile.is_struct_file(self._file_name):
+            self._load_pickled_data()
+            self._rewrite_file()
+            return
+
+        records = self._records.read_all()
+        entities = [self._from_record(values) for slot, values in records]
+        loaded, rejected = super().bulk_load(entities)
+        if len(rejected) > 0:
+            position, entity, error = rejected[0]
+            raise MovieRepositoryException(self._file_name + ", record " + str(records[position][0]) + ": " + error)
+        self._slots = {entity.movie_id: slot for (slot, values), entity in zip(records, entities)}
+
+    def _materialize(self):
+        """
+        Leaves the memory-mapped mode: the movies are loaded like for a repository that is not mapped. The mapping
+        is not closed, as the sequences handed out by get_all_entities may still be read; it is released with the
+        last of them.
+        """
+        if self._mapped is not None:
+            self._mapped = None
+            self._load_data()
+
+    def find_by_id(self, entity_id):
+        if self._mapped is not None:
+            try:
+                MiscellaneousValidator.is_positive_integer(entity_id)
+            except MiscellaneousValidatorException as mve:
+                raise MovieRepositoryException("The movie id is not valid:" + " - " + str(mve))
+            return self._mapped.find(entity_id)
+        return super().find_by_id(entity_id)
+
+    def find_by_words(self, attribute, text, prefix=False):
+        self._materialize()
+        return super().find_by_words(attribute, text, prefix)
+
+    def find_by_genre(self, genre):
+        self._materialize()
+        return super().find_by_genre(genre)
+
+    def genre_counts(self):
+        self._materialize()
+        return super().genre_counts()
+
+    @property
+    def get_all_entities(self):
+        if self._mapped is not None:
+            if len(self._mapped) == 0:
+                raise MovieRepositoryException("The list of movies is empty.")
+            return self._mapped
+        return super().get_all_entities
+
+    @classmethod
+    def iter_file_entities(cls, file_name):
+        """
+        Yields the movies of a binary file one record at a time, without loading them into a repository. Files in
+        the older pickle format are read too.
+        """
+        if StructRecordFile.is_struct_file(file_name):
+            for slot, values in StructRecordFile(file_name, cls._RECORD_FIELDS).iter_records():
+                yield cls._from_record(values)
+            return
+
+        with open(file_name, "rb") as file_pointer:
+            while True:
+                try:
+                    yield pickle.load(file_pointer)
+                except EOFError:
+                    break
+
+    def _load_pickled_data(self):
+        for entity in self.iter_file_entities(self._file_name):
+            super().add_entity(entity)
 
     def _save_to_file(self, entity_to_write):
-        with open(self._file_name, 'ab') as file_pointer:
-            pickle.dump(entity_to_write, file_pointer)
+        try:
+            self._slots[entity_to_write.movie_id] = self._records.append(self._to_record(entity_to_write))
+        except StructRecordFileException as srfe:
+            super().remove_by_id(entity_to_write.movie_id)
+            raise MovieRepositoryException(srfe)
 
     def _rewrite_file(self):
         try:
             entities = super().get_all_entities
-            with open(self._file_name, "wb") as file_pointer:
-                for entity in entities:
-                    pickle.dump(entity, file_pointer)
         except MovieRepositoryException:
-            open(self._file_name, 'wb').close()  # empty out the file
+            entities = []
+        slots = self._records.rewrite([self._to_record(entity) for entity in entities])
+        self._slots = {entity.movie_id: slot for entity, slot in zip(entities, slots)}
+
+    def _storage_error(self, entity):
+        if not self._records.can_store(self._to_record(entity)):
+            return "The ids are too large for the binary file."
+        return None
+
+    def bulk_load(self, entities):
+        self._materialize()
+        loaded, rejected = super().bulk_load(entities)
+        slots = self._records.append_all([self._to_record(entity) for entity in loaded])
+        for entity, slot in zip(loaded, slots):
+            self._slots[entity.movie_id] = slot
+        return loaded, rejected
 
     def add_entity(self, entity):
+        self._materialize()
         super().add_entity(entity)
         self._save_to_file(entity)
 
     def remove_by_id(self, entity_id):
+        self._materialize()
         entity_removed = super().remove_by_id(entity_id)
-        self._rewrite_file()
+        self._records.delete(self._slots.pop(entity_removed.movie_id))
+        if self._records.needs_compaction():
+            self._rewrite_file()
         return entity_removed
 
     def update_entity_by_id(self, entity_id, updated_entity):
+        self._materialize()
         super().update_entity_by_id(entity_id, updated_entity)
-        self._rewrite_file()
+        if entity_id not in self._slots:
+            return
+        slot = self._slots.pop(entity_id)
+        self._slots[updated_entity.movie_id] = slot
+        try:
+            self._records.write(slot, self._to_record(updated_entity))
+        except StructRecordFileException as srfe:
+            raise MovieRepositoryException(srfe)
+        if self._records.needs_compaction():
+            self._rewrite_file()
+
+
+class MovieSqliteRepository(object):
+    """
+    Movies stored in the "movies" table of a SQLite database, through a SqliteConnectionPool.
+    The returned movies are copies: changes have to go through update_entity_by_id.
+    """
+    __COLUMNS = "movie_id, title, description, genre"
+
+    def __init__(self, validator_class, connection_pool):
+        self.__validator_class = validator_class
+        self.__connection_pool = connection_pool
+        with self.__connection_pool.connection() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS movies (movie_id TEXT PRIMARY KEY, title TEXT NOT NULL, "
+                               "description TEXT NOT NULL, genre TEXT NOT NULL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS movies_by_genre ON movies (genre)")
+
+    @staticmethod
+    def __validate_id(movie_id):
+        try:
+            MiscellaneousValidator.is_positive_integer(movie_id)
+        except MiscellaneousValidatorException as mve:
+            raise MovieRepositoryException("The movie id is not valid:" + " - " + str(mve))
+
+    def find_by_id(self, movie_id):
+        self.__validate_id(movie_id)
+        with self.__connection_pool.connection() as connection:
+            row = connection.execute("SELECT " + self.__COLUMNS + " FROM movies WHERE movie_id = ?",
+                                     (movie_id,)).fetchone()
+        return None if row is None else Movie(*row)
+
+    def add_entity(self, movie):
+        try:
+            self.__validator_class.validate(movie)
+        except MovieValidatorException as mve:
+            raise MovieRepositoryException("The movie's attributes are not valid.:" + " - " + str(mve))
+
+        try:
+            with self.__connection_pool.connection() as connection:
+                connection.execute("INSERT INTO movies (" + self.__COLUMNS + ") VALUES (?, ?, ?, ?)",
+                                   (movie.movie_id, movie.title, movie.description, movie.genre))
+        except sqlite3.IntegrityError:
+            raise MovieRepositoryException("The movie already exists.")
+
+    def bulk_load(self, movies):
+        """
+        Adds the movies in a single transaction, skipping (and reporting) the invalid ones and the ones whose id is
+        taken.
+        :return: (list of the added movies, list of (position, movie, error message) for the rejected movies)
+        """
+        loaded = []
+        rejected = []
+        with self.__connection_pool.connection() as connection:
+            for position, movie in enumerate(movies):
+                try:
+                    self.__validator_class.validate(movie)
+                except MovieValidatorException as mve:
+                    rejected.append((position, movie, "The movie's attributes are not valid.:" + " - " + str(mve)))
+                    continue
+
+                try:
+                    connection.execute("INSERT INTO movies (" + self.__COLUMNS + ") VALUES (?, ?, ?, ?)",
+                                       (movie.movie_id, movie.title, movie.description, movie.genre))
+                    loaded.append(movie)
+                except sqlite3.IntegrityError:
+                    rejected.append((position, movie, "The movie already exists."))
+        return loaded, rejected
+
+    def remove_by_id(self, movie_id):
+        """
+        :return: The removed movie
+        """
+        self.__validate_id(movie_id)
+        movie = self.find_by_id(movie_id)
+        if movie is None:
+            raise MovieRepositoryException("The movie does not exist.")
+
+        with self.__connection_pool.connection() as connection:
+            connection.execute("DELETE FROM movies WHERE movie_id = ?", (movie_id,))
+        return movie
+
+    def update_entity_by_id(self, movie_id, updated_movie):
+        try:
+            self.__validator_class.validate(updated_movie)
+        except MovieValidatorException:
+            raise MovieRepositoryException("The movie's attributes are not valid.")
+        self.__validate_id(movie_id)
+
+        try:
+            with self.__connection_pool.connection() as connection:
+                connection.execute("UPDATE movies SET movie_id = ?, title = ?, description = ?, genre = ? "
+                                   "WHERE movie_id = ?", (updated_movie.movie_id, updated_movie.title,
+                                                          updated_movie.description, updated_movie.genre, movie_id))
+        except sqlite3.IntegrityError:
+            raise MovieRepositoryException("The movie already exists.")
+
+    def find_by_genre(self, genre):
+        """
+        :return: list of the movies of exactly the given genre
+        """
+        with self.__connection_pool.connection() as connection:
+            return [Movie(*row) for row in connection.execute("SELECT " + self.__COLUMNS + " FROM movies "
+                                                              "WHERE genre = ? ORDER BY rowid", (genre,))]
+
+    def genre_counts(self):
+        """
+        :return: dictionary genre -> number of movies of the genre
+        """
+        with self.__connection_pool.connection() as connection:
+            return dict(connection.execute("SELECT genre, COUNT(*) FROM movies GROUP BY genre"))
+
+    @property
+    def get_all_entities(self):
+        entities = MyIterator()
+        with self.__connection_pool.connection() as connection:
+            for row in connection.execute("SELECT " + self.__COLUMNS + " FROM movies ORDER BY rowid"):
+                entities.append(Movie(*row))
+        if len(entities) == 0:
+            raise MovieRepositoryException("The list of movies is empty.")
+
+        return entities
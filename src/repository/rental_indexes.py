@@ -0,0 +1,127 @@
+import datetime
+from bisect import bisect_left, insort
+
+
+class OpenRentalsByDueDate:
+    """
+    Index of the rentals that are not returned yet, sorted by due date: (due ordinal, sequence, rental id) keys kept
+    sorted with bisect, for all the open rentals and per client, so the overdue rentals are found in O(log n +
+    results). The rentals due on the same day are in the order of their sequence numbers.
+    """
+
+    def __init__(self):
+        self.__keys = []  # sorted (due ordinal, sequence, rental id) keys of the open rentals
+        self.__keys_by_client_id = {}  # client id -> sorted (due ordinal, sequence, rental id) keys of its open rentals
+        self.__rentals = {}  # rental id -> (rental, client id, key), for the indexed rentals
+
+    def __len__(self):
+        return len(self.__keys)
+
+    @staticmethod
+    def __remove_key(keys, key):
+        del keys[bisect_left(keys, key)]
+
+    def add(self, rental, sequence):
+        """
+        Indexes the rental, if it is not returned.
+        :param sequence: number giving the order of the rental among the ones due on the same day (e.g. the order it
+        was added in)
+        """
+        if rental.returned_date != "N.A.":
+            return
+
+        key = (rental.due_ordinal, sequence, rental.rental_id)
+        insort(self.__keys, key)
+        insort(self.__keys_by_client_id.setdefault(rental.client_id, []), key)
+        self.__rentals[rental.rental_id] = (rental, rental.client_id, key)
+
+    def remove(self, rental_id):
+        """
+        Removes the rental with the given id, if it is indexed (the rental may have been changed since it was added).
+        """
+        indexed = self.__rentals.pop(rental_id, None)
+        if indexed is None:
+            return
+
+        rental, client_id, key = indexed
+        self.__remove_key(self.__keys, key)
+        client_keys = self.__keys_by_client_id[client_id]
+        self.__remove_key(client_keys, key)
+        if len(client_keys) == 0:
+            del self.__keys_by_client_id[client_id]
+
+    def find_due_before(self, ordinal, client_id=None):
+        """
+        :param client_id: only the rentals of this client, None for every client
+        :return: list of the open rentals due before the ordinal, by due date
+        """
+        keys = self.__keys if client_id is None else self.__keys_by_client_id.get(client_id, [])
+        end = bisect_left(keys, (ordinal,))
+        return [self.__rentals[rental_id][0] for due_ordinal, sequence, rental_id in keys[:end]]
+
+
+class RentalIntervals:
+    """
+    Per-movie index of the periods the movies are rented for: [rented ordinal, returned ordinal), open ended while the
+    rental is not returned. The intervals of a movie are kept sorted by start, next to the running maximum of their
+    ends, so whether a period overlaps one of them is found by bisection, in O(log k) for the k rentals of the movie.
+    """
+    OPEN = datetime.date.max.toordinal() + 1  # end of the intervals of the rentals that are not returned
+
+    def __init__(self):
+        self.__intervals_by_movie_id = {}  # movie id -> sorted (start, end, rental id) intervals
+        self.__max_ends_by_movie_id = {}  # movie id -> maximum end of the intervals up to each position
+        self.__intervals = {}  # rental id -> (movie id, interval), for the indexed rentals
+
+    def __update_max_ends(self, movie_id, position):
+        """
+        Recomputes the running maximum of the ends of the movie's intervals, from the given position on.
+        """
+        intervals = self.__intervals_by_movie_id[movie_id]
+        max_ends = self.__max_ends_by_movie_id[movie_id]
+        del max_ends[position:]
+        max_end = max_ends[-1] if len(max_ends) > 0 else 0
+        for start, end, rental_id in intervals[position:]:
+            max_end = max(max_end, end)
+            max_ends.append(max_end)
+
+    def add(self, rental):
+        end = self.OPEN if rental.returned_date == "N.A." else rental.returned_ordinal
+        interval = (rental.rented_ordinal, end, rental.rental_id)
+        intervals = self.__intervals_by_movie_id.setdefault(rental.movie_id, [])
+        self.__max_ends_by_movie_id.setdefault(rental.movie_id, [])
+        position = bisect_left(intervals, interval)
+        intervals.insert(position, interval)
+        self.__update_max_ends(rental.movie_id, position)
+        self.__intervals[rental.rental_id] = (rental.movie_id, interval)
+
+    def remove(self, rental_id):
+        """
+        Removes the rental with the given id, if it is indexed (the rental may have been changed since it was added).
+        """
+        indexed = self.__intervals.pop(rental_id, None)
+        if indexed is None:
+            return
+
+        movie_id, interval = indexed
+        intervals = self.__intervals_by_movie_id[movie_id]
+        position = bisect_left(intervals, interval)
+        del intervals[position]
+        if len(intervals) == 0:
+            del self.__intervals_by_movie_id[movie_id]
+            del self.__max_ends_by_movie_id[movie_id]
+        else:
+            self.__update_max_ends(movie_id, position)
+
+    def is_free(self, movie_id, start_ordinal, end_ordinal=None):
+        """
+        :param end_ordinal: end of the period (excluded), None for a period that is open ended
+        :return: True if no rental of the movie overlaps the period [start_ordinal, end_ordinal)
+        """
+        intervals = self.__intervals_by_movie_id.get(movie_id)
+        if intervals is None:
+            return True
+
+        end_ordinal = self.OPEN if end_ordinal is None else end_ordinal
+        count = bisect_left(intervals, (end_ordinal,))  # the intervals that start before the end of the period
+        return count == 0 or self.__max_ends_by_movie_id[movie_id][count - 1] <= start_ordinal
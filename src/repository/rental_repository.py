@@ -1,9 +1,16 @@
 import os
 import pickle
+import sqlite3
+from array import array
 
-from domain.entities import Rental
+from domain.entities import Rental, ordinal_to_date
 from src.iterable_data_structure import MyIterator
+from src.repository.rental_indexes import OpenRentalsByDueDate, RentalIntervals
+from src.repository.rental_statistics import RentalDaysStatistics
 from src.domain.validators import MiscellaneousValidator, MiscellaneousValidatorException, RentalValidatorException
+from src.repository.struct_record_file import StructRecordFile, StructRecordFileException
+from src.repository.text_file_log import TextFileLog, TextFileLogException, replace_file
+from src.repository.write_behind_buffer import DirectFileWriter
 
 
 class RentalRepositoryException(Exception):
@@ -15,6 +22,14 @@ class RentalRepository(object):
         self.__validator_class = validator_class
         # self.__entities = []
         self.__entities = MyIterator()
+        self.__entities_by_id = {}  # rental id -> rental, kept in sync with self.__entities
+        self.__rentals_by_client_id = {}  # client id -> {rental id -> rental}
+        self.__rentals_by_movie_id = {}  # movie id -> {rental id -> rental}
+        self.__days_rented = RentalDaysStatistics()
+        self.__open_rentals = OpenRentalsByDueDate()
+        self.__rental_intervals = RentalIntervals()
+        self.__sequences = {}  # rental id -> insertion number of the indexed rental, kept by the updates
+        self.__next_sequence = 0
 
     def find_by_id(self, rental_id):
         try:
@@ -22,19 +37,113 @@ class RentalRepository(object):
         except MiscellaneousValidatorException as mve:
             raise RentalRepositoryException("The rental id is not valid:" + " - " + str(mve))
 
-        for rental in self.__entities:
-            if rental.rental_id == rental_id:
-                return rental
+        return self.__entities_by_id.get(rental_id)
 
-        return None
+    def find_by_client_id(self, client_id):
+        """
+        :return: list of the rentals of the given client
+        """
+        return list(self.__rentals_by_client_id.get(client_id, {}).values())
+
+    def find_by_movie_id(self, movie_id):
+        """
+        :return: list of the rentals of the given movie
+        """
+        return list(self.__rentals_by_movie_id.get(movie_id, {}).values())
+
+    def days_rented_by_movie_id(self, movie_id, today_ordinal):
+        """
+        :return: the total number of days the movie was rented for, counting the open rentals up to today_ordinal
+        """
+        return self.__days_rented.days_rented_by_movie_id(movie_id, today_ordinal)
+
+    def days_rented_by_client_id(self, client_id, today_ordinal):
+        """
+        :return: the total number of days the client rented for, counting the open rentals up to today_ordinal
+        """
+        return self.__days_rented.days_rented_by_client_id(client_id, today_ordinal)
+
+    def days_rented_per_movie(self, today_ordinal):
+        """
+        :return: dictionary movie id -> total number of days rented, for the movies that have rentals
+        """
+        return self.__days_rented.days_rented_per_movie(today_ordinal)
+
+    def days_rented_per_client(self, today_ordinal):
+        """
+        :return: dictionary client id -> total number of days rented, for the clients that have rentals
+        """
+        return self.__days_rented.days_rented_per_client(today_ordinal)
+
+    def find_overdue(self, today_ordinal, client_id=None):
+        """
+        :param client_id: only the rentals of this client, None for every client
+        :return: list of the rentals that are not returned and passed their due date before today_ordinal, by due date
+        """
+        return self.__open_rentals.find_due_before(today_ordinal, client_id)
+
+    def is_movie_available(self, movie_id, start_ordinal, end_ordinal=None):
+        """
+        :param end_ordinal: end of the period (excluded), None for a period that is open ended
+        :return: True if the movie is not rented in the period [start_ordinal, end_ordinal); a rental occupies its
+        movie from its rented date until its returned date (excluded), or indefinitely if it is not returned
+        """
+        return self.__rental_intervals.is_free(movie_id, start_ordinal, end_ordinal)
+
+    @staticmethod
+    def __add_to_multi_index(index, key, rental_id, rental):
+        index.setdefault(key, {})[rental_id] = rental
+
+    @staticmethod
+    def __remove_from_multi_index(index, key, rental_id):
+        rentals = index.get(key)
+        if rentals is None:
+            return
+
+        rentals.pop(rental_id, None)
+        if len(rentals) == 0:
+            del index[key]
+
+    def __index_rental(self, rental, sequence=None):
+        """
+        :param sequence: insertion number of the rental, None for a new rental (the rentals are numbered in the order
+        they are added, so the ties of the ordered indexes follow the order of the rentals in the repository)
+        """
+        if sequence is None:
+            sequence = self.__next_sequence
+            self.__next_sequence = self.__next_sequence + 1
+        self.__sequences[rental.rental_id] = sequence
+        self.__add_to_multi_index(self.__rentals_by_client_id, rental.client_id, rental.rental_id, rental)
+        self.__add_to_multi_index(self.__rentals_by_movie_id, rental.movie_id, rental.rental_id, rental)
+        self.__days_rented.add(rental)
+        self.__open_rentals.add(rental, sequence)
+        self.__rental_intervals.add(rental)
+
+    def __unindex_rental(self, rental_id, client_id, movie_id):
+        """
+        :return: the insertion number of the rental
+        """
+        del self.__entities_by_id[rental_id]
+        self.__remove_from_multi_index(self.__rentals_by_client_id, client_id, rental_id)
+        self.__remove_from_multi_index(self.__rentals_by_movie_id, movie_id, rental_id)
+        self.__days_rented.remove(rental_id)
+        self.__open_rentals.remove(rental_id)
+        self.__rental_intervals.remove(rental_id)
+        return self.__sequences.pop(rental_id)
 
     def add_entity(self, rental):
         try:
             self.__validator_class.validate(rental)
-            self.__entities.append(rental)
         except RentalValidatorException as rve:
             raise RentalRepositoryException("The rental's attributes are not valid.:" + " - " + str(rve))
 
+        if rental.rental_id in self.__entities_by_id:
+            raise RentalRepositoryException("Can not add rental because the rental id already exists!")
+
+        self.__entities.append(rental)
+        self.__entities_by_id[rental.rental_id] = rental
+        self.__index_rental(rental)
+
     def remove_by_id(self, rental_id):
         """
         :return: the removed rental
@@ -49,47 +158,89 @@ class RentalRepository(object):
             raise RentalRepositoryException("The id of the rental does not exist.")
 
         self.__entities.remove(rental)
+        self.__unindex_rental(rental_id, rental.client_id, rental.movie_id)
         return rental
 
     def remove_by_client_id(self, client_id):
         """
         :return: the removed rentals
         """
-        removed_rentals = []
-        for rental in self.__entities:
-            if rental.client_id == client_id:
-                removed_rentals.append(self.remove_by_id(rental.rental_id))
-
+        removed_rentals = self.find_by_client_id(client_id)
+        self.__remove_rentals(removed_rentals)
         return removed_rentals
 
     def remove_by_movie_id(self, movie_id):
         """
         :return: the removed rentals
         """
-        removed_rentals = []
-        for rental in self.__entities:
-            if rental.movie_id == movie_id:
-                removed_rentals.append(self.remove_by_id(rental.rental_id))
-
+        removed_rentals = self.find_by_movie_id(movie_id)
+        self.__remove_rentals(removed_rentals)
         return removed_rentals
 
+    def __remove_rentals(self, rentals):
+        for rental in rentals:
+            self.__unindex_rental(rental.rental_id, rental.client_id, rental.movie_id)
+        if len(rentals) > 0:
+            self.__entities.remove_all(rentals)
+
     def update_entity_by_id(self, rental_id, updated_rental):
         try:
             self.__validator_class.validate(updated_rental)
         except RentalValidatorException:
             raise RentalRepositoryException("The rental's attributes are not valid.")
 
-        self.find_by_id(rental_id)  # throws a custom exception in case the rental id is not found
+        rental = self.find_by_id(rental_id)  # throws a custom exception in case the rental id is not valid
+        if rental is None:
+            return
+
+        new_rental_id = updated_rental.rental_id
+        if new_rental_id != rental_id and new_rental_id in self.__entities_by_id:
+            raise RentalRepositoryException("The rental id already exists.")
 
-        for rental in self.__entities:
-            if rental.rental_id == rental_id:
-                rental.rental_id = updated_rental.rental_id
-                rental.movie_id = updated_rental.movie_id
-                rental.client_id = updated_rental.client_id
-                rental.rented_date = updated_rental.rented_date
-                rental.due_date = updated_rental.due_date
-                rental.returned_date = updated_rental.returned_date
-                return
+        new_movie_id = updated_rental.movie_id
+        new_client_id = updated_rental.client_id
+        sequence = self.__unindex_rental(rental_id, rental.client_id, rental.movie_id)
+        rental.rental_id = new_rental_id
+        rental.movie_id = new_movie_id
+        rental.client_id = new_client_id
+        rental.rented_date = updated_rental.rented_date
+        rental.due_date = updated_rental.due_date
+        rental.returned_date = updated_rental.returned_date
+        self.__entities_by_id[new_rental_id] = rental
+        self.__index_rental(rental, sequence)
+
+    def bulk_load(self, rentals):
+        """
+        Adds the rentals in a single pass, skipping (and reporting) the invalid ones and the ones whose id is taken.
+        :return: (list of the added rentals, list of (position, rental, error message) for the rejected rentals)
+        """
+        loaded = []
+        rejected = []
+        for position, rental in enumerate(rentals):
+            try:
+                self.__validator_class.validate(rental)
+            except RentalValidatorException as rve:
+                rejected.append((position, rental, "The rental's attributes are not valid.:" + " - " + str(rve)))
+                continue
+
+            error = "Can not add rental because the rental id already exists!" \
+                if rental.rental_id in self.__entities_by_id else self._storage_error(rental)
+            if error is not None:
+                rejected.append((position, rental, error))
+                continue
+
+            self.__entities_by_id[rental.rental_id] = rental
+            self.__index_rental(rental)
+            loaded.append(rental)
+
+        self.__entities.extend(loaded)
+        return loaded, rejected
+
+    def _storage_error(self, rental):
+        """
+        :return: the reason the rental can not be stored, None if it can
+        """
+        return None
 
     @property
     def get_all_entities(self):
@@ -100,108 +251,890 @@ class RentalRepository(object):
 
 
 class RentalTextFileRepository(RentalRepository):
-    def __init__(self, validator_class, file_name):
+    _FIELD_COUNT = 6  # rental id, movie id, client id, rented, due and returned dates
+
+    def __init__(self, validator_class, file_name, log_structured=False, compaction_threshold=1000,
+                 write_buffer=None):
+        """
+        :param log_structured: append every change to a "<file_name>.log" log, replayed on load, instead of
+        rewriting the file; the file is rewritten (compacted) once the log has compaction_threshold records
+        :param write_buffer: WriteBehindBuffer for the appended lines, None to write them at once
+        """
         super().__init__(validator_class)
         self._file_name = file_name
+        self._writer = DirectFileWriter() if write_buffer is None else write_buffer
+        self._log = None
+        if log_structured:
+            self._log = TextFileLog(file_name, self._FIELD_COUNT, compaction_threshold, write_buffer)
         self._load_data()
 
-    def _load_data(self):
-        with open(self._file_name) as file_pointer:
+    @staticmethod
+    def _to_fields(entity):
+        return [entity.rental_id, entity.movie_id, entity.client_id, entity.rented_date, entity.due_date,
+                entity.returned_date]
+
+    @staticmethod
+    def _from_fields(attributes):
+        return Rental(attributes[0], attributes[1], attributes[2], attributes[3], attributes[4], attributes[5])
+
+    @classmethod
+    def iter_file_entities(cls, file_name):
+        """
+        Yields the rentals of a file one line at a time, without loading them into a repository. The changes in the
+        log of a log-structured repository are not included (compact it first).
+        """
+        with open(file_name) as file_pointer:
             for line in file_pointer:
-                attributes = line.strip().split(",")
-                entity = Rental(attributes[0], attributes[1], attributes[2], attributes[3], attributes[4],
-                                attributes[5])
-                super().add_entity(entity)
+                yield cls._from_fields(line.strip().split(","))
+
+    def _load_data(self):
+        loaded, rejected = super().bulk_load(self.iter_file_entities(self._file_name))
+        if len(rejected) > 0:
+            position, entity, error = rejected[0]
+            raise RentalRepositoryException(self._file_name + ", line " + str(position + 1) + ": " + error)
+
+        if self._log is not None:
+            self._replay_log()
+
+    def _replay_log(self):
+        """
+        Applies the logged changes over the loaded snapshot (the log only yields the changes made to this
+        snapshot); the changes that do not apply to it are skipped.
+        """
+        try:
+            for operation, attributes in self._log.records():
+                if operation == TextFileLog.ADD:
+                    if super().find_by_id(attributes[0]) is None:
+                        super().add_entity(self._from_fields(attributes))
+                elif operation == TextFileLog.UPDATE:
+                    if super().find_by_id(attributes[0]) is not None:
+                        super().update_entity_by_id(attributes[0], self._from_fields(attributes[1:]))
+                elif operation == TextFileLog.DELETE:
+                    if super().find_by_id(attributes[0]) is not None:
+                        super().remove_by_id(attributes[0])
+        except TextFileLogException as error:
+            raise RentalRepositoryException(str(error))
+
+    def _log_change(self, operation, fields):
+        self._log.append(operation, fields)
+        if self._log.needs_compaction():
+            self.compact()
+
+    def compact(self):
+        """
+        Rewrites the file from memory and empties the log.
+        """
+        if self._log is not None:
+            self._log.compact(self._snapshot_lines())
 
     def _save_to_file(self, entity):
-        with open(self._file_name, 'a') as file_pointer:
-            entity_to_write = entity.rental_id + "," + entity.movie_id + "," + entity.client_id + "," + \
-                              entity.rented_date + "," + entity.due_date + "," + entity.returned_date + '\n'
-            file_pointer.write(entity_to_write)
+        entity_to_write = ",".join(self._to_fields(entity)) + '\n'
+        self._writer.append(self._file_name, entity_to_write)
 
-    def _rewrite_file(self):
+    def _snapshot_lines(self):
         try:
             entities = super().get_all_entities
-            with open(self._file_name, "wt") as file_pointer:
-                for entity in entities:
-                    entity_to_write = entity.rental_id + "," + entity.movie_id + "," + entity.client_id + "," + \
-                                      entity.rented_date + "," + entity.due_date + "," + entity.returned_date + '\n'
-                    file_pointer.write(entity_to_write)
         except RentalRepositoryException:
-            open(self._file_name, 'wt').close()  # empty out the file
+            return []  # an empty file
+        return [",".join(self._to_fields(entity)) + '\n' for entity in entities]
+
+    def _rewrite_file(self):
+        replace_file(self._file_name, self._snapshot_lines(), self._writer)
+
+    def bulk_load(self, entities):
+        loaded, rejected = super().bulk_load(entities)
+        if self._log is not None:
+            self._log.append_all(TextFileLog.ADD, [self._to_fields(entity) for entity in loaded])
+            if self._log.needs_compaction():
+                self.compact()
+        elif len(loaded) > 0:
+            self._writer.append(self._file_name, "".join(",".join(self._to_fields(entity)) + '\n' for entity in loaded))
+        return loaded, rejected
 
     def add_entity(self, entity):
         super().add_entity(entity)
-        self._save_to_file(entity)
+        if self._log is not None:
+            self._log_change(TextFileLog.ADD, self._to_fields(entity))
+        else:
+            self._save_to_file(entity)
 
     def remove_by_id(self, entity_id):
         entity_removed = super().remove_by_id(entity_id)
-        self._rewrite_file()
+        if self._log is not None:
+            self._log_change(TextFileLog.DELETE, [entity_id])
+        else:
+            self._rewrite_file()
         return entity_removed
 
     def remove_by_client_id(self, client_id):
         entities_removed = super().remove_by_client_id(client_id)
-        self._rewrite_file()
+        if self._log is not None:
+            for entity in entities_removed:
+                self._log_change(TextFileLog.DELETE, [entity.rental_id])
+        else:
+            self._rewrite_file()
         return entities_removed
 
     def remove_by_movie_id(self, movie_id):
         entities_removed = super().remove_by_movie_id(movie_id)
-        self._rewrite_file()
+        if self._log is not None:
+            for entity in entities_removed:
+                self._log_change(TextFileLog.DELETE, [entity.rental_id])
+        else:
+            self._rewrite_file()
         return entities_removed
 
     def update_entity_by_id(self, entity_id, updated_entity):
         super().update_entity_by_id(entity_id, updated_entity)
-        self._rewrite_file()
+        if self._log is not None:
+            self._log_change(TextFileLog.UPDATE, [entity_id] + self._to_fields(updated_entity))
+        else:
+            self._rewrite_file()
 
 
 class RentalBinaryFileRepository(RentalRepository):
-    def __init__(self, validator_class, file_name):
+    """
+    Rentals stored as fixed-width struct records (see StructRecordFile): updates and deletes are done in place.
+    The dates are stored as ordinals; a date string is only kept in the heap when it is not in the dd.mm.yyyy form.
+    Files written by the older versions, with pickled rentals, are converted when they are loaded.
+    With memory_mapped, the files are mapped read-only and the rentals are decoded on access (see MappedRecordList),
+    so get_all_entities returns copies; the first change, or query needing the indexes, loads every rental.
+    """
+    # rental id, movie id, client id, rented, due and returned ordinals (0 for "N.A."), non-canonical date strings
+    _RECORD_FIELDS = "qqqiiis"
+
+    def __init__(self, validator_class, file_name, memory_mapped=False, write_buffer=None):
+        """
+        :param write_buffer: WriteBehindBuffer for the writes, None to write them at once
+        """
         super().__init__(validator_class)
         self._file_name = file_name
-        self._load_data()
+        self._records = StructRecordFile(file_name, self._RECORD_FIELDS, write_buffer)
+        self._slots = {}  # rental id -> slot of its record
+        self._mapped = None
+        if memory_mapped and StructRecordFile.is_struct_file(file_name):
+            self._mapped = self._records.open_mapped(self._from_record)
+        else:
+            self._load_data()
+
+    @staticmethod
+    def _date_text(text, ordinal):
+        """
+        :return: "" if the text is what ordinal_to_date renders, the text itself otherwise
+        """
+        if ordinal is None or ordinal_to_date(ordinal) == text:
+            return ""
+        return text
+
+    @staticmethod
+    def _to_record(entity):
+        texts = [RentalBinaryFileRepository._date_text(entity.rented_date, entity.rented_ordinal),
+                 RentalBinaryFileRepository._date_text(entity.due_date, entity.due_ordinal),
+                 RentalBinaryFileRepository._date_text(entity.returned_date, entity.returned_ordinal)]
+        return int(entity.rental_id), int(entity.movie_id), int(entity.client_id), entity.rented_ordinal, \
+            entity.due_ordinal, entity.returned_ordinal or 0, ",".join(texts) if any(texts) else None
+
+    @staticmethod
+    def _from_record(values):
+        rental_id, movie_id, client_id, rented_ordinal, due_ordinal, returned_ordinal, texts = values
+        dates = [ordinal_to_date(rented_ordinal), ordinal_to_date(due_ordinal),
+                 "N.A." if returned_ordinal == 0 else ordinal_to_date(returned_ordinal)]
+        if texts is not None:
+            dates = [text or date for text, date in zip(texts.split(","), dates)]
+        return Rental(str(rental_id), str(movie_id), str(client_id), dates[0], dates[1], dates[2])
 
     def _load_data(self):
-        if os.path.getsize(self._file_name) > 0:
-            with open(self._file_name, "rb") as file_pointer:
-                while True:
-                    try:
-                        entity = pickle.load(file_pointer)
-                        super().add_entity(entity)
-                    except EOFError:
-                        break
+        if not StructRecordFile.is_struct_file(self._file_name):
+            self._load_pickled_data()
+            self._rewrite_file()
+            return
+
+        records = self._records.read_all()
+        entities = [self._from_record(values) for slot, values in records]
+        loaded, rejected = super().bulk_load(entities)
+        if len(rejected) > 0:
+            position, entity, error = rejected[0]
+            raise RentalRepositoryException(self._file_name + ", record " + str(records[position][0]) + ": " + error)
+        self._slots = {entity.rental_id: slot for (slot, values), entity in zip(records, entities)}
+
+    def _materialize(self):
+        """
+        Leaves the memory-mapped mode: the rentals are loaded like for a repository that is not mapped. The mapping
+        is not closed, as the sequences handed out by get_all_entities may still be read; it is released with the
+        last of them.
+        """
+        if self._mapped is not None:
+            self._mapped = None
+            self._load_data()
+
+    def find_by_id(self, entity_id):
+        if self._mapped is not None:
+            try:
+                MiscellaneousValidator.is_positive_integer(entity_id)
+            except MiscellaneousValidatorException as mve:
+                raise RentalRepositoryException("The rental id is not valid:" + " - " + str(mve))
+            return self._mapped.find(entity_id)
+        return super().find_by_id(entity_id)
+
+    @property
+    def get_all_entities(self):
+        if self._mapped is not None:
+            if len(self._mapped) == 0:
+                raise RentalRepositoryException("The list of rentals is empty.")
+            return self._mapped
+        return super().get_all_entities
+
+    def find_by_client_id(self, client_id):
+        self._materialize()
+        return super().find_by_client_id(client_id)
+
+    def find_by_movie_id(self, movie_id):
+        self._materialize()
+        return super().find_by_movie_id(movie_id)
+
+    def days_rented_by_movie_id(self, movie_id, today_ordinal):
+        self._materialize()
+        return super().days_rented_by_movie_id(movie_id, today_ordinal)
+
+    def days_rented_by_client_id(self, client_id, today_ordinal):
+        self._materialize()
+        return super().days_rented_by_client_id(client_id, today_ordinal)
+
+    def days_rented_per_movie(self, today_ordinal):
+        self._materialize()
+        return super().days_rented_per_movie(today_ordinal)
+
+    def days_rented_per_client(self, today_ordinal):
+        self._materialize()
+        return super().days_rented_per_client(today_ordinal)
+
+    def find_overdue(self, today_ordinal, client_id=None):
+        self._materialize()
+        return super().find_overdue(today_ordinal, client_id)
+
+    def is_movie_available(self, movie_id, start_ordinal, end_ordinal=None):
+        self._materialize()
+        return super().is_movie_available(movie_id, start_ordinal, end_ordinal)
+
+    @classmethod
+    def iter_file_entities(cls, file_name):
+        """
+        Yields the rentals of a binary file one record at a time, without loading them into a repository. Files in
+        the older pickle format are read too.
+        """
+        if StructRecordFile.is_struct_file(file_name):
+            for slot, values in StructRecordFile(file_name, cls._RECORD_FIELDS).iter_records():
+                yield cls._from_record(values)
+            return
+
+        with open(file_name, "rb") as file_pointer:
+            while True:
+                try:
+                    yield pickle.load(file_pointer)
+                except EOFError:
+                    break
+
+    def _load_pickled_data(self):
+        for entity in self.iter_file_entities(self._file_name):
+            super().add_entity(entity)
 
     def _save_to_file(self, entity_to_write):
-        with open(self._file_name, 'ab') as file_pointer:
-            pickle.dump(entity_to_write, file_pointer)
+        try:
+            self._slots[entity_to_write.rental_id] = self._records.append(self._to_record(entity_to_write))
+        except StructRecordFileException as srfe:
+            super().remove_by_id(entity_to_write.rental_id)
+            raise RentalRepositoryException(srfe)
 
     def _rewrite_file(self):
         try:
             entities = super().get_all_entities
-            with open(self._file_name, "wb") as file_pointer:
-                for entity in entities:
-                    pickle.dump(entity, file_pointer)
         except RentalRepositoryException:
-            open(self._file_name, 'wb').close()  # empty out the file
+            entities = []
+        slots = self._records.rewrite([self._to_record(entity) for entity in entities])
+        self._slots = {entity.rental_id: slot for entity, slot in zip(entities, slots)}
+
+    def _storage_error(self, entity):
+        if not self._records.can_store(self._to_record(entity)):
+            return "The ids are too large for the binary file."
+        return None
+
+    def bulk_load(self, entities):
+        self._materialize()
+        loaded, rejected = super().bulk_load(entities)
+        slots = self._records.append_all([self._to_record(entity) for entity in loaded])
+        for entity, slot in zip(loaded, slots):
+            self._slots[entity.rental_id] = slot
+        return loaded, rejected
 
     def add_entity(self, entity):
+        self._materialize()
         super().add_entity(entity)
         self._save_to_file(entity)
 
     def remove_by_id(self, entity_id):
+        self._materialize()
         entity_removed = super().remove_by_id(entity_id)
-        self._rewrite_file()
+        self.__delete_records([entity_removed])
         return entity_removed
 
     def remove_by_client_id(self, client_id):
+        self._materialize()
         entities_removed = super().remove_by_client_id(client_id)
-        self._rewrite_file()
+        self.__delete_records(entities_removed)
         return entities_removed
 
     def remove_by_movie_id(self, movie_id):
+        self._materialize()
         entities_removed = super().remove_by_movie_id(movie_id)
-        self._rewrite_file()
+        self.__delete_records(entities_removed)
         return entities_removed
 
+    def __delete_records(self, entities_removed):
+        for entity in entities_removed:
+            self._records.delete(self._slots.pop(entity.rental_id))
+        if self._records.needs_compaction():
+            self._rewrite_file()
+
     def update_entity_by_id(self, entity_id, updated_entity):
+        self._materialize()
         super().update_entity_by_id(entity_id, updated_entity)
-        self._rewrite_file()
+        if entity_id not in self._slots:
+            return
+        slot = self._slots.pop(entity_id)
+        self._slots[updated_entity.rental_id] = slot
+        try:
+            self._records.write(slot, self._to_record(updated_entity))
+        except StructRecordFileException as srfe:
+            raise RentalRepositoryException(srfe)
+        if self._records.needs_compaction():
+            self._rewrite_file()
+
+
+class LazyRentalList(object):
+    """
+    Read-only sequence over the rows of a RentalColumnarRepository. The rentals are materialized on access.
+    """
+
+    def __init__(self, repository):
+        self.__repository = repository
+
+    def __len__(self):
+        return self.__repository.row_count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.__repository.materialize_row(row) for row in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index = index + len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("rental index out of range")
+        return self.__repository.materialize_row(index)
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self.__repository.materialize_row(row)
+
+    def __str__(self):
+        return '[' + ', '.join(str(item) for item in self) + ']'
+
+
+class RentalColumnarRepository(object):
+    """
+    Rental repository that stores the rentals column-wise: the ids and the date ordinals live in array('q') columns
+    (a returned ordinal of 0 means "N.A."). Date strings are only kept for the dates that are not written in the
+    canonical dd.mm.yyyy form. Rentals are materialized on access, so the returned entities are copies: changes have
+    to go through update_entity_by_id. Removing a rental moves the last row in its place.
+    The statistics queries scan the columns.
+    """
+
+    def __init__(self, validator_class):
+        self.__validator_class = validator_class
+        self.__rental_ids = array('q')
+        self.__movie_ids = array('q')
+        self.__client_ids = array('q')
+        self.__rented_ordinals = array('q')
+        self.__due_ordinals = array('q')
+        self.__returned_ordinals = array('q')
+        self.__rows_by_id = {}  # rental id -> row
+        self.__date_texts = {}  # rental id -> (rented, due, returned) date strings, for non-canonical dates only
+
+    @property
+    def row_count(self):
+        return len(self.__rental_ids)
+
+    def columns(self):
+        """
+        :return: the (rental ids, movie ids, client ids, rented, due, returned ordinals) columns, not to be modified
+        """
+        return self.__rental_ids, self.__movie_ids, self.__client_ids, self.__rented_ordinals, \
+            self.__due_ordinals, self.__returned_ordinals
+
+    @staticmethod
+    def __to_key(entity_id):
+        """
+        :return: the integer key of a valid id string, None otherwise
+        """
+        try:
+            MiscellaneousValidator.is_positive_integer(entity_id)
+        except (MiscellaneousValidatorException, TypeError):
+            return None
+
+        return int(entity_id)
+
+    @staticmethod
+    def __date_text(text, ordinal):
+        """
+        :return: None if the text is what ordinal_to_date renders, the text itself otherwise
+        """
+        if ordinal == 0 or ordinal_to_date(ordinal) == text:
+            return None
+        return text
+
+    def materialize_row(self, row):
+        rental_id = self.__rental_ids[row]
+        rented_date = ordinal_to_date(self.__rented_ordinals[row])
+        due_date = ordinal_to_date(self.__due_ordinals[row])
+        returned_ordinal = self.__returned_ordinals[row]
+        returned_date = "N.A." if returned_ordinal == 0 else ordinal_to_date(returned_ordinal)
+
+        texts = self.__date_texts.get(rental_id)
+        if texts is not None:
+            rented_date = texts[0] or rented_date
+            due_date = texts[1] or due_date
+            returned_date = texts[2] or returned_date
+
+        return Rental(str(rental_id), str(self.__movie_ids[row]), str(self.__client_ids[row]), rented_date, due_date,
+                      returned_date)
+
+    def __write_row(self, row, rental):
+        """
+        Writes the (validated) rental at the given row; row == row_count appends it.
+        :return: the integer rental id
+        """
+        rental_id = int(rental.rental_id)
+        returned_ordinal = rental.returned_ordinal or 0
+        values = [(self.__rental_ids, rental_id), (self.__movie_ids, int(rental.movie_id)),
+                  (self.__client_ids, int(rental.client_id)), (self.__rented_ordinals, rental.rented_ordinal),
+                  (self.__due_ordinals, rental.due_ordinal), (self.__returned_ordinals, returned_ordinal)]
+        try:
+            for column, value in values:
+                if row == len(column):
+                    column.append(value)
+                else:
+                    column[row] = value
+        except OverflowError:
+            raise RentalRepositoryException("The rental, movie and client ids are too large for the columnar storage.")
+
+        texts = (self.__date_text(rental.rented_date, rental.rented_ordinal),
+                 self.__date_text(rental.due_date, rental.due_ordinal),
+                 self.__date_text(rental.returned_date, returned_ordinal))
+        if texts != (None, None, None):
+            self.__date_texts[rental_id] = texts
+        else:
+            self.__date_texts.pop(rental_id, None)
+        return rental_id
+
+    def __remove_row(self, row):
+        rental_id = self.__rental_ids[row]
+        last_row = len(self.__rental_ids) - 1
+        for column in self.columns():
+            column[row] = column[last_row]
+            column.pop()
+        if row != last_row:
+            self.__rows_by_id[self.__rental_ids[row]] = row
+        del self.__rows_by_id[rental_id]
+        self.__date_texts.pop(rental_id, None)
+
+    def __rows_matching(self, column, key):
+        if key is None:
+            return []
+
+        return [row for row, value in enumerate(column) if value == key]
+
+    def find_by_id(self, rental_id):
+        try:
+            MiscellaneousValidator.is_positive_integer(rental_id)
+        except MiscellaneousValidatorException as mve:
+            raise RentalRepositoryException("The rental id is not valid:" + " - " + str(mve))
+
+        row = self.__rows_by_id.get(int(rental_id))
+        if row is None:
+            return None
+        return self.materialize_row(row)
+
+    def find_by_client_id(self, client_id):
+        """
+        :return: list of the rentals of the given client
+        """
+        return [self.materialize_row(row) for row in self.__rows_matching(self.__client_ids, self.__to_key(client_id))]
+
+    def find_by_movie_id(self, movie_id):
+        """
+        :return: list of the rentals of the given movie
+        """
+        return [self.materialize_row(row) for row in self.__rows_matching(self.__movie_ids, self.__to_key(movie_id))]
+
+    def add_entity(self, rental):
+        try:
+            self.__validator_class.validate(rental)
+        except RentalValidatorException as rve:
+            raise RentalRepositoryException("The rental's attributes are not valid.:" + " - " + str(rve))
+
+        if int(rental.rental_id) in self.__rows_by_id:
+            raise RentalRepositoryException("The rental id already exists.")
+
+        row = len(self.__rental_ids)
+        try:
+            rental_id = self.__write_row(row, rental)
+        except RentalRepositoryException:
+            for column in self.columns():
+                del column[row:]
+            raise
+        self.__rows_by_id[rental_id] = row
+
+    def bulk_load(self, rentals):
+        """
+        Adds the rentals in a single pass, skipping (and reporting) the invalid ones and the ones whose id is taken.
+        :return: (list of the added rentals, list of (position, rental, error message) for the rejected rentals)
+        """
+        loaded = []
+        rejected = []
+        for position, rental in enumerate(rentals):
+            try:
+                self.add_entity(rental)
+                loaded.append(rental)
+            except RentalRepositoryException as rre:
+                rejected.append((position, rental, str(rre)))
+        return loaded, rejected
+
+    def remove_by_id(self, rental_id):
+        """
+        :return: the removed rental
+        """
+        try:
+            MiscellaneousValidator.is_positive_integer(rental_id)
+        except MiscellaneousValidatorException as mve:
+            raise RentalRepositoryException("The rental id is not valid:" + " - " + str(mve))
+
+        row = self.__rows_by_id.get(int(rental_id))
+        if row is None:
+            raise RentalRepositoryException("The id of the rental does not exist.")
+
+        rental = self.materialize_row(row)
+        self.__remove_row(row)
+        return rental
+
+    def __remove_rows(self, rows):
+        removed_rentals = [self.materialize_row(row) for row in rows]
+        for row in sorted(rows, reverse=True):  # the rows moved in place of the removed ones are never pending
+            self.__remove_row(row)
+        return removed_rentals
+
+    def remove_by_client_id(self, client_id):
+        """
+        :return: the removed rentals
+        """
+        return self.__remove_rows(self.__rows_matching(self.__client_ids, self.__to_key(client_id)))
+
+    def remove_by_movie_id(self, movie_id):
+        """
+        :return: the removed rentals
+        """
+        return self.__remove_rows(self.__rows_matching(self.__movie_ids, self.__to_key(movie_id)))
+
+    def update_entity_by_id(self, rental_id, updated_rental):
+        try:
+            self.__validator_class.validate(updated_rental)
+        except RentalValidatorException:
+            raise RentalRepositoryException("The rental's attributes are not valid.")
+
+        self.find_by_id(rental_id)  # throws a custom exception in case the rental id is not valid
+        row = self.__rows_by_id.get(int(rental_id))
+        if row is None:
+            return
+
+        new_rental_id = int(updated_rental.rental_id)
+        if new_rental_id != int(rental_id) and new_rental_id in self.__rows_by_id:
+            raise RentalRepositoryException("The rental id already exists.")
+
+        old_rental = self.materialize_row(row)
+        try:
+            self.__write_row(row, updated_rental)
+        except RentalRepositoryException:
+            self.__write_row(row, old_rental)
+            raise
+        if new_rental_id != int(rental_id):
+            del self.__rows_by_id[int(rental_id)]
+            self.__date_texts.pop(int(rental_id), None)
+            self.__rows_by_id[new_rental_id] = row
+
+    @property
+    def get_all_entities(self):
+        if len(self.__rental_ids) == 0:
+            raise RentalRepositoryException("The list of rentals is empty.")
+
+        return LazyRentalList(self)
+
+    def __days_rented(self, key_column, today_ordinal):
+        """
+        :return: dictionary id -> days rented, grouped by the values of key_column
+        """
+        totals = {}
+        for key, rented, returned in zip(key_column, self.__rented_ordinals, self.__returned_ordinals):
+            totals[key] = totals.get(key, 0) + (returned or today_ordinal) - rented
+        return {str(key): total for key, total in totals.items()}
+
+    def days_rented_per_movie(self, today_ordinal):
+        """
+        :return: dictionary movie id -> total number of days rented, for the movies that have rentals
+        """
+        return self.__days_rented(self.__movie_ids, today_ordinal)
+
+    def days_rented_per_client(self, today_ordinal):
+        """
+        :return: dictionary client id -> total number of days rented, for the clients that have rentals
+        """
+        return self.__days_rented(self.__client_ids, today_ordinal)
+
+    def days_rented_by_movie_id(self, movie_id, today_ordinal):
+        return self.days_rented_per_movie(today_ordinal).get(movie_id, 0)
+
+    def days_rented_by_client_id(self, client_id, today_ordinal):
+        return self.days_rented_per_client(today_ordinal).get(client_id, 0)
+
+    def find_overdue(self, today_ordinal, client_id=None):
+        """
+        :param client_id: only the rentals of this client, None for every client
+        :return: list of the rentals that are not returned and passed their due date before today_ordinal
+        """
+        if client_id is not None:
+            rows = [row for row in self.__rows_matching(self.__client_ids, self.__to_key(client_id))
+                    if self.__returned_ordinals[row] == 0 and self.__due_ordinals[row] < today_ordinal]
+        else:
+            rows = [row for row, (returned, due) in enumerate(zip(self.__returned_ordinals, self.__due_ordinals))
+                    if returned == 0 and due < today_ordinal]
+        return [self.materialize_row(row) for row in rows]
+
+    def is_movie_available(self, movie_id, start_ordinal, end_ordinal=None):
+        """
+        :param end_ordinal: end of the period (excluded), None for a period that is open ended
+        :return: True if the movie is not rented in the period [start_ordinal, end_ordinal)
+        """
+        end_ordinal = RentalIntervals.OPEN if end_ordinal is None else end_ordinal
+        for row in self.__rows_matching(self.__movie_ids, self.__to_key(movie_id)):
+            returned_ordinal = self.__returned_ordinals[row] or RentalIntervals.OPEN
+            if self.__rented_ordinals[row] < end_ordinal and returned_ordinal > start_ordinal:
+                return False
+        return True
+
+
+class RentalSqliteRepository(object):
+    """
+    Rentals stored in the "rentals" table of a SQLite database, through a SqliteConnectionPool, with the date
+    ordinals next to the date strings (NULL returned ordinal for "N.A."). The table is indexed by client, by movie and
+    by due date of the open rentals, and the statistics are computed by SQL aggregates.
+    The returned rentals are copies: changes have to go through update_entity_by_id.
+    """
+    __COLUMNS = "rental_id, movie_id, client_id, rented_date, due_date, returned_date"
+
+    def __init__(self, validator_class, connection_pool):
+        self.__validator_class = validator_class
+        self.__connection_pool = connection_pool
+        with self.__connection_pool.connection() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS rentals (rental_id TEXT PRIMARY KEY, "
+                               "movie_id TEXT NOT NULL, client_id TEXT NOT NULL, rented_date TEXT NOT NULL, "
+                               "due_date TEXT NOT NULL, returned_date TEXT NOT NULL, rented_ordinal INTEGER NOT NULL, "
+                               "due_ordinal INTEGER NOT NULL, returned_ordinal INTEGER)")
+            connection.execute("CREATE INDEX IF NOT EXISTS rentals_by_client_id ON rentals (client_id)")
+            connection.execute("CREATE INDEX IF NOT EXISTS rentals_by_movie_id ON rentals (movie_id)")
+            connection.execute("CREATE INDEX IF NOT EXISTS open_rentals_by_due_ordinal ON rentals (due_ordinal) "
+                               "WHERE returned_ordinal IS NULL")
+
+    @staticmethod
+    def __validate_id(rental_id):
+        try:
+            MiscellaneousValidator.is_positive_integer(rental_id)
+        except MiscellaneousValidatorException as mve:
+            raise RentalRepositoryException("The rental id is not valid:" + " - " + str(mve))
+
+    @staticmethod
+    def __to_row(rental):
+        return rental.rental_id, rental.movie_id, rental.client_id, rental.rented_date, rental.due_date, \
+            rental.returned_date, rental.rented_ordinal, rental.due_ordinal, rental.returned_ordinal
+
+    def __find_all(self, condition, parameters):
+        with self.__connection_pool.connection() as connection:
+            rows = connection.execute("SELECT " + self.__COLUMNS + " FROM rentals WHERE " + condition +
+                                      " ORDER BY rowid", parameters).fetchall()
+        return [Rental(*row) for row in rows]
+
+    def __days_rented(self, key_column, today_ordinal):
+        with self.__connection_pool.connection() as connection:
+            rows = connection.execute("SELECT " + key_column + ", SUM(COALESCE(returned_ordinal, ?) - rented_ordinal) "
+                                      "FROM rentals GROUP BY " + key_column, (today_ordinal,)).fetchall()
+        return dict(rows)
+
+    def __days_rented_by(self, key_column, key, today_ordinal):
+        with self.__connection_pool.connection() as connection:
+            row = connection.execute("SELECT SUM(COALESCE(returned_ordinal, ?) - rented_ordinal) FROM rentals "
+                                     "WHERE " + key_column + " = ?", (today_ordinal, key)).fetchone()
+        return row[0] or 0
+
+    def find_by_id(self, rental_id):
+        self.__validate_id(rental_id)
+        rentals = self.__find_all("rental_id = ?", (rental_id,))
+        return rentals[0] if len(rentals) > 0 else None
+
+    def find_by_client_id(self, client_id):
+        """
+        :return: list of the rentals of the given client
+        """
+        return self.__find_all("client_id = ?", (client_id,))
+
+    def find_by_movie_id(self, movie_id):
+        """
+        :return: list of the rentals of the given movie
+        """
+        return self.__find_all("movie_id = ?", (movie_id,))
+
+    def days_rented_by_movie_id(self, movie_id, today_ordinal):
+        """
+        :return: the total number of days the movie was rented for, counting the open rentals up to today_ordinal
+        """
+        return self.__days_rented_by("movie_id", movie_id, today_ordinal)
+
+    def days_rented_by_client_id(self, client_id, today_ordinal):
+        """
+        :return: the total number of days the client rented for, counting the open rentals up to today_ordinal
+        """
+        return self.__days_rented_by("client_id", client_id, today_ordinal)
+
+    def days_rented_per_movie(self, today_ordinal):
+        """
+        :return: dictionary movie id -> total number of days rented, for the movies that have rentals
+        """
+        return self.__days_rented("movie_id", today_ordinal)
+
+    def days_rented_per_client(self, today_ordinal):
+        """
+        :return: dictionary client id -> total number of days rented, for the clients that have rentals
+        """
+        return self.__days_rented("client_id", today_ordinal)
+
+    def find_overdue(self, today_ordinal, client_id=None):
+        """
+        :param client_id: only the rentals of this client, None for every client
+        :return: list of the rentals that are not returned and passed their due date before today_ordinal
+        """
+        if client_id is not None:
+            return self.__find_all("client_id = ? AND returned_ordinal IS NULL AND due_ordinal < ?",
+                                   (client_id, today_ordinal))
+        return self.__find_all("returned_ordinal IS NULL AND due_ordinal < ?", (today_ordinal,))
+
+    def is_movie_available(self, movie_id, start_ordinal, end_ordinal=None):
+        """
+        :param end_ordinal: end of the period (excluded), None for a period that is open ended
+        :return: True if the movie is not rented in the period [start_ordinal, end_ordinal)
+        """
+        end_ordinal = RentalIntervals.OPEN if end_ordinal is None else end_ordinal
+        with self.__connection_pool.connection() as connection:
+            row = connection.execute("SELECT 1 FROM rentals WHERE movie_id = ? AND rented_ordinal < ? AND "
+                                     "COALESCE(returned_ordinal, ?) > ? LIMIT 1",
+                                     (movie_id, end_ordinal, RentalIntervals.OPEN, start_ordinal)).fetchone()
+        return row is None
+
+    def add_entity(self, rental):
+        try:
+            self.__validator_class.validate(rental)
+        except RentalValidatorException as rve:
+            raise RentalRepositoryException("The rental's attributes are not valid.:" + " - " + str(rve))
+
+        try:
+            with self.__connection_pool.connection() as connection:
+                connection.execute("INSERT INTO rentals (" + self.__COLUMNS + ", rented_ordinal, due_ordinal, "
+                                   "returned_ordinal) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", self.__to_row(rental))
+        except sqlite3.IntegrityError:
+            raise RentalRepositoryException("Can not add rental because the rental id already exists!")
+
+    def bulk_load(self, rentals):
+        """
+        Adds the rentals in a single transaction, skipping (and reporting) the invalid ones and the ones whose id is
+        taken.
+        :return: (list of the added rentals, list of (position, rental, error message) for the rejected rentals)
+        """
+        loaded = []
+        rejected = []
+        with self.__connection_pool.connection() as connection:
+            for position, rental in enumerate(rentals):
+                try:
+                    self.__validator_class.validate(rental)
+                except RentalValidatorException as rve:
+                    rejected.append((position, rental, "The rental's attributes are not valid.:" + " - " + str(rve)))
+                    continue
+
+                try:
+                    connection.execute("INSERT INTO rentals (" + self.__COLUMNS + ", rented_ordinal, due_ordinal, "
+                                       "returned_ordinal) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", self.__to_row(rental))
+                    loaded.append(rental)
+                except sqlite3.IntegrityError:
+                    rejected.append((position, rental, "Can not add rental because the rental id already exists!"))
+        return loaded, rejected
+
+    def remove_by_id(self, rental_id):
+        """
+        :return: the removed rental
+        """
+        rental = self.find_by_id(rental_id)
+        if rental is None:
+            raise RentalRepositoryException("The id of the rental does not exist.")
+
+        with self.__connection_pool.connection() as connection:
+            connection.execute("DELETE FROM rentals WHERE rental_id = ?", (rental_id,))
+        return rental
+
+    def __remove_all(self, key_column, key):
+        with self.__connection_pool.connection() as connection:
+            rows = connection.execute("SELECT " + self.__COLUMNS + " FROM rentals WHERE " + key_column + " = ? "
+                                      "ORDER BY rowid", (key,)).fetchall()
+            connection.execute("DELETE FROM rentals WHERE " + key_column + " = ?", (key,))
+        return [Rental(*row) for row in rows]
+
+    def remove_by_client_id(self, client_id):
+        """
+        :return: the removed rentals
+        """
+        return self.__remove_all("client_id", client_id)
+
+    def remove_by_movie_id(self, movie_id):
+        """
+        :return: the removed rentals
+        """
+        return self.__remove_all("movie_id", movie_id)
+
+    def update_entity_by_id(self, rental_id, updated_rental):
+        try:
+            self.__validator_class.validate(updated_rental)
+        except RentalValidatorException:
+            raise RentalRepositoryException("The rental's attributes are not valid.")
+        self.__validate_id(rental_id)
+
+        try:
+            with self.__connection_pool.connection() as connection:
+                connection.execute("UPDATE rentals SET rental_id = ?, movie_id = ?, client_id = ?, rented_date = ?, "
+                                   "due_date = ?, returned_date = ?, rented_ordinal = ?, due_ordinal = ?, "
+                                   "returned_ordinal = ? WHERE rental_id = ?", self.__to_row(updated_rental) +
+                                   (rental_id,))
+        except sqlite3.IntegrityError:
+            raise RentalRepositoryException("The rental id already exists.")
+
+    @property
+    def get_all_entities(self):
+        entities = MyIterator()
+        with self.__connection_pool.connection() as connection:
+            for row in connection.execute("SELECT " + self.__COLUMNS + " FROM rentals ORDER BY rowid"):
+                entities.append(Rental(*row))
+        if len(entities) == 0:
+            raise RentalRepositoryException("The list of rentals is empty.")
+
+        return entities
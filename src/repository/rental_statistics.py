@@ -0,0 +1,124 @@
+try:
+    import numpy
+except ImportError:  # NumPy is optional, the statistics fall back to plain Python
+    numpy = None
+
+
+def is_vectorization_available():
+    return numpy is not None
+
+
+def vectorized_days_rented(keys, rented_ordinals, returned_ordinals, today_ordinal):
+    """
+    Days rented grouped by key, computed with NumPy. The rentals are given column-wise, as int64 compatible
+    sequences; a returned ordinal of 0 means the rental is not returned yet and counts up to today_ordinal.
+    :return: dictionary str(key) -> days rented, for the keys that have rentals
+    """
+    if len(keys) == 0:
+        return {}
+
+    keys = numpy.asarray(keys, dtype=numpy.int64)
+    rented = numpy.asarray(rented_ordinals, dtype=numpy.int64)
+    returned = numpy.asarray(returned_ordinals, dtype=numpy.int64)
+    days = numpy.where(returned == 0, today_ordinal, returned) - rented
+    unique_keys, groups = numpy.unique(keys, return_inverse=True)
+    totals = numpy.zeros(len(unique_keys), dtype=numpy.int64)
+    numpy.add.at(totals, groups, days)
+    return {str(key): total for key, total in zip(unique_keys.tolist(), totals.tolist())}
+
+
+def vectorized_overdue_rows(due_ordinals, returned_ordinals, today_ordinal):
+    """
+    :return: the rows (in order) of the rentals that are not returned and have a due ordinal before today_ordinal
+    """
+    due = numpy.asarray(due_ordinals, dtype=numpy.int64)
+    returned = numpy.asarray(returned_ordinals, dtype=numpy.int64)
+    return numpy.flatnonzero((returned == 0) & (due < today_ordinal)).tolist()
+
+
+class RentalDaysStatistics:
+    """
+    Materialized view of the number of days each movie and each client has rented for.
+    A returned rental contributes (returned date - rented date) days. Rentals that are not returned yet are kept as
+    a count and a sum of rented date ordinals, so the days at a given date are: closed days + count * date - sum.
+    """
+
+    def __init__(self):
+        # key -> [number of rentals, days of the returned rentals, open rentals, sum of the open rented ordinals]
+        self.__by_movie_id = {}
+        self.__by_client_id = {}
+        # rental id -> (movie id, client id, closed days or None if not returned, rented ordinal)
+        self.__contributions = {}
+
+    @staticmethod
+    def __add_to_totals(totals, key, closed_days, rented_ordinal):
+        total = totals.get(key)
+        if total is None:
+            total = totals[key] = [0, 0, 0, 0]
+
+        total[0] += 1
+        if closed_days is None:
+            total[2] += 1
+            total[3] += rented_ordinal
+        else:
+            total[1] += closed_days
+
+    @staticmethod
+    def __remove_from_totals(totals, key, closed_days, rented_ordinal):
+        total = totals[key]
+        total[0] -= 1
+        if total[0] == 0:
+            del totals[key]
+        elif closed_days is None:
+            total[2] -= 1
+            total[3] -= rented_ordinal
+        else:
+            total[1] -= closed_days
+
+    @staticmethod
+    def __days_at(totals, key, today_ordinal):
+        total = totals.get(key)
+        if total is None:
+            return 0
+
+        return total[1] + total[2] * today_ordinal - total[3]
+
+    def add(self, rental):
+        rented_ordinal = rental.rented_ordinal
+        closed_days = None
+        if rental.returned_ordinal is not None:
+            closed_days = rental.returned_ordinal - rented_ordinal
+
+        self.__contributions[rental.rental_id] = (rental.movie_id, rental.client_id, closed_days, rented_ordinal)
+        self.__add_to_totals(self.__by_movie_id, rental.movie_id, closed_days, rented_ordinal)
+        self.__add_to_totals(self.__by_client_id, rental.client_id, closed_days, rented_ordinal)
+
+    def remove(self, rental_id):
+        """
+        Removes the contribution recorded when the rental was added, even if the rental was changed in the meantime.
+        """
+        movie_id, client_id, closed_days, rented_ordinal = self.__contributions.pop(rental_id)
+        self.__remove_from_totals(self.__by_movie_id, movie_id, closed_days, rented_ordinal)
+        self.__remove_from_totals(self.__by_client_id, client_id, closed_days, rented_ordinal)
+
+    @staticmethod
+    def __days_per_key(totals, today_ordinal):
+        return {key: total[1] + total[2] * today_ordinal - total[3] for key, total in totals.items()}
+
+    def days_rented_per_movie(self, today_ordinal):
+        """
+        :return: dictionary movie id -> days rented, for the movies that have rentals
+        """
+        return self.__days_per_key(self.__by_movie_id, today_ordinal)
+
+    def days_rented_per_client(self, today_ordinal):
+        """
+        :return: dictionary client id -> days rented, for the clients that have rentals
+        """
+        return self.__days_per_key(self.__by_client_id, today_ordinal)
+
+    def days_rented_by_movie_id(self, movie_id, today_ordinal):
+        return self.__days_at(self.__by_movie_id, movie_id, today_ordinal)
+
+    def days_rented_by_client_id(self, client_id, today_ordinal):
+        return self.__days_at(self.__by_client_id, client_id, today_ordinal)
@@ -0,0 +1,63 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class SqliteConnectionPool(object):
+    """
+    Small pool of connections to one SQLite database, shared by the SQLite repositories.
+    The database is put in WAL journal mode, so reading does not block writing. sqlite3 keeps the prepared statements
+    of every connection in a cache keyed by their SQL, so the repositories only use constant, parametrized SQL.
+    """
+
+    def __init__(self, database_name, size=4, cached_statements=128):
+        """
+        :param size: maximum number of connections (1 for ":memory:", as every connection has its own database)
+        """
+        self.__database_name = database_name
+        self.__size = 1 if database_name == ":memory:" else size
+        self.__cached_statements = cached_statements
+        self.__idle_connections = queue.LifoQueue()
+        self.__connections = []
+        self.__lock = threading.Lock()
+
+    def __connect(self):
+        connection = sqlite3.connect(self.__database_name, check_same_thread=False,
+                                     cached_statements=self.__cached_statements)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def __acquire(self):
+        try:
+            return self.__idle_connections.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self.__lock:
+            if len(self.__connections) < self.__size:
+                connection = self.__connect()
+                self.__connections.append(connection)
+                return connection
+        return self.__idle_connections.get()  # waits for a connection to be released
+
+    @contextmanager
+    def connection(self):
+        """
+        Lends a connection for the with block: its changes are committed at the end of the block, or rolled back
+        if the block raises an exception.
+        """
+        connection = self.__acquire()
+        try:
+            with connection:
+                yield connection
+        finally:
+            self.__idle_connections.put(connection)
+
+    def close(self):
+        with self.__lock:
+            for connection in self.__connections:
+                connection.close()
+            self.__connections = []
+            self.__idle_connections = queue.LifoQueue()
@@ -0,0 +1,447 @@
+import mmap
+import os
+import struct
+from array import array
+
+from src.repository.write_behind_buffer import DirectFileWriter
+
+
+class StructRecordFileException(Exception):
+    pass
+
+
+def map_file(file_name):
+    """
+    :return: the file mapped into memory (read-only), or b"" for an empty file, as those can not be mapped
+    """
+    with open(file_name, "rb") as file_pointer:
+        if os.fstat(file_pointer.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(file_pointer.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class StructRecordFile:
+    """
+    Versioned binary file of fixed-width records, packed with struct, plus a "<file_name>.heap" file for the strings.
+    The file starts with a header (magic, version, record size); every record starts with a flag byte (1 = live,
+    0 = deleted), so a record can be updated or deleted in place at header size + slot * record size.
+    Record fields are given as struct codes, plus 's' for a string: it is stored in the heap and the record only
+    keeps its offset and length (offset -1 for None). An update appends its strings to the heap, so the strings of the
+    updated and deleted records stay in the heap as unused bytes until the next rewrite (see needs_compaction).
+    A rewrite replaces both files together: the new files are written as "<heap file>.tmp" and "<file_name>.tmp", and
+    renaming the latter to "<file_name>.new" commits them, so an interrupted rewrite is completed, or dropped if it
+    was not committed, when the file is opened again.
+    """
+    MAGIC = b"MRMB"
+    VERSION = 1
+    HEADER = struct.Struct("<4sHH")
+    LIVE = 1
+    DELETED = 0
+
+    def __init__(self, file_name, fields, write_buffer=None):
+        """
+        :param write_buffer: WriteBehindBuffer for the writes, None to write them at once
+        """
+        self.__file_name = file_name
+        self.__writer = DirectFileWriter() if write_buffer is None else write_buffer
+        self.__heap_file_name = file_name + ".heap"
+        self.__writer.add_dependency(file_name, self.__heap_file_name)
+        self.__fields = fields
+        self.__record = struct.Struct("<B" + fields.replace('s', 'qI'))
+        self.__record_count = 0
+        self.__deleted_count = 0
+        self.__heap_size = 0
+        self.__string_sizes = array('q')  # slot -> heap bytes of the strings of the record, 0 once deleted
+        self.__unused_heap_size = 0
+        self.__has_header = False
+        self.__recover()
+
+    def __recover(self):
+        """
+        Completes a committed rewrite that was interrupted, and removes the temporary files of one that was not
+        committed.
+        """
+        new_file_name = self.__file_name + ".new"
+        temporary_heap_file_name = self.__heap_file_name + ".tmp"
+        if os.path.exists(new_file_name):
+            if os.path.exists(temporary_heap_file_name):
+                os.replace(temporary_heap_file_name, self.__heap_file_name)
+            os.replace(new_file_name, self.__file_name)
+        for temporary_file_name in [temporary_heap_file_name, self.__file_name + ".tmp"]:
+            if os.path.exists(temporary_file_name):
+                os.remove(temporary_file_name)
+
+    @staticmethod
+    def is_struct_file(file_name):
+        """
+        :return: True if the file is empty or written in this format, False for the older pickle files
+        """
+        with open(file_name, "rb") as file_pointer:
+            start = file_pointer.read(len(StructRecordFile.MAGIC))
+        return len(start) == 0 or start == StructRecordFile.MAGIC
+
+    @property
+    def deleted_count(self):
+        return self.__deleted_count
+
+    @property
+    def live_count(self):
+        return self.__record_count - self.__deleted_count
+
+    @property
+    def unused_heap_size(self):
+        """
+        :return: the heap bytes of the strings that no live record uses any more
+        """
+        return self.__unused_heap_size
+
+    def needs_compaction(self):
+        """
+        :return: True if the deleted records outnumber the live ones, or the unused heap bytes outweigh the used ones
+        """
+        return self.__deleted_count > self.live_count or \
+            self.__unused_heap_size > self.__heap_size - self.__unused_heap_size
+
+    def __header(self):
+        return self.HEADER.pack(self.MAGIC, self.VERSION, self.__record.size)
+
+    def __pack(self, flag, values, heap_chunks):
+        """
+        Packs a record; its strings are added to heap_chunks, at the end of the heap.
+        """
+        packed_values = []
+        for code, value in zip(self.__fields, values):
+            if code != 's':
+                packed_values.append(value)
+            elif value is None:
+                packed_values.extend([-1, 0])
+            else:
+                encoded = value.encode("utf-8")
+                packed_values.extend([self.__heap_size, len(encoded)])
+                heap_chunks.append(encoded)
+                self.__heap_size = self.__heap_size + len(encoded)
+        try:
+            return self.__record.pack(flag, *packed_values)
+        except struct.error as error:
+            raise StructRecordFileException("The record can not be stored: " + str(error))
+
+    @property
+    def record_size(self):
+        return self.__record.size
+
+    def unpack_record(self, buffer, slot, heap):
+        """
+        :return: the values of the record at the given slot of the (mapped) records file
+        """
+        packed_values = self.__record.unpack_from(buffer, self.HEADER.size + slot * self.__record.size)
+        return self.__unpack(packed_values, heap)
+
+    def open_mapped(self, decode):
+        """
+        Maps the records file and the heap into memory (read-only).
+        :param decode: function building an entity from the values of a record
+        :return: a MappedRecordList over the live records
+        """
+        return MappedRecordList(self, self.__file_name, self.__heap_file_name, decode)
+
+    def __string_size(self, packed_values):
+        """
+        :return: the heap bytes of the strings of a packed record
+        """
+        size = 0
+        index = 1
+        for code in self.__fields:
+            if code == 's':
+                if packed_values[index] != -1:
+                    size = size + packed_values[index + 1]
+                index = index + 2
+            else:
+                index = index + 1
+        return size
+
+    def __unpack(self, packed_values, heap):
+        values = []
+        index = 1  # packed_values[0] is the flag
+        for code in self.__fields:
+            if code != 's':
+                values.append(packed_values[index])
+                index = index + 1
+            else:
+                offset, length = packed_values[index], packed_values[index + 1]
+                values.append(None if offset == -1 else heap[offset:offset + length].decode("utf-8"))
+                index = index + 2
+        return tuple(values)
+
+    def check_header(self, data):
+        """
+        Checks that data starts with the header of this format and record size.
+        """
+        if len(data) < self.HEADER.size:
+            raise StructRecordFileException("The file " + self.__file_name + " is truncated.")
+        magic, version, record_size = self.HEADER.unpack_from(data)
+        if magic != self.MAGIC or version != self.VERSION or record_size != self.__record.size:
+            raise StructRecordFileException("The file " + self.__file_name + " has an unsupported format.")
+
+    def iter_records(self, chunk_size=4096):
+        """
+        Yields the (slot, values) of the live records, reading chunk_size records at a time. The heap is mapped into
+        memory, so the files do not have to fit in memory.
+        """
+        with open(self.__file_name, "rb") as file_pointer:
+            header = file_pointer.read(self.HEADER.size)
+            if len(header) == 0:
+                return
+            self.check_header(header)
+
+            heap = map_file(self.__heap_file_name) if os.path.exists(self.__heap_file_name) else b""
+            try:
+                slot = 0
+                record_size = self.__record.size
+                while True:
+                    data = file_pointer.read(chunk_size * record_size)
+                    body_size = len(data) // record_size * record_size  # ignores a partially written record
+                    for packed_values in self.__record.iter_unpack(memoryview(data)[:body_size]):
+                        if packed_values[0] != self.DELETED:
+                            yield slot, self.__unpack(packed_values, heap)
+                        slot = slot + 1
+                    if len(data) < chunk_size * record_size:
+                        break
+            finally:
+                if isinstance(heap, mmap.mmap):
+                    heap.close()
+
+    def read_all(self):
+        """
+        Reads the records file and the heap, each with a single read.
+        :return: list of (slot, values) for the live records
+        """
+        with open(self.__file_name, "rb") as file_pointer:
+            data = file_pointer.read()
+        heap = b""
+        if os.path.exists(self.__heap_file_name):
+            with open(self.__heap_file_name, "rb") as file_pointer:
+                heap = file_pointer.read()
+        self.__heap_size = len(heap)
+        self.__string_sizes = array('q')
+        self.__unused_heap_size = self.__heap_size
+
+        if len(data) == 0:
+            return []  # the header is written with the first record
+
+        self.check_header(data)
+        self.__has_header = True
+
+        record_size = self.__record.size
+        body_size = (len(data) - self.HEADER.size) // record_size * record_size  # ignores a partially written record
+        records = []
+        self.__record_count = 0
+        self.__deleted_count = 0
+        body = memoryview(data)[self.HEADER.size:self.HEADER.size + body_size]
+        for slot, packed_values in enumerate(self.__record.iter_unpack(body)):
+            self.__record_count = self.__record_count + 1
+            if packed_values[0] == self.DELETED:
+                self.__deleted_count = self.__deleted_count + 1
+                self.__string_sizes.append(0)
+            else:
+                records.append((slot, self.__unpack(packed_values, heap)))
+                string_size = self.__string_size(packed_values)
+                self.__string_sizes.append(string_size)
+                self.__unused_heap_size = self.__unused_heap_size - string_size
+        return records
+
+    def flush(self):
+        """
+        Writes the pending writes of the write-behind buffer, if there is one.
+        """
+        self.__writer.flush()
+
+    def __write_heap(self, heap_chunks):
+        if len(heap_chunks) > 0:
+            self.__writer.append(self.__heap_file_name, b"".join(heap_chunks))
+
+    def append(self, values):
+        """
+        :return: the slot of the new record
+        """
+        heap_chunks = []
+        heap_size = self.__heap_size
+        record = self.__pack(self.LIVE, values, heap_chunks)
+        self.__write_heap(heap_chunks)
+        self.__string_sizes.append(self.__heap_size - heap_size)
+        if not self.__has_header:
+            self.__writer.write_at(self.__file_name, 0, self.__header())
+            self.__has_header = True
+        self.__writer.write_at(self.__file_name, self.HEADER.size + self.__record_count * self.__record.size, record)
+        self.__record_count = self.__record_count + 1
+        return self.__record_count - 1
+
+    def can_store(self, values):
+        """
+        :return: False if the numbers of the record do not fit in their fields
+        """
+        packed_values = []
+        for code, value in zip(self.__fields, values):
+            packed_values.extend([0, 0] if code == 's' else [value])
+        try:
+            self.__record.pack(self.LIVE, *packed_values)
+        except struct.error:
+            return False
+        return True
+
+    def append_all(self, values_list):
+        """
+        Appends the records with a single write to each file.
+        :return: the slots of the new records, in order
+        """
+        if len(values_list) == 0:
+            return []
+        heap_chunks = []
+        records = self.__pack_all(values_list, heap_chunks)
+        self.__write_heap(heap_chunks)
+        if not self.__has_header:
+            self.__writer.write_at(self.__file_name, 0, self.__header())
+            self.__has_header = True
+        first_slot = self.__record_count
+        self.__writer.write_at(self.__file_name, self.HEADER.size + first_slot * self.__record.size, b"".join(records))
+        self.__record_count = self.__record_count + len(records)
+        return list(range(first_slot, self.__record_count))
+
+    def __pack_all(self, values_list, heap_chunks):
+        """
+        Packs the records of the next slots, recording the size of their strings.
+        :return: the packed records
+        """
+        records = []
+        for values in values_list:
+            heap_size = self.__heap_size
+            records.append(self.__pack(self.LIVE, values, heap_chunks))
+            self.__string_sizes.append(self.__heap_size - heap_size)
+        return records
+
+    def write(self, slot, values):
+        """
+        Overwrites the record at the given slot (the new strings are appended to the heap, the old ones are left
+        unused).
+        """
+        heap_chunks = []
+        heap_size = self.__heap_size
+        record = self.__pack(self.LIVE, values, heap_chunks)
+        self.__write_heap(heap_chunks)
+        self.__unused_heap_size = self.__unused_heap_size + self.__string_sizes[slot]
+        self.__string_sizes[slot] = self.__heap_size - heap_size
+        self.__writer.write_at(self.__file_name, self.HEADER.size + slot * self.__record.size, record)
+
+    def delete(self, slot):
+        """
+        Marks the record at the given slot as deleted.
+        """
+        self.__writer.write_at(self.__file_name, self.HEADER.size + slot * self.__record.size, bytes([self.DELETED]))
+        self.__deleted_count = self.__deleted_count + 1
+        self.__unused_heap_size = self.__unused_heap_size + self.__string_sizes[slot]
+        self.__string_sizes[slot] = 0
+
+    def rewrite(self, values_list):
+        """
+        Rewrites both files with only the given records, dropping the deleted records and the unused strings.
+        :return: the slots of the records, in order
+        """
+        self.__heap_size = 0
+        self.__string_sizes = array('q')
+        self.__unused_heap_size = 0
+        heap_chunks = []
+        records = self.__pack_all(values_list, heap_chunks)
+        files = [(self.__heap_file_name, heap_chunks), (self.__file_name, [self.__header()] + records)]
+        self.__writer.discard(self.__heap_file_name, self.__file_name)
+        for file_name, chunks in files:
+            with open(file_name + ".tmp", "wb") as file_pointer:
+                file_pointer.write(b"".join(chunks))
+        os.replace(self.__file_name + ".tmp", self.__file_name + ".new")  # the commit (see __recover)
+        os.replace(self.__heap_file_name + ".tmp", self.__heap_file_name)
+        os.replace(self.__file_name + ".new", self.__file_name)
+        self.__record_count = len(records)
+        self.__deleted_count = 0
+        self.__has_header = True
+        return list(range(len(records)))
+
+
+class MappedRecordList(object):
+    """
+    Read-only sequence over the live records of a memory-mapped StructRecordFile. The records are decoded on access,
+    so every access returns a new entity; the pages are shared with the other processes mapping the same file.
+    The id of a record (its first field) is only read when an id is searched for the first time. The mappings are
+    closed by close(), or when the list is garbage collected.
+    """
+    ID = struct.Struct("<q")
+
+    def __init__(self, record_file, file_name, heap_file_name, decode):
+        self.__record_file = record_file
+        self.__decode = decode
+        self.__records = map_file(file_name)
+        self.__heap = map_file(heap_file_name) if os.path.exists(heap_file_name) else b""
+        self.__slots_by_id = None
+
+        record_size = record_file.record_size
+        header_size = StructRecordFile.HEADER.size
+        if len(self.__records) < header_size:
+            self.__slots = range(0)
+            return
+        try:
+            record_file.check_header(self.__records)
+        except StructRecordFileException:
+            self.close()
+            raise
+
+        record_count = (len(self.__records) - header_size) // record_size
+        flags = self.__records[header_size:header_size + record_count * record_size:record_size]
+        if flags.count(StructRecordFile.DELETED) == 0:
+            self.__slots = range(record_count)
+        else:
+            self.__slots = array('q', (slot for slot, flag in enumerate(flags) if flag != StructRecordFile.DELETED))
+
+    def close(self):
+        for mapped in [self.__records, self.__heap]:
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+        self.__records = self.__heap = b""
+        self.__slots = range(0)
+        self.__slots_by_id = None
+
+    def __decode_slot(self, slot):
+        return self.__decode(self.__record_file.unpack_record(self.__records, slot, self.__heap))
+
+    def find(self, entity_id):
+        """
+        :return: the entity with the given id, None if there is no such entity
+        """
+        if self.__slots_by_id is None:
+            record_size = self.__record_file.record_size
+            header_size = StructRecordFile.HEADER.size
+            self.__slots_by_id = {}
+            for slot in self.__slots:
+                record_id = self.ID.unpack_from(self.__records, header_size + slot * record_size + 1)[0]
+                self.__slots_by_id[str(record_id)] = slot
+
+        slot = self.__slots_by_id.get(entity_id)
+        if slot is None:
+            return None
+        return self.__decode_slot(slot)
+
+    def __len__(self):
+        return len(self.__slots)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.__decode_slot(self.__slots[position]) for position in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index = index + len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("record index out of range")
+        return self.__decode_slot(self.__slots[index])
+
+    def __iter__(self):
+        for slot in self.__slots:
+            yield self.__decode_slot(slot)
+
+    def __str__(self):
+        return '[' + ', '.join(str(item) for item in self) + ']'
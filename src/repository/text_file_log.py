@@ -0,0 +1,127 @@
+import os
+import zlib
+
+from src.repository.write_behind_buffer import DirectFileWriter
+
+
+class TextFileLogException(Exception):
+    pass
+
+
+class TextFileLog:
+    """
+    Append-only log of the changes made to a text file repository since its last snapshot (the plain CSV file).
+    One record per line: "A,<entity fields>" (add), "U,<old id>,<entity fields>" (update) or "D,<id>" (delete),
+    after a first "S,<checksum>" record holding the CRC-32 of the snapshot the changes were made to. A log that does
+    not belong to the snapshot (a crash during compaction, after the new snapshot was written) is not replayed.
+    """
+    SNAPSHOT = "S"
+    ADD = "A"
+    UPDATE = "U"
+    DELETE = "D"
+
+    def __init__(self, snapshot_file_name, field_count, compaction_threshold, write_buffer=None):
+        """
+        :param snapshot_file_name: the file of the repository, the log is kept in <snapshot_file_name>.log
+        :param field_count: number of fields of the entities
+        :param compaction_threshold: number of records after which the repository should be compacted
+        :param write_buffer: WriteBehindBuffer for the records, None to write them at once
+        """
+        self.__snapshot_file_name = snapshot_file_name
+        self.__file_name = snapshot_file_name + ".log"
+        self.__field_counts = {self.SNAPSHOT: 1, self.ADD: field_count, self.UPDATE: field_count + 1, self.DELETE: 1}
+        self.__writer = DirectFileWriter() if write_buffer is None else write_buffer
+        self.__compaction_threshold = compaction_threshold
+        self.__record_count = 0
+        if not os.path.exists(self.__file_name) or os.path.getsize(self.__file_name) == 0:
+            replace_file(self.__file_name, [self.__snapshot_record()])
+
+    @property
+    def file_name(self):
+        return self.__file_name
+
+    @property
+    def record_count(self):
+        return self.__record_count
+
+    def __snapshot_record(self):
+        checksum = 0
+        with open(self.__snapshot_file_name, 'rb') as file_pointer:
+            for chunk in iter(lambda: file_pointer.read(1 << 16), b""):
+                checksum = zlib.crc32(chunk, checksum)
+        return self.SNAPSHOT + "," + str(checksum) + '\n'
+
+    def __is_complete(self, line):
+        attributes = line.rstrip('\n').split(",")
+        field_count = self.__field_counts.get(attributes[0])
+        return line.endswith('\n') and field_count is not None and len(attributes) - 1 >= field_count
+
+    def records(self):
+        """
+        Yields the (operation, fields) records of the changes, in the order they were appended; none if the log does
+        not belong to the snapshot (it is then emptied). A partially written last record (a crash while it was
+        appended) is skipped and cut off the file, so the next records are appended after the complete ones.
+        :raises TextFileLogException: if a record before the last one is not complete
+        """
+        self.__record_count = 0
+        with open(self.__file_name) as file_pointer:
+            lines = file_pointer.readlines()
+            encoding = file_pointer.encoding
+
+        if len(lines) > 0 and not self.__is_complete(lines[-1]):
+            os.truncate(self.__file_name, os.path.getsize(self.__file_name) - len(lines[-1].encode(encoding)))
+            del lines[-1]
+        for number, line in enumerate(lines):
+            if not self.__is_complete(line):
+                raise TextFileLogException(self.__file_name + ", line " + str(number + 1) +
+                                           ": the record is not complete.")
+
+        if len(lines) > 0 and lines[0].startswith(self.SNAPSHOT + ","):
+            if lines[0] != self.__snapshot_record():
+                replace_file(self.__file_name, [self.__snapshot_record()], self.__writer)
+                return
+            del lines[0]
+        for line in lines:
+            attributes = line.rstrip('\n').split(",")
+            self.__record_count = self.__record_count + 1
+            yield attributes[0], attributes[1:]
+
+    def append(self, operation, fields):
+        self.__writer.append(self.__file_name, operation + "," + ",".join(fields) + '\n')
+        self.__record_count = self.__record_count + 1
+
+    def append_all(self, operation, fields_list):
+        """
+        Appends one record per fields list, in a single write.
+        """
+        if len(fields_list) == 0:
+            return
+        self.__writer.append(self.__file_name, "".join(operation + "," + ",".join(fields) + '\n'
+                                                       for fields in fields_list))
+        self.__record_count = self.__record_count + len(fields_list)
+
+    def needs_compaction(self):
+        return self.__record_count >= self.__compaction_threshold
+
+    def compact(self, snapshot_lines):
+        """
+        Replaces the snapshot with the lines and empties the log. The snapshot is replaced first: if the log is not
+        emptied (a crash in between), its snapshot record no longer matches the snapshot and it is not replayed.
+        """
+        self.__writer.discard(self.__snapshot_file_name)
+        replace_file(self.__snapshot_file_name, snapshot_lines)
+        replace_file(self.__file_name, [self.__snapshot_record()], self.__writer)
+        self.__record_count = 0
+
+
+def replace_file(file_name, lines, writer=None):
+    """
+    Writes the lines to a temporary file that then replaces file_name, so a crash never leaves a half written file.
+    :param writer: the writer (DirectFileWriter or WriteBehindBuffer) of the file, its pending writes are dropped
+    """
+    if writer is not None:
+        writer.discard(file_name)
+    temporary_file_name = file_name + ".tmp"
+    with open(temporary_file_name, "wt") as file_pointer:
+        file_pointer.writelines(lines)
+    os.replace(temporary_file_name, file_name)
@@ -0,0 +1,148 @@
+import re
+from bisect import bisect_left, insort
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """
+    :return: the lowercase words of the text, in order (repeated words included)
+    """
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+class TokenIndex:
+    """
+    Inverted index of the words of one text attribute: word -> {entity id: entity}.
+    The words are also kept sorted, so the words starting with a prefix are found by bisection.
+    """
+
+    def __init__(self):
+        self.__postings = {}
+        self.__words = []  # sorted keys of self.__postings
+        self.__sequences = {}  # entity id -> number of the add that indexed the entity, to keep the results in order
+        self.__next_sequence = 0
+
+    def add(self, entity_id, entity, text):
+        self.__sequences[entity_id] = self.__next_sequence
+        self.__next_sequence = self.__next_sequence + 1
+        self.__add_words(entity_id, entity, set(tokenize(text)))
+
+    def __add_words(self, entity_id, entity, words):
+        for word in words:
+            posting = self.__postings.get(word)
+            if posting is None:
+                posting = self.__postings[word] = {}
+                insort(self.__words, word)
+            posting[entity_id] = entity
+
+    def remove(self, entity_id, text):
+        self.__sequences.pop(entity_id, None)
+        self.__remove_words(entity_id, set(tokenize(text)))
+
+    def __remove_words(self, entity_id, words):
+        for word in words:
+            posting = self.__postings.get(word)
+            if posting is None:
+                continue
+            posting.pop(entity_id, None)
+            if len(posting) == 0:
+                del self.__postings[word]
+                del self.__words[bisect_left(self.__words, word)]
+
+    def update(self, entity_id, new_entity_id, entity, old_text, new_text):
+        """
+        Re-indexes an updated entity, which keeps its place in the results. The postings of the words it keeps are
+        updated in place, unless its id changed.
+        """
+        old_words = set(tokenize(old_text))
+        new_words = set(tokenize(new_text))
+        self.__sequences[new_entity_id] = self.__sequences.pop(entity_id)
+        if new_entity_id == entity_id:
+            self.__remove_words(entity_id, old_words - new_words)
+            for word in old_words & new_words:
+                self.__postings[word][entity_id] = entity
+            self.__add_words(entity_id, entity, new_words - old_words)
+        else:
+            self.__remove_words(entity_id, old_words)
+            self.__add_words(new_entity_id, entity, new_words)
+
+    def __prefix_posting(self, prefix):
+        """
+        :return: {entity id: entity} for the entities with a word starting with the prefix
+        """
+        posting = {}
+        position = bisect_left(self.__words, prefix)
+        while position < len(self.__words) and self.__words[position].startswith(prefix):
+            posting.update(self.__postings[self.__words[position]])
+            position = position + 1
+        return posting
+
+    def find(self, text, prefix=False):
+        """
+        :param prefix: match the words of the text as prefixes of the entities' words, instead of as whole words
+        :return: the entities having every word of the text (None if the text has no words), in the order they
+        were indexed
+        """
+        words = set(tokenize(text))
+        if len(words) == 0:
+            return None
+
+        postings = [self.__prefix_posting(word) if prefix else self.__postings.get(word, {}) for word in words]
+        postings.sort(key=len)
+        matches = [(entity_id, entity) for entity_id, entity in postings[0].items()
+                   if all(entity_id in posting for posting in postings[1:])]
+        # the prefix postings are merged by word, and an updated entity is added at the end of its new words' postings
+        matches.sort(key=lambda match: self.__sequences[match[0]])
+        return [entity for entity_id, entity in matches]
+
+
+class TrigramIndex:
+    """
+    Index of the three-character substrings of one text attribute: trigram -> {entity id: entity}, case-insensitive.
+    A substring query intersects the postings of its trigrams and only checks the candidates' texts.
+    """
+    SIZE = 3
+
+    def __init__(self):
+        self.__postings = {}
+        self.__texts = {}  # entity id -> lowercase text
+
+    @classmethod
+    def trigrams(cls, text):
+        return {text[position:position + cls.SIZE] for position in range(len(text) - cls.SIZE + 1)}
+
+    def add(self, entity_id, entity, text):
+        text = text.lower()
+        self.__texts[entity_id] = text
+        for trigram in self.trigrams(text):
+            self.__postings.setdefault(trigram, {})[entity_id] = entity
+
+    def remove(self, entity_id):
+        text = self.__texts.pop(entity_id, None)
+        if text is None:
+            return
+        for trigram in self.trigrams(text):
+            posting = self.__postings[trigram]
+            del posting[entity_id]
+            if len(posting) == 0:
+                del self.__postings[trigram]
+
+    def find(self, text):
+        """
+        :return: the entities whose text contains the given text, in the order they were indexed; None if the text is
+        shorter than a trigram (the entities have to be scanned)
+        """
+        text = text.lower()
+        if len(text) < self.SIZE:
+            return None
+
+        postings = []
+        for trigram in self.trigrams(text):
+            posting = self.__postings.get(trigram)
+            if posting is None:
+                return []
+            postings.append(posting)
+        postings.sort(key=len)
+        return [entity for entity_id, entity in postings[0].items()
+                if all(entity_id in posting for posting in postings[1:]) and text in self.__texts[entity_id]]
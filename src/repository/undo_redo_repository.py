@@ -1,8 +1,66 @@
+import json
+import os
+import sys
+
 from src.iterable_data_structure import MyIterator
+from src.repository.text_file_log import replace_file
+from src.repository.write_behind_buffer import DirectFileWriter
+
+
+def _size_of(value):
+    """
+    :return: the size of the value, with the values of the lists and tuples it holds (e.g. the rows of the rentals
+    restored by a command)
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        size = size + sum(_size_of(item) for item in value)
+    return size
+
+
+def estimated_size(objects):
+    """
+    Rough number of bytes held by the objects of a history step: the list and its commands, either (opcode, *args)
+    tuples or UndoRedoEntity objects with their bound methods (the services the methods are bound to are shared, so
+    they are not counted), with their arguments.
+    """
+    size = sys.getsizeof(objects)
+    if not isinstance(objects, (list, tuple, MyIterator)):
+        return size
+
+    for command in objects:
+        size = size + sys.getsizeof(command)
+        if isinstance(command, tuple):
+            size = size + sum(_size_of(arg) for arg in command)
+            continue
+        args = getattr(command, "args", None)
+        if args is not None:
+            size = size + sys.getsizeof(command.method) + sys.getsizeof(args) + sum(sys.getsizeof(arg) for arg in args)
+    return size
 
 
 class UndoRedoRepository:
-    def __init__(self):
+    """
+    Undo and redo stacks of history steps: the operations that undo (or redo) a change, and their converses.
+    With a file_name, the changes to the stacks are also appended to that file, one JSON record per line, and
+    replayed when the repository is created again; the steps must then be lists of (opcode, *args) commands.
+    """
+    # records of the history file
+    __PUSH_UNDO = "U"  # ["U", operations, converses]
+    __PUSH_REDO = "R"  # ["R", operations, converses]
+    __POP_UNDO = "u"
+    __POP_REDO = "r"
+    __CLEAR_REDO = "c"
+
+    def __init__(self, max_steps=None, max_bytes=None, file_name=None, write_buffer=None):
+        """
+        :param max_steps: maximum number of undo and redo steps kept, None for no limit
+        :param max_bytes: maximum estimated size of the history in bytes (see estimated_size), None for no limit
+        The oldest undo steps are evicted first, then the redo steps furthest from the current state; the last undo
+        and the next redo step are always kept.
+        :param file_name: file the history is kept in, None to keep it in memory only
+        :param write_buffer: WriteBehindBuffer for the history records, None to write them at once
+        """
         # self._undo_operations = []
         # self._undo_converses = []
         # self._redo_operations = []
@@ -11,6 +69,18 @@ class UndoRedoRepository:
         self._undo_converses = MyIterator()
         self._redo_operations = MyIterator()
         self._redo_converses = MyIterator()
+        self.__max_steps = max_steps
+        self.__max_bytes = max_bytes
+        self.__undo_sizes = MyIterator()  # estimated size of every complete undo step (operations and converses)
+        self.__redo_sizes = MyIterator()
+        self.__estimated_bytes = 0
+        self.__evicted_steps = 0
+        self.__file_name = file_name
+        self.__writer = DirectFileWriter() if write_buffer is None else write_buffer
+        self.__record_count = 0
+        self.__replaying = False
+        if file_name is not None:
+            self.__load_history()
 
     @property
     def undo_operations(self):
@@ -45,8 +115,15 @@ class UndoRedoRepository:
 
     def add_undo_converse(self, objects):
         self._undo_converses.append(objects)
+        size = estimated_size(self._undo_operations[-1]) + estimated_size(objects)
+        self.__undo_sizes.append(size)
+        self.__estimated_bytes = self.__estimated_bytes + size
+        self.__log([self.__PUSH_UNDO, self._undo_operations[-1], objects])
+        self.__evict()
 
     def remove_undo(self):
+        self.__estimated_bytes = self.__estimated_bytes - self.__undo_sizes.pop()
+        self.__log([self.__POP_UNDO])
         return self._undo_operations.pop(), self._undo_converses.pop()
 
     def add_redo_operation(self, objects):
@@ -54,10 +131,115 @@ class UndoRedoRepository:
 
     def add_redo_converse(self, objects):
         self._redo_converses.append(objects)
+        size = estimated_size(self._redo_operations[-1]) + estimated_size(objects)
+        self.__redo_sizes.append(size)
+        self.__estimated_bytes = self.__estimated_bytes + size
+        self.__log([self.__PUSH_REDO, self._redo_operations[-1], objects])
+        self.__evict()
 
     def remove_redo(self):
+        self.__estimated_bytes = self.__estimated_bytes - self.__redo_sizes.pop()
+        self.__log([self.__POP_REDO])
         return self._redo_operations.pop(), self._redo_converses.pop()
 
     def clear_redo(self):
+        if len(self._redo_operations) > 0:
+            self.__log([self.__CLEAR_REDO])
         self._redo_operations.clear()
         self._redo_converses.clear()
+        for size in self.__redo_sizes:
+            self.__estimated_bytes = self.__estimated_bytes - size
+        self.__redo_sizes.clear()
+
+    def __log(self, record):
+        """
+        Appends the record to the history file, if there is one; the file is compacted once most of its records are
+        about steps that are gone.
+        """
+        if self.__file_name is None or self.__replaying:
+            return
+
+        self.__writer.append(self.__file_name, json.dumps(record, separators=(',', ':')) + '\n')
+        self.__record_count = self.__record_count + 1
+        if self.__record_count > 2 * (len(self._undo_operations) + len(self._redo_operations)) + 100:
+            self.compact()
+
+    def compact(self):
+        """
+        Rewrites the history file with a record per step that is still in the history.
+        """
+        if self.__file_name is None:
+            return
+
+        lines = []
+        for record_type, operations, converses in [(self.__PUSH_UNDO, self._undo_operations, self._undo_converses),
+                                                   (self.__PUSH_REDO, self._redo_operations, self._redo_converses)]:
+            for index in range(len(operations)):
+                lines.append(json.dumps([record_type, operations[index], converses[index]], separators=(',', ':')) +
+                             '\n')
+        replace_file(self.__file_name, lines, self.__writer)
+        self.__record_count = len(lines)
+
+    @staticmethod
+    def __to_step(commands):
+        return [tuple(command) for command in commands]
+
+    def __load_history(self):
+        """
+        Replays the records of the history file (the limits of this repository apply), then compacts it.
+        """
+        if not os.path.exists(self.__file_name):
+            return
+
+        self.__replaying = True
+        with open(self.__file_name) as file_pointer:
+            for line in file_pointer:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # a partially written last record
+                if record[0] == self.__PUSH_UNDO:
+                    self.add_undo_operation(self.__to_step(record[1]))
+                    self.add_undo_converse(self.__to_step(record[2]))
+                elif record[0] == self.__PUSH_REDO:
+                    self.add_redo_operation(self.__to_step(record[1]))
+                    self.add_redo_converse(self.__to_step(record[2]))
+                elif record[0] == self.__POP_UNDO and not self.is_undo_empty():
+                    self.remove_undo()
+                elif record[0] == self.__POP_REDO and not self.is_redo_empty():
+                    self.remove_redo()
+                elif record[0] == self.__CLEAR_REDO:
+                    self.clear_redo()
+        self.__replaying = False
+        self.compact()
+
+    def __is_over_limits(self):
+        if self.__max_steps is not None and len(self._undo_operations) + len(self._redo_operations) > self.__max_steps:
+            return True
+        return self.__max_bytes is not None and self.__estimated_bytes > self.__max_bytes
+
+    def __evict(self):
+        """
+        Removes the oldest undo steps, then the redo steps at the bottom of the redo stack, while the history is over
+        its limits.
+        """
+        while self.__is_over_limits():
+            if len(self.__undo_sizes) > 1:
+                operations, converses, sizes = self._undo_operations, self._undo_converses, self.__undo_sizes
+            elif len(self.__redo_sizes) > 1:
+                operations, converses, sizes = self._redo_operations, self._redo_converses, self.__redo_sizes
+            else:
+                return
+            del operations[0]
+            del converses[0]
+            self.__estimated_bytes = self.__estimated_bytes - sizes[0]
+            del sizes[0]
+            self.__evicted_steps = self.__evicted_steps + 1
+
+    def stats(self):
+        """
+        :return: dictionary with the number of undo and redo steps, their estimated size in bytes and the number of
+        steps evicted so far
+        """
+        return {"undo_steps": len(self._undo_operations), "redo_steps": len(self._redo_operations),
+                "estimated_bytes": self.__estimated_bytes, "evicted_steps": self.__evicted_steps}
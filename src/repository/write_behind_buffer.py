@@ -0,0 +1,205 @@
+import os
+import threading
+
+
+class DirectFileWriter(object):
+    """
+    Writer used by the file repositories when there is no write-behind buffer: every write goes to the file at once.
+    """
+
+    @staticmethod
+    def append(file_name, data):
+        """
+        Appends the data (str for the text files, bytes for the binary files) to the end of the file.
+        """
+        with open(file_name, 'a' if isinstance(data, str) else 'ab') as file_pointer:
+            file_pointer.write(data)
+
+    @staticmethod
+    def write_at(file_name, offset, data):
+        """
+        Writes the bytes at the given offset of the file.
+        """
+        with open(file_name, 'r+b') as file_pointer:
+            file_pointer.seek(offset)
+            file_pointer.write(data)
+
+    def discard(self, *file_names):
+        """
+        Called before a file is replaced or emptied: its pending writes are not needed anymore.
+        """
+        pass
+
+    def flush(self):
+        pass
+
+    def add_dependency(self, file_name, dependency_file_name):
+        """
+        Called when file_name points into dependency_file_name (the records of a binary file and its heap).
+        """
+        pass
+
+    def mark_boundary(self):
+        """
+        Called when an operation that can be undone is complete.
+        """
+        pass
+
+    def hold(self):
+        """
+        Called when a transaction starts: its writes should reach the files together, when it ends.
+        """
+        pass
+
+    def release(self):
+        """
+        Called when a transaction ends.
+        """
+        pass
+
+
+class WriteBehindBuffer(DirectFileWriter):
+    """
+    Write-behind buffer shared by the file repositories: their writes are kept in memory and written together
+    (one open and one write call per run of consecutive writes to a file, then an optional fsync).
+    The buffer is flushed after max_operations writes, max_delay milliseconds after the oldest pending write (if
+    max_delay is not 0), at every undo boundary with flush_on_undo, and on flush() or close().
+    Between hold() and release() (a transaction) only flush() writes the files, so the transaction is written at once.
+    The files are written in the order of their first pending write, except that the files a file depends on (see
+    add_dependency) are written before it (the heap of a binary repository before its records). Only with fsync is
+    each file synced before the next one is written, so that a file never points into data that did not reach the
+    disk; otherwise the operating system may store the written files in any order.
+    Until they are flushed, the writes are only in memory: a repository opened on the same files again (or mapped,
+    or read with iter_file_entities) does not see them, only the repository that made them does.
+    """
+
+    def __init__(self, max_operations=100, max_delay=0, flush_on_undo=True, fsync=False):
+        self.__max_operations = max_operations
+        self.__max_delay = max_delay
+        self.__flush_on_undo = flush_on_undo
+        self.__fsync = fsync
+        # file name -> list of [offset (None for an append), data chunks, length], in the order they were made
+        self.__pending = {}
+        self.__operation_count = 0
+        self.__timer = None
+        self.__held = 0  # number of hold() calls not released yet
+        self.__dependencies = {}  # file name -> names of the files it points into
+        self.__lock = threading.RLock()
+
+    @property
+    def pending_count(self):
+        return self.__operation_count
+
+    def __add(self, file_name, offset, data):
+        with self.__lock:
+            writes = self.__pending.setdefault(file_name, [])
+            last = writes[-1] if len(writes) > 0 else None
+            if last is not None and offset is None and last[0] is None or \
+                    last is not None and offset is not None and last[0] is not None and offset == last[0] + last[2]:
+                last[1].append(data)  # consecutive appends, and contiguous writes, are written together
+                last[2] = last[2] + len(data)
+            else:
+                writes.append([offset, [data], len(data)])
+
+            self.__operation_count = self.__operation_count + 1
+            self.__schedule_flush()
+
+    def __schedule_flush(self):
+        if self.__held > 0 or self.__operation_count == 0:
+            return
+        if self.__operation_count >= self.__max_operations:
+            self.flush()
+        elif self.__max_delay > 0 and self.__timer is None:
+            self.__timer = threading.Timer(self.__max_delay / 1000, self.flush)
+            self.__timer.daemon = True
+            self.__timer.start()
+
+    def append(self, file_name, data):
+        self.__add(file_name, None, data)
+
+    def write_at(self, file_name, offset, data):
+        self.__add(file_name, offset, data)
+
+    def discard(self, *file_names):
+        with self.__lock:
+            for file_name in file_names:
+                self.__pending.pop(file_name, None)
+
+    def __write_file(self, file_name, writes):
+        binary = not isinstance(writes[0][1][0], str)
+        if not binary:
+            mode = 'a'
+        elif all(offset is None for offset, chunks, length in writes):
+            mode = 'ab'
+        else:
+            mode = 'r+b'
+
+        with open(file_name, mode) as file_pointer:
+            for offset, chunks, length in writes:
+                if not binary:
+                    file_pointer.write("".join(chunks))
+                    continue
+                if offset is None:
+                    file_pointer.seek(0, os.SEEK_END)
+                else:
+                    file_pointer.seek(offset)
+                file_pointer.write(b"".join(chunks))
+            if self.__fsync:
+                file_pointer.flush()
+                os.fsync(file_pointer.fileno())
+
+    def flush(self):
+        """
+        Writes all the pending writes to the files.
+        """
+        with self.__lock:
+            if self.__timer is not None:
+                self.__timer.cancel()
+                self.__timer = None
+            pending, self.__pending = self.__pending, {}
+            for file_name in self.__flush_order(pending):
+                self.__write_file(file_name, pending[file_name])
+            self.__operation_count = 0
+
+    def add_dependency(self, file_name, dependency_file_name):
+        with self.__lock:
+            self.__dependencies.setdefault(file_name, set()).add(dependency_file_name)
+
+    def __flush_order(self, pending):
+        """
+        :return: the names of the files with pending writes, each one after the files it depends on
+        """
+        order = []
+        visited = set()
+
+        def visit(file_name):
+            if file_name in visited:
+                return
+            visited.add(file_name)
+            for dependency_file_name in self.__dependencies.get(file_name, ()):
+                visit(dependency_file_name)
+            if file_name in pending:
+                order.append(file_name)
+
+        for file_name in pending:
+            visit(file_name)
+        return order
+
+    def mark_boundary(self):
+        if self.__flush_on_undo and self.__held == 0:
+            self.flush()
+
+    def hold(self):
+        with self.__lock:
+            self.__held = self.__held + 1
+            if self.__timer is not None:  # restarted by release()
+                self.__timer.cancel()
+                self.__timer = None
+
+    def release(self):
+        with self.__lock:
+            self.__held = self.__held - 1
+            self.__schedule_flush()
+
+    def close(self):
+        self.flush()
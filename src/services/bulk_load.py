@@ -0,0 +1,36 @@
+from operator import itemgetter
+
+
+def bulk_load_rows(rows, entity_class, field_count, bulk_load, check=None):
+    """
+    Builds one entity per row (its attributes, e.g. the fields of a CSV line) and adds them all with bulk_load.
+    The rows that do not have the right number of fields, fail the check or are rejected by bulk_load are skipped.
+    :param field_count: number of attributes of the entity
+    :param bulk_load: the bulk_load method of the repository
+    :param check: function(entity) returning the reason the entity can not be added, None if it can
+    :return: (list of the added entities, list of (position, row, error message) for the rejected rows)
+    """
+    entities = []
+    sources = []  # (position, row) of every entity
+    rejected = []
+    for position, row in enumerate(rows):
+        if len(row) != field_count:
+            rejected.append((position, row, "The row has " + str(len(row)) + " fields instead of " +
+                             str(field_count) + "."))
+            continue
+
+        entity = entity_class(*row)
+        error = None if check is None else check(entity)
+        if error is not None:
+            rejected.append((position, row, error))
+            continue
+
+        entities.append(entity)
+        sources.append((position, row))
+
+    loaded, rejected_entities = bulk_load(entities)
+    for index, entity, error in rejected_entities:
+        position, row = sources[index]
+        rejected.append((position, row, error))
+    rejected.sort(key=itemgetter(0))
+    return loaded, rejected
@@ -1,6 +1,7 @@
 from src.domain.entities import Client
 from src.repository.client_repository import ClientRepositoryException
 from src.domain.validators import MiscellaneousValidatorException, MiscellaneousValidator
+from src.services.bulk_load import bulk_load_rows
 
 import random
 
@@ -39,6 +40,13 @@ class ClientService:
         self.__client_repository.update_entity_by_id(client_id, new_client)
         return old_client_id, old_name
 
+    def bulk_load(self, rows):
+        """
+        Adds a client per row ([client id, name]) in a single pass over the rows; the bad rows are skipped.
+        :return: (list of the added clients, list of (position, row, error message) for the rejected rows)
+        """
+        return bulk_load_rows(rows, Client, 2, self.__client_repository.bulk_load)
+
     @property
     def list_clients(self):
         return self.__client_repository.get_all_entities
@@ -55,8 +63,13 @@ class ClientService:
         except MiscellaneousValidatorException as mve:
             raise ClientRepositoryException(mve)
 
-        search_results = []
         entities = self.list_clients
+        if attribute == "name" and hasattr(self.__client_repository, "find_by_name_fragment"):
+            search_results = self.__client_repository.find_by_name_fragment(search)
+            if search_results is not None:
+                return search_results
+
+        search_results = []
         for entity in entities:
             if search.lower() in getattr(entity, attribute).lower():
                 search_results.append(entity)
@@ -3,6 +3,8 @@ import random
 from src.domain.entities import Movie
 from src.domain.validators import MiscellaneousValidator, MiscellaneousValidatorException
 from src.repository.movie_repository import MovieRepositoryException
+from src.repository.text_index import tokenize
+from src.services.bulk_load import bulk_load_rows
 
 
 class MovieService:
@@ -39,11 +41,25 @@ class MovieService:
         self.__movie_repository.update_entity_by_id(movie_id, new_movie)
         return old_movie_id, old_title, old_description, old_genre
 
+    def bulk_load(self, rows):
+        """
+        Adds a movie per row ([movie id, title, description, genre]) in a single pass over the rows; the bad rows are
+        skipped.
+        :return: (list of the added movies, list of (position, row, error message) for the rejected rows)
+        """
+        return bulk_load_rows(rows, Movie, 4, self.__movie_repository.bulk_load)
+
     @property
     def list_movies(self):
         return self.__movie_repository.get_all_entities
 
-    def search_by_attribute(self, attribute, search):
+    def search_by_attribute(self, attribute, search, match="substring"):
+        """
+        :param match: "substring" (the search text anywhere in the attribute), "word" (every word of the search text
+        is a word of the attribute) or "prefix" (every word of the search text starts a word of the attribute); the
+        words are looked up in the repository's index when it has one, and a search text without words falls back
+        to the substring search
+        """
         if attribute == "movie_id":
             try:
                 MiscellaneousValidator.is_positive_integer(search)
@@ -55,14 +71,63 @@ class MovieService:
         except MiscellaneousValidatorException as mve:
             raise MovieRepositoryException(mve)
 
-        search_results = []
+        if match not in ("substring", "word", "prefix"):
+            raise MovieRepositoryException("The match must be substring, word or prefix.")
+
         entities = self.list_movies
+        if match != "substring" and attribute != "movie_id":
+            search_results = self.__search_words(entities, attribute, search, match == "prefix")
+            if search_results is not None:
+                return search_results
+
+        search_results = []
         for entity in entities:
             if search.lower() in getattr(entity, attribute).lower():
                 search_results.append(entity)
 
         return search_results
 
+    def filter_by_genre(self, genre):
+        """
+        :return: list of the movies of exactly the given genre, found through the repository's genre index
+        """
+        try:
+            MiscellaneousValidator.is_nonempty_string(genre)
+        except MiscellaneousValidatorException as mve:
+            raise MovieRepositoryException(mve)
+
+        return self.__movie_repository.find_by_genre(genre)
+
+    def genre_counts(self):
+        """
+        :return: list of (genre, number of movies) pairs, sorted by genre
+        """
+        genre_counts = self.__movie_repository.genre_counts()
+        if len(genre_counts) == 0:
+            raise MovieRepositoryException("The list of movies is empty.")
+
+        return sorted(genre_counts.items())
+
+    def __search_words(self, entities, attribute, search, prefix):
+        """
+        :return: the movies having every word of the search text, None if it has no words
+        """
+        if hasattr(self.__movie_repository, "find_by_words"):
+            return self.__movie_repository.find_by_words(attribute, search, prefix)
+
+        words = set(tokenize(search))
+        if len(words) == 0:
+            return None
+        search_results = []
+        for entity in entities:
+            entity_words = set(tokenize(getattr(entity, attribute)))
+            if prefix:
+                if all(any(entity_word.startswith(word) for entity_word in entity_words) for word in words):
+                    search_results.append(entity)
+            elif words <= entity_words:
+                search_results.append(entity)
+        return search_results
+
     def assign_random(self):
         counter = 1
         title = ["Creative", "No regrets", "Alone", "Alone 2", "For kids 1", "For kids 2", "For kids 3", "Sailor"]
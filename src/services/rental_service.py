@@ -1,20 +1,33 @@
+import heapq
 import random
 import datetime
 from operator import itemgetter
 
-from src.iterable_data_structure import my_filter, my_sort
-from src.domain.entities import Rental
-from src.domain.validators import RentalValidator, RentalValidatorException
+from src.iterable_data_structure import my_sort
+from src.domain.entities import Rental, date_to_ordinal
+from src.domain.validators import RentalValidator, RentalValidatorException, MiscellaneousValidator, \
+    MiscellaneousValidatorException
 from src.repository.client_repository import ClientRepositoryException
 from src.repository.movie_repository import MovieRepositoryException
 from src.repository.rental_repository import RentalRepositoryException
+from src.repository.rental_statistics import is_vectorization_available, vectorized_days_rented, \
+    vectorized_overdue_rows
+from src.services.bulk_load import bulk_load_rows
 
 
 class RentalService:
-    def __init__(self, client_repository, movie_repository, rental_repository):
+    def __init__(self, client_repository, movie_repository, rental_repository, vectorized=False,
+                 enforce_availability=False):
+        """
+        :param vectorized: compute the statistics with NumPy over the rentals taken as columns (ignored if NumPy is
+        missing)
+        :param enforce_availability: refuse the rentals of a movie that is already rented in the same period
+        """
         self.__client_repository = client_repository
         self.__movie_repository = movie_repository
         self.__rental_repository = rental_repository
+        self.__vectorized = vectorized and is_vectorization_available()
+        self.__enforce_availability = enforce_availability
 
     def make_date_object(self, string):
         return datetime.datetime.strptime(string, "%d.%m.%Y")
@@ -31,9 +44,8 @@ class RentalService:
         if self.__client_repository.find_by_id(rental.client_id) is None:
             raise RentalRepositoryException("The given client id does not exist.")
 
-        if (self.make_date_object(rental.rented_date) > self.make_date_object(rental.due_date)) or \
-                (rental.returned_date != "N.A." and self.make_date_object(rental.returned_date) <
-                 self.make_date_object(rental.rented_date)):
+        if (rental.rented_ordinal > rental.due_ordinal) or \
+                (rental.returned_date != "N.A." and rental.returned_ordinal < rental.rented_ordinal):
             raise RentalRepositoryException("The dates are not in logical order.")
 
         return True
@@ -61,17 +73,16 @@ class RentalService:
         if self.__rental_repository.find_by_id(rental_id) is not None:
             raise RentalRepositoryException("Can not add rental because the rental id already exists!")
 
-        try:
-            entities = self.__rental_repository.get_all_entities
-            now = datetime.datetime.now()
-            for entity in entities:
-                if entity.client_id == client_id:
-                    if entity.returned_date == "N.A." and self.make_date_object(entity.due_date) < now:
-                        raise RentalRepositoryException(
-                            "Can not rent a movie. The client has an unreturned movie that passed "
-                            "it's due date for return.")
-        except RentalRepositoryException:
-            pass  # pass in case the list of rentals is empty
+        if self.__enforce_availability and \
+                not self.__rental_repository.is_movie_available(movie_id, rental.rented_ordinal,
+                                                                rental.returned_ordinal):
+            raise RentalRepositoryException("The movie is already rented in that period.")
+
+        today = datetime.date.today().toordinal()
+        if len(self.__rental_repository.find_overdue(today + 1, client_id)) > 0:  # due today at the latest
+            raise RentalRepositoryException(
+                "Can not rent a movie. The client has an unreturned movie that passed "
+                "it's due date for return.")
 
         self.__rental_repository.add_entity(rental)
 
@@ -83,6 +94,17 @@ class RentalService:
         removed_rental = self.__rental_repository.remove_by_id(rental_id)
         return removed_rental
 
+    def restore_rentals(self, rows):
+        """
+        Converse of the removal of the rentals of a client or movie, used in undo/redo: the rentals are added back with
+        one bulk load (a single indexed pass and one write), without add_rental's checks, as they were valid when they
+        were removed; the ones whose id was taken since are skipped.
+        :param rows: [rental id, movie id, client id, rented date, due date, returned date] of each rental
+        :return: the restored rentals
+        """
+        restored, rejected = self.__rental_repository.bulk_load([Rental(*row) for row in rows])
+        return restored
+
     def return_movie(self, rental_id):
         if len(self.__rental_repository.get_all_entities) == 0:
             raise ClientRepositoryException("Can not return movie - the list of rentals is empty.")
@@ -95,15 +117,83 @@ class RentalService:
             raise RentalRepositoryException("The movie was already returned!")
 
         now = datetime.datetime.now()
-        rental = self.__rental_repository.find_by_id(rental_id)
-        rental.returned_date = str(str(now.day) + '.' + str(now.month) + '.' + str(now.year))
+        rental = Rental(current.rental_id, current.movie_id, current.client_id, current.rented_date, current.due_date,
+                        str(str(now.day) + '.' + str(now.month) + '.' + str(now.year)))
         self.__rental_repository.update_entity_by_id(rental_id, rental)
 
     def un_return_movie(self, rental_id):
-        rental = self.__rental_repository.find_by_id(rental_id)
-        rental.returned_date = "N.A."
+        current = self.__rental_repository.find_by_id(rental_id)
+        if self.__enforce_availability and current.returned_ordinal is not None and \
+                not self.__rental_repository.is_movie_available(current.movie_id, current.returned_ordinal):
+            raise RentalRepositoryException("The movie was rented again after it was returned.")
+        rental = Rental(current.rental_id, current.movie_id, current.client_id, current.rented_date, current.due_date,
+                        "N.A.")
         self.__rental_repository.update_entity_by_id(rental_id, rental)
 
+    def __bulk_rental_error(self, rental):
+        """
+        The checks of is_valid_rental that the repository does not do.
+        :return: the reason the rental can not be added, None if it can
+        """
+        try:
+            if self.__movie_repository.find_by_id(rental.movie_id) is None:
+                return "The given movie id does not exist."
+            if self.__client_repository.find_by_id(rental.client_id) is None:
+                return "The given client id does not exist."
+        except (MovieRepositoryException, ClientRepositoryException) as error:
+            return str(error)
+
+        if rental.rented_ordinal is None or rental.due_ordinal is None:
+            return None  # invalid dates, rejected by the repository's validation
+        if (rental.rented_ordinal > rental.due_ordinal) or \
+                (rental.returned_ordinal is not None and rental.returned_ordinal < rental.rented_ordinal):
+            return "The dates are not in logical order."
+        if self.__enforce_availability and \
+                not self.__rental_repository.is_movie_available(rental.movie_id, rental.rented_ordinal,
+                                                                rental.returned_ordinal):
+            return "The movie is already rented in that period."
+        return None
+
+    def bulk_load(self, rows):
+        """
+        Adds a rental per row ([rental id, movie id, client id, rented date, due date, returned date]) in a single
+        pass over the rows, without add_rental's checks on the other rentals (the availability of the movies is only
+        checked against the rentals added before the bulk load); the bad rows are skipped.
+        :return: (list of the added rentals, list of (position, row, error message) for the rejected rows)
+        """
+        return bulk_load_rows(rows, Rental, 6, self.__rental_repository.bulk_load, self.__bulk_rental_error)
+
+    @staticmethod
+    def __to_ordinal(date):
+        ordinal = date_to_ordinal(date)
+        if ordinal is None:
+            raise RentalRepositoryException("The date is not valid: " + str(date))
+        return ordinal
+
+    def is_movie_available(self, movie_id, date, until=None):
+        """
+        :param until: last day of the period (dd.mm.yyyy), None for the date alone
+        :return: True if the movie is not rented on any day from date (dd.mm.yyyy) to until
+        """
+        if self.__movie_repository.find_by_id(movie_id) is None:
+            raise RentalRepositoryException("The movie does not exist.")
+
+        start_ordinal = self.__to_ordinal(date)
+        end_ordinal = start_ordinal if until is None else self.__to_ordinal(until)
+        if end_ordinal < start_ordinal:
+            raise RentalRepositoryException("The dates are not in logical order.")
+        return self.__rental_repository.is_movie_available(movie_id, start_ordinal, end_ordinal + 1)
+
+    def find_available_movies(self, date=None):
+        """
+        :param date: dd.mm.yyyy, None for today
+        :return: list of the movies that are not rented on the date
+        """
+        movies = self.__movie_repository.get_all_entities
+        ordinal = datetime.date.today().toordinal() if date is None else self.__to_ordinal(date)
+        return [movie for movie in movies
+                if self.__rental_repository.is_movie_available(movie.movie_id, ordinal, ordinal + 1)]
+
     @property
     def list_rentals(self):
         rentals = self.__rental_repository.get_all_entities
@@ -128,95 +218,167 @@ class RentalService:
             except RentalRepositoryException:
                 pass
 
-    @property
-    def get_movie_statistics(self):
-        movies = self.__movie_repository.get_all_entities
+    def __rental_columns(self):
+        """
+        The rentals as columns, for the vectorized statistics; 0 stands for a returned date of "N.A.". The columnar
+        repository hands out its own columns, the other repositories are copied into columns on every call.
+        :return: (movie ids, client ids, rented, due, returned ordinals) or None when the statistics are not
+        vectorized
+        """
+        if not self.__vectorized:
+            return None
+        if hasattr(self.__rental_repository, "columns"):
+            return self.__rental_repository.columns()[1:]
+
         rentals = self.__rental_repository.get_all_entities
+        return ([int(rental.movie_id) for rental in rentals], [int(rental.client_id) for rental in rentals],
+                [rental.rented_ordinal for rental in rentals], [rental.due_ordinal for rental in rentals],
+                [rental.returned_ordinal or 0 for rental in rentals])
+
+    def __days_rented_per_movie(self, today):
+        """
+        :return: dictionary movie id -> total number of days rented, for the movies that have rentals
+        """
+        columns = self.__rental_columns()
+        if columns is not None:
+            movie_ids, client_ids, rented, due, returned = columns
+            return vectorized_days_rented(movie_ids, rented, returned, today)
+        return self.__rental_repository.days_rented_per_movie(today)
+
+    def __build_movie_statistics(self):
+        """
+        :return: unsorted list of [days rented, movie] pairs
+        """
+        movies = self.__movie_repository.get_all_entities
+        self.__rental_repository.get_all_entities  # throws a custom exception in case there are no rentals
+        today = datetime.date.today().toordinal()
         statistics = []
 
+        days_rented = self.__days_rented_per_movie(today)
         for movie in movies:
-            days_rented = int(0)
-            for rental in rentals:
-                if movie.movie_id == rental.movie_id:
-                    rented_date = self.make_date_object(rental.rented_date)
-                    today = datetime.datetime.now()
-                    returned_date = self.make_date_object(
-                        str(today.day) + '.' + str(today.month) + '.' + str(today.year))
-                    if rental.returned_date != "N.A.":
-                        returned_date = self.make_date_object(rental.returned_date)
+            statistics.append([days_rented.get(movie.movie_id, 0), movie])
 
-                    days_rented += (returned_date - rented_date).days
-
-            statistics.append([days_rented, movie])
+        return statistics
 
-        # TODO: uncomment if working without custom sorting function
-        # statistics.sort(key=itemgetter(0), reverse=True)
+    def __build_genre_statistics(self):
+        """
+        :return: unsorted list of [days rented, genre] pairs, the days rented summed over the movies of each genre
+        """
+        genre_counts = self.__movie_repository.genre_counts()
+        self.__rental_repository.get_all_entities  # throws a custom exception in case there are no rentals
+        if len(genre_counts) == 0:
+            raise MovieRepositoryException("The list of movies is empty.")
+        today = datetime.date.today().toordinal()
 
-        # TODO: uncomment if working with custom sorting function
-        my_sort(statistics, lambda x, y: x[0] >= y[0])
+        days_per_genre = dict.fromkeys(genre_counts, 0)
+        for movie_id, days_rented in self.__days_rented_per_movie(today).items():
+            movie = self.__movie_repository.find_by_id(movie_id)
+            if movie is not None:
+                days_per_genre[movie.genre] = days_per_genre[movie.genre] + days_rented
 
-        return statistics
+        return [[days_rented, genre] for genre, days_rented in days_per_genre.items()]
 
-    @property
-    def get_client_statistics(self):
+    def __build_client_statistics(self):
+        """
+        :return: unsorted list of [days rented, client] pairs
+        """
         clients = self.__client_repository.get_all_entities
-        rentals = self.__rental_repository.get_all_entities
+        self.__rental_repository.get_all_entities  # throws a custom exception in case there are no rentals
+        today = datetime.date.today().toordinal()
         statistics = []
 
+        columns = self.__rental_columns()
+        if columns is not None:
+            movie_ids, client_ids, rented, due, returned = columns
+            days_rented = vectorized_days_rented(client_ids, rented, returned, today)
+        else:
+            days_rented = self.__rental_repository.days_rented_per_client(today)
         for client in clients:
-            days_rented = int(0)
-            for rental in rentals:
-                if client.client_id == rental.client_id:
-                    rented_date = self.make_date_object(rental.rented_date)
-                    today = datetime.datetime.now()
-                    returned_date = self.make_date_object(
-                        str(today.day) + '.' + str(today.month) + '.' + str(today.year))
-                    if rental.returned_date != "N.A.":
-                        returned_date = self.make_date_object(rental.returned_date)
+            statistics.append([days_rented.get(client.client_id, 0), client])
+
+        return statistics
+
+    def __build_rental_statistics(self):
+        """
+        :return: unsorted list of [days delayed, movie] pairs for the currently rented movies
+        """
+        self.__rental_repository.get_all_entities  # throws a custom exception in case there are no rentals
+        today = datetime.date.today().toordinal()
+        statistics = []
 
-                    days_rented += (returned_date - rented_date).days
+        columns = self.__rental_columns()
+        if columns is not None:
+            movie_ids, client_ids, rented, due, returned = columns
+            for row in vectorized_overdue_rows(due, returned, today):
+                days_delayed = today - due[row]
+                statistics.append([days_delayed, self.__movie_repository.find_by_id(str(movie_ids[row]))])
+            return statistics
 
-            statistics.append([days_rented, client])
+        for rental in self.__rental_repository.find_overdue(today):
+            days_delayed = today - rental.due_ordinal
+            statistics.append([days_delayed, self.__movie_repository.find_by_id(rental.movie_id)])
 
+        return statistics
+
+    @staticmethod
+    def __sort_statistics(statistics):
         # TODO: uncomment if working without custom sorting function
         # statistics.sort(key=itemgetter(0), reverse=True)
 
         # TODO: uncomment if working with custom sorting function
-        my_sort(statistics, lambda x, y: x[0] >= y[0])
+        my_sort(statistics, key=itemgetter(0), reverse=True)
 
         return statistics
 
+    @staticmethod
+    def __select_top_statistics(statistics, k):
+        """
+        Bounded heap selection of the k pairs with the most days, O(n log k).
+        Same order as the first k pairs of the fully sorted statistics (ties keep their original order).
+        """
+        try:
+            MiscellaneousValidator.is_positive_integer(str(k))
+        except MiscellaneousValidatorException as mve:
+            raise RentalRepositoryException("The number of results is not valid:" + " - " + str(mve))
+
+        if int(k) == 0:
+            raise RentalRepositoryException("The number of results must be greater than 0.")
+
+        return heapq.nlargest(int(k), statistics, key=itemgetter(0))
+
+    @property
+    def get_movie_statistics(self):
+        return self.__sort_statistics(self.__build_movie_statistics())
+
+    @property
+    def get_client_statistics(self):
+        return self.__sort_statistics(self.__build_client_statistics())
+
     @property
     def get_rental_statistics(self):
-        rentals = self.__rental_repository.get_all_entities
-        statistics = []
+        return self.__sort_statistics(self.__build_rental_statistics())
 
-        # TODO: uncomment if working without custom filter function
-        # for rental in rentals:
-        #     if rental.returned_date == "N.A.":
-        #         due_date = self.make_date_object(rental.due_date)
-        #         today = datetime.datetime.now()
-        #         returned_date = self.make_date_object(str(today.day) + '.' + str(today.month) + '.' + str(today.year))
-        #
-        #         if returned_date > due_date:
-        #             days_delayed = (returned_date - due_date).days
-        #             statistics.append([days_delayed, self.__movie_repository.find_by_id(rental.movie_id)])
-
-        # TODO: uncomment if working without custom filter function
-        filtered_rentals = my_filter(rentals, lambda x: x.returned_date == "N.A.")
-        for rental in filtered_rentals:
-            due_date = self.make_date_object(rental.due_date)
-            today = datetime.datetime.now()
-            returned_date = self.make_date_object(str(today.day) + '.' + str(today.month) + '.' + str(today.year))
-
-            if returned_date > due_date:
-                days_delayed = (returned_date - due_date).days
-                statistics.append([days_delayed, self.__movie_repository.find_by_id(rental.movie_id)])
+    @property
+    def get_genre_statistics(self):
+        """
+        :return: the genres by the number of days their movies were rented, as [days rented, genre] pairs
+        """
+        return self.__sort_statistics(self.__build_genre_statistics())
 
-        # TODO: uncomment if working without custom sorting function
-        # statistics.sort(key=itemgetter(0), reverse=True)
+    def get_movie_statistics_top_k(self, k):
+        """
+        :return: the k most rented movies, as [days rented, movie] pairs
+        """
+        return self.__select_top_statistics(self.__build_movie_statistics(), k)
 
-        # TODO: uncomment if working with custom sorting function
-        my_sort(statistics, lambda x, y: x[0] >= y[0])
+    def get_client_statistics_top_k(self, k):
+        """
+        :return: the k most active clients, as [days rented, client] pairs
+        """
+        return self.__select_top_statistics(self.__build_client_statistics(), k)
 
-        return statistics
+    def get_rental_statistics_top_k(self, k):
+        """
+        :return: the k latest currently rented movies, as [days delayed, movie] pairs
+        """
+        return self.__select_top_statistics(self.__build_rental_statistics(), k)
@@ -1,3 +1,5 @@
+from contextlib import contextmanager
+
 from src.domain.entities import UndoRedoEntity
 from src.repository.client_repository import ClientRepositoryException
 from src.repository.movie_repository import MovieRepositoryException
@@ -8,112 +10,169 @@ class UndoRedoServiceException(Exception):
     pass
 
 
+# opcodes of the undo/redo commands: (opcode, *arguments) tuples, run through UndoRedoService's dispatch table
+ADD_CLIENT = 1
+REMOVE_CLIENT = 2
+UPDATE_CLIENT = 3
+ADD_MOVIE = 4
+REMOVE_MOVIE = 5
+UPDATE_MOVIE = 6
+ADD_RENTAL = 7
+REMOVE_RENTAL = 8
+RETURN_MOVIE = 9
+UN_RETURN_MOVIE = 10
+RESTORE_RENTALS = 11
+
+
 class UndoRedoService:
-    def __init__(self, undo_redo_repository, client_service, movie_service, rental_service):
+    def __init__(self, undo_redo_repository, client_service, movie_service, rental_service, write_buffer=None):
+        """
+        :param write_buffer: WriteBehindBuffer of the file repositories, told when an operation is complete
+        """
         self.__undo_redo_repository = undo_redo_repository
         self.__client_service = client_service
         self.__movie_service = movie_service
         self.__rental_service = rental_service
+        self.__write_buffer = write_buffer
+        self.__commands = {ADD_CLIENT: client_service.add_client, REMOVE_CLIENT: client_service.remove_client,
+                           UPDATE_CLIENT: client_service.update_client, ADD_MOVIE: movie_service.add_movie,
+                           REMOVE_MOVIE: movie_service.remove_movie, UPDATE_MOVIE: movie_service.update_movie,
+                           ADD_RENTAL: rental_service.add_rental, REMOVE_RENTAL: rental_service.remove_rental,
+                           RETURN_MOVIE: rental_service.return_movie, UN_RETURN_MOVIE: rental_service.un_return_movie,
+                           RESTORE_RENTALS: rental_service.restore_rentals}
+        self.__transaction = None  # (undo operations, undo converses) of the steps of the open transaction
+
+    def __mark_boundary(self):
+        if self.__write_buffer is not None:
+            self.__write_buffer.mark_boundary()
+
+    def __execute(self, command):
+        """
+        Runs an (opcode, *arguments) command, or an UndoRedoEntity.
+        """
+        if isinstance(command, UndoRedoEntity):
+            command.method(*command.args)
+        else:
+            self.__commands[command[0]](*command[1:])
+
+    def __run_quietly(self, commands):
+        for command in commands:
+            try:
+                self.__execute(command)
+            except (RentalRepositoryException, MovieRepositoryException, ClientRepositoryException):
+                pass
+
+    @contextmanager
+    def transaction(self):
+        """
+        Groups the operations done (and recorded with the handlers) in the with block into one undo/redo step, so
+        each operation sees, and is validated against, the ones before it, but the block is undone all at once.
+        The writes of the file repositories are held by the write-behind buffer, if there is one, and written together
+        at the end of the block.
+        If the block raises an exception, the operations recorded so far are undone and the exception is raised again.
+        A transaction opened inside another one is part of it.
+        """
+        if self.__transaction is not None:
+            yield
+            return
+
+        self.__transaction = ([], [])
+        if self.__write_buffer is not None:
+            self.__write_buffer.hold()
+        try:
+            yield
+            operations, converses = self.__transaction
+            if len(operations) > 0:
+                self.__undo_redo_repository.clear_redo()
+                # the steps are undone last first, and redone in the order they were done
+                self.__undo_redo_repository.add_undo_operation([operation for step in reversed(operations)
+                                                                for operation in step])
+                self.__undo_redo_repository.add_undo_converse([converse for step in converses for converse in step])
+        except BaseException:
+            for step in reversed(self.__transaction[0]):
+                self.__run_quietly(step)
+            raise
+        finally:
+            self.__transaction = None
+            if self.__write_buffer is not None:
+                self.__write_buffer.release()
+            self.__mark_boundary()
+
+    @staticmethod
+    def __restore_rentals_command(removed_rentals):
+        """
+        :return: the command that adds the removed rentals back, all at once
+        """
+        return RESTORE_RENTALS, [(rental.rental_id, rental.movie_id, rental.client_id, rental.rented_date,
+                                  rental.due_date, rental.returned_date) for rental in removed_rentals]
 
     def add_client_handler(self, client_id, name):
         self.clear_redo()  # redo is cleared after every operation that changes data!!!
-        undo_operation_objects = [UndoRedoEntity(self.__client_service.remove_client, client_id)]
-        undo_converse_objects = [UndoRedoEntity(self.__client_service.add_client, client_id, name)]
+        undo_operation_objects = [(REMOVE_CLIENT, client_id)]
+        undo_converse_objects = [(ADD_CLIENT, client_id, name)]
         self.add_undo_operation(undo_operation_objects)
         self.add_undo_converse(undo_converse_objects)
 
     def remove_client_handler(self, removed_client, removed_rentals):
         self.clear_redo()  # redo is cleared after every operation that changes data!!!
-        undo_operation_objects = [
-            UndoRedoEntity(self.__client_service.add_client, removed_client.client_id, removed_client.name)]
-
-        for index in range(len(removed_rentals)):
-            removed_rental = removed_rentals[index]
-            rental_id = removed_rental.rental_id
-            movie_id = removed_rental.movie_id
-            client_id = removed_rental.client_id
-            rented_date = removed_rental.rented_date
-            due_date = removed_rental.due_date
-            returned_date = removed_rental.returned_date
-            undo_operation_objects.append(
-                UndoRedoEntity(self.__rental_service.add_rental, rental_id, movie_id, client_id, rented_date,
-                               due_date, returned_date))
-
-        undo_converse_objects = [UndoRedoEntity(self.__client_service.remove_client, removed_client.client_id)]
+        undo_operation_objects = [(ADD_CLIENT, removed_client.client_id, removed_client.name)]
+        if len(removed_rentals) > 0:
+            undo_operation_objects.append(self.__restore_rentals_command(removed_rentals))
+
+        undo_converse_objects = [(REMOVE_CLIENT, removed_client.client_id)]
         self.add_undo_operation(undo_operation_objects)
         self.add_undo_converse(undo_converse_objects)
 
     def update_client_handler(self, client_id, new_name, old_client_id, old_name):
         self.clear_redo()  # redo is cleared after every operation that changes data!!!
-        undo_operation_objects = [
-            UndoRedoEntity(self.__client_service.update_client, client_id, old_client_id, old_name)]
-        undo_converse_objects = [
-            UndoRedoEntity(self.__client_service.update_client, old_client_id, client_id, new_name)]
+        undo_operation_objects = [(UPDATE_CLIENT, client_id, old_client_id, old_name)]
+        undo_converse_objects = [(UPDATE_CLIENT, old_client_id, client_id, new_name)]
         self.add_undo_operation(undo_operation_objects)
         self.add_undo_converse(undo_converse_objects)
 
     def add_movie_handler(self, movie_id, title, description, genre):
         self.clear_redo()  # redo is cleared after every operation that changes data!!!
-        undo_operation_objects = [UndoRedoEntity(self.__movie_service.remove_movie, movie_id)]
-        undo_converse_objects = [
-            UndoRedoEntity(self.__movie_service.add_movie, movie_id, title, description, genre)]
+        undo_operation_objects = [(REMOVE_MOVIE, movie_id)]
+        undo_converse_objects = [(ADD_MOVIE, movie_id, title, description, genre)]
         self.add_undo_operation(undo_operation_objects)
         self.add_undo_converse(undo_converse_objects)
 
     def remove_movie_handler(self, removed_movie, removed_rentals):
         self.clear_redo()  # redo is cleared after every operation that changes data!!!
-        undo_operation_objects = [
-            UndoRedoEntity(self.__movie_service.add_movie, removed_movie.movie_id, removed_movie.title,
-                           removed_movie.description, removed_movie.genre)]
-
-        for index in range(len(removed_rentals)):
-            removed_rental = removed_rentals[index]
-            rental_id = removed_rental.rental_id
-            movie_id = removed_rental.movie_id
-            client_id = removed_rental.client_id
-            rented_date = removed_rental.rented_date
-            due_date = removed_rental.due_date
-            returned_date = removed_rental.returned_date
-            undo_operation_objects.append(
-                UndoRedoEntity(self.__rental_service.add_rental, rental_id, movie_id, client_id, rented_date,
-                               due_date, returned_date))
-
-        undo_converse_objects = [UndoRedoEntity(self.__movie_service.remove_movie, removed_movie.movie_id)]
+        undo_operation_objects = [(ADD_MOVIE, removed_movie.movie_id, removed_movie.title, removed_movie.description,
+                                   removed_movie.genre)]
+        if len(removed_rentals) > 0:
+            undo_operation_objects.append(self.__restore_rentals_command(removed_rentals))
+
+        undo_converse_objects = [(REMOVE_MOVIE, removed_movie.movie_id)]
         self.add_undo_operation(undo_operation_objects)
         self.add_undo_converse(undo_converse_objects)
 
     def update_movie_handler(self, old_movie_id, old_title, old_description, old_genre, movie_id, new_title,
                              new_description, new_genre):
         self.clear_redo()  # redo is cleared after every operation that changes data!!!
-        undo_operation_objects = [
-            UndoRedoEntity(self.__movie_service.update_movie, movie_id, old_movie_id, old_title, old_description,
-                           old_genre)]
-        undo_converse_objects = [
-            UndoRedoEntity(self.__movie_service.update_movie, old_movie_id, movie_id, new_title, new_description,
-                           new_genre)]
+        undo_operation_objects = [(UPDATE_MOVIE, movie_id, old_movie_id, old_title, old_description, old_genre)]
+        undo_converse_objects = [(UPDATE_MOVIE, old_movie_id, movie_id, new_title, new_description, new_genre)]
         self.add_undo_operation(undo_operation_objects)
         self.add_undo_converse(undo_converse_objects)
 
     def add_rental_handler(self, rental_id, movie_id, client_id, rented_date, due_date, returned_date):
         self.clear_redo()  # redo is cleared after every operation that changes data!!!
-        undo_operation_objects = [
-            UndoRedoEntity(self.__rental_service.remove_rental, rental_id)]
-        undo_converse_objects = [
-            UndoRedoEntity(self.__rental_service.add_rental, rental_id, movie_id, client_id, rented_date,
-                           due_date, returned_date)]
+        undo_operation_objects = [(REMOVE_RENTAL, rental_id)]
+        undo_converse_objects = [(ADD_RENTAL, rental_id, movie_id, client_id, rented_date, due_date, returned_date)]
         self.add_undo_operation(undo_operation_objects)
         self.add_undo_converse(undo_converse_objects)
 
     def return_movie_handler(self, rental_id):
         self.clear_redo()  # redo is cleared after every operation that changes data!!!
-        undo_operation_objects = [
-            UndoRedoEntity(self.__rental_service.un_return_movie, rental_id)]
-        undo_converse_objects = [
-            UndoRedoEntity(self.__rental_service.return_movie, rental_id)]
+        undo_operation_objects = [(UN_RETURN_MOVIE, rental_id)]
+        undo_converse_objects = [(RETURN_MOVIE, rental_id)]
         self.add_undo_operation(undo_operation_objects)
         self.add_undo_converse(undo_converse_objects)
 
     def undo(self):
+        if self.__transaction is not None:
+            raise UndoRedoServiceException("Cannot undo inside a transaction!")
         if self.__undo_redo_repository.is_undo_empty() is True:
             raise UndoRedoServiceException("There is nothing to undo!")
 
@@ -122,11 +181,9 @@ class UndoRedoService:
         for index in range(len(self.__undo_redo_repository.undo_operations)):
             operation = self.__undo_redo_repository.undo_operations[index]
             operation_object_list.append(operation)
-            method = operation.method
-            args = operation.args
 
             try:
-                method(*args)
+                self.__execute(operation)
             except (RentalRepositoryException, MovieRepositoryException, ClientRepositoryException) as error:
                 # raise UndoRedoServiceException(error)
                 pass
@@ -138,8 +195,11 @@ class UndoRedoService:
         self.__undo_redo_repository.remove_undo()
         self.__undo_redo_repository.add_redo_operation(converse_object_list)
         self.__undo_redo_repository.add_redo_converse(operation_object_list)
+        self.__mark_boundary()
 
     def redo(self):
+        if self.__transaction is not None:
+            raise UndoRedoServiceException("Cannot redo inside a transaction!")
         if self.__undo_redo_repository.is_redo_empty() is True:
             raise UndoRedoServiceException("There is nothing to redo!")
 
@@ -148,11 +208,9 @@ class UndoRedoService:
         for index in range(len(self.__undo_redo_repository.redo_operations)):
             operation = self.__undo_redo_repository.redo_operations[index]
             operation_object_list.append(operation)
-            method = operation.method
-            args = operation.args
 
             try:
-                method(*args)
+                self.__execute(operation)
             except (RentalRepositoryException, MovieRepositoryException, ClientRepositoryException) as error:
                 # raise UndoRedoServiceException(error)
                 pass
@@ -164,12 +222,20 @@ class UndoRedoService:
         self.__undo_redo_repository.remove_redo()
         self.__undo_redo_repository.add_undo_operation(converse_object_list)
         self.__undo_redo_repository.add_undo_converse(operation_object_list)
+        self.__mark_boundary()
 
     def add_undo_operation(self, objects):
+        if self.__transaction is not None:
+            self.__transaction[0].append(objects)
+            return
         self.__undo_redo_repository.add_undo_operation(objects)
 
     def add_undo_converse(self, objects):
+        if self.__transaction is not None:
+            self.__transaction[1].append(objects)
+            return
         self.__undo_redo_repository.add_undo_converse(objects)
+        self.__mark_boundary()  # the handlers add the converse last, once the operation is complete
 
     def add_redo_operation(self, objects):
         self.__undo_redo_repository.add_redo_operation(objects)
@@ -178,4 +244,13 @@ class UndoRedoService:
         self.__undo_redo_repository.add_redo_converse(objects)
 
     def clear_redo(self):
+        if self.__transaction is not None:
+            return  # cleared when the transaction is committed, a rolled back transaction keeps the redo steps
         self.__undo_redo_repository.clear_redo()
+
+    def history_stats(self):
+        """
+        :return: the number of undo and redo steps, their estimated size and the number of evicted steps (see
+        UndoRedoRepository.stats)
+        """
+        return self.__undo_redo_repository.stats()
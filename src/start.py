@@ -2,16 +2,22 @@
 Assigned problem: 3. Movie Rental
 """
 from src.domain.validators import ClientValidator, MovieValidator, RentalValidator
-from src.repository.client_repository import ClientRepository, ClientTextFileRepository, ClientBinaryFileRepository
-from src.repository.movie_repository import MovieRepository, MovieTextFileRepository, MovieBinaryFileRepository
-from src.repository.rental_repository import RentalRepository, RentalTextFileRepository, RentalBinaryFileRepository
+from src.repository.client_repository import ClientRepository, ClientTextFileRepository, ClientBinaryFileRepository, \
+    ClientSqliteRepository
+from src.repository.movie_repository import MovieRepository, MovieTextFileRepository, MovieBinaryFileRepository, \
+    MovieSqliteRepository
+from src.repository.rental_repository import RentalRepository, RentalTextFileRepository, RentalBinaryFileRepository, \
+    RentalColumnarRepository, RentalSqliteRepository
+from src.repository.sqlite_connection_pool import SqliteConnectionPool
 from src.repository.undo_redo_repository import UndoRedoRepository
+from src.repository.write_behind_buffer import WriteBehindBuffer
 from src.services.client_service import ClientService
 from src.services.movie_service import MovieService
 from src.services.rental_service import RentalService
 from src.services.undo_redo_service import UndoRedoService
 from src.ui.console import Console
 
+import atexit
 import configparser
 
 if __name__ == '__main__':
@@ -24,25 +30,59 @@ if __name__ == '__main__':
     config.read("settings.properties")
     repository_type = config.get("SETTINGS", "repository")
     client_repository, movie_repository, rental_repository = None, None, None
+    write_buffer = None
+    write_behind = config.getboolean("SETTINGS", "write_behind", fallback=False)
+    if write_behind and repository_type in ["textfiles", "binaryfiles"]:
+        write_buffer = WriteBehindBuffer(config.getint("SETTINGS", "flush_operations", fallback=100),
+                                         config.getint("SETTINGS", "flush_interval", fallback=0),
+                                         config.getboolean("SETTINGS", "flush_on_undo", fallback=True),
+                                         config.getboolean("SETTINGS", "fsync", fallback=False))
+        atexit.register(write_buffer.close)
     if repository_type == "inmemory":
         client_repository = ClientRepository(client_validator)
         movie_repository = MovieRepository(movie_validator)
         rental_repository = RentalRepository(rental_validator)
+    elif repository_type == "columnar":
+        client_repository = ClientRepository(client_validator)
+        movie_repository = MovieRepository(movie_validator)
+        rental_repository = RentalColumnarRepository(rental_validator)
     elif repository_type == "textfiles":
-        client_repository = ClientTextFileRepository(client_validator, config.get("SETTINGS", "clients"))
-        movie_repository = MovieTextFileRepository(movie_validator, config.get("SETTINGS", "movies"))
-        rental_repository = RentalTextFileRepository(rental_validator, config.get("SETTINGS", "rentals"))
+        log_structured = config.getboolean("SETTINGS", "log_structured", fallback=False)
+        compaction_threshold = config.getint("SETTINGS", "compaction_threshold", fallback=1000)
+        client_repository = ClientTextFileRepository(client_validator, config.get("SETTINGS", "clients"),
+                                                     log_structured, compaction_threshold, write_buffer)
+        movie_repository = MovieTextFileRepository(movie_validator, config.get("SETTINGS", "movies"),
+                                                   log_structured, compaction_threshold, write_buffer)
+        rental_repository = RentalTextFileRepository(rental_validator, config.get("SETTINGS", "rentals"),
+                                                     log_structured, compaction_threshold, write_buffer)
     elif repository_type == "binaryfiles":
-        client_repository = ClientBinaryFileRepository(client_validator, config.get("SETTINGS", "clients"))
-        movie_repository = MovieBinaryFileRepository(movie_validator, config.get("SETTINGS", "movies"))
-        rental_repository = RentalBinaryFileRepository(rental_validator, config.get("SETTINGS", "rentals"))
+        memory_mapped = config.getboolean("SETTINGS", "memory_mapped", fallback=False)
+        client_repository = ClientBinaryFileRepository(client_validator, config.get("SETTINGS", "clients"),
+                                                       write_buffer)
+        movie_repository = MovieBinaryFileRepository(movie_validator, config.get("SETTINGS", "movies"), memory_mapped,
+                                                     write_buffer)
+        rental_repository = RentalBinaryFileRepository(rental_validator, config.get("SETTINGS", "rentals"),
+                                                       memory_mapped, write_buffer)
+    elif repository_type == "sqlite":
+        connection_pool = SqliteConnectionPool(config.get("SETTINGS", "database"))
+        client_repository = ClientSqliteRepository(client_validator, connection_pool)
+        movie_repository = MovieSqliteRepository(movie_validator, connection_pool)
+        rental_repository = RentalSqliteRepository(rental_validator, connection_pool)
 
-    undo_redo_repository = UndoRedoRepository()
+    # 0 for no limit
+    undo_max_steps = config.getint("SETTINGS", "undo_max_steps", fallback=0) or None
+    undo_max_bytes = config.getint("SETTINGS", "undo_max_bytes", fallback=0) or None
+    undo_history = config.get("SETTINGS", "undo_history", fallback="").strip('"') or None
+    undo_redo_repository = UndoRedoRepository(undo_max_steps, undo_max_bytes, undo_history, write_buffer)
 
     client_service = ClientService(client_repository, rental_repository)
     movie_service = MovieService(movie_repository, rental_repository)
-    rental_service = RentalService(client_repository, movie_repository, rental_repository)
-    undo_redo_service = UndoRedoService(undo_redo_repository, client_service, movie_service, rental_service)
+    vectorized_statistics = config.get("SETTINGS", "statistics", fallback="python") == "vectorized"
+    enforce_availability = config.getboolean("SETTINGS", "enforce_availability", fallback=False)
+    rental_service = RentalService(client_repository, movie_repository, rental_repository, vectorized_statistics,
+                                   enforce_availability)
+    undo_redo_service = UndoRedoService(undo_redo_repository, client_service, movie_service, rental_service,
+                                        write_buffer)
 
     console = Console(client_service, movie_service, rental_service, undo_redo_service)
     console.run_console()
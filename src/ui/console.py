@@ -19,6 +19,7 @@ class Console:
         print("4. display statistics")
         print("5. undo")
         print("6. redo")
+        print("7. undo/redo history")
         print("X. exit")
         print("> ", end="")
 
@@ -43,6 +44,7 @@ class Console:
         print("\t3. update a movie")
         print("\t4. list all movies")
         print("\t5. search for a movie")
+        print("\t6. list the genres")
         print("\tB. back to main menu")
         print("\t> ", end="")
 
@@ -51,6 +53,7 @@ class Console:
         print("\t\t2. search by title")
         print("\t\t3. search by description id")
         print("\t\t4. search by genre")
+        print("\t\t5. filter by genre (exact match)")
         print("\t\tB. back to main menu")
         print("\t\t> ", end="")
 
@@ -58,6 +61,8 @@ class Console:
         print("\t1. rent movie / add new rental")
         print("\t2. return a movie")
         print("\t3. list all rentals")
+        print("\t4. check the availability of a movie")
+        print("\t5. list the movies available today")
         print("\tB. back to main menu")
         print("\t> ", end="")
 
@@ -65,6 +70,10 @@ class Console:
         print("\t1. most rented movies")
         print("\t2. most active clients")
         print("\t3. late rentals of currently rented movies")
+        print("\t4. top k most rented movies")
+        print("\t5. top k most active clients")
+        print("\t6. top k late rentals of currently rented movies")
+        print("\t7. most rented genres")
         print("\tB. back to main menu")
         print("\t> ", end="")
 
@@ -189,8 +198,23 @@ class Console:
         if command == '1' or command == '2' or command == '3' or command == '4':
             search = input("\t\t\t> search for: ").strip()
             calls = {'1': "movie_id", '2': "title", '3': "description", '4': "genre"}
+            match = "substring"
+            if command != '1':
+                answer = input("\t\t\t> match [s]ubstring (default), [w]ords or [p]refixes: ").strip().lower()
+                match = {'w': "word", 'p': "prefix"}.get(answer, match)
             try:
-                search_results = self.__movie_service.search_by_attribute(calls[command], search)
+                search_results = self.__movie_service.search_by_attribute(calls[command], search, match)
+                if len(search_results) == 0:
+                    print("Nothing was found.")
+                else:
+                    for entity in search_results:
+                        print(str(entity))
+            except MovieRepositoryException as error:
+                print(str(error))
+        elif command == '5':
+            genre = input("\t\t\t> genre: ").strip()
+            try:
+                search_results = self.__movie_service.filter_by_genre(genre)
                 if len(search_results) == 0:
                     print("Nothing was found.")
                 else:
@@ -203,6 +227,13 @@ class Console:
         else:
             print("The command is not valid!")
 
+    def movies_command_6(self):
+        try:
+            for genre, count in self.__movie_service.genre_counts():
+                print(genre + ": " + str(count))
+        except MovieRepositoryException as error:
+            print(str(error))
+
     def handle_movies(self):
         command = input().strip().lower()
         if command == '1':
@@ -215,6 +246,8 @@ class Console:
             self.movies_command_4()
         elif command == '5':
             self.movies_command_5()
+        elif command == '6':
+            self.movies_command_6()
         elif command == 'b':
             pass
         else:
@@ -255,6 +288,28 @@ class Console:
         except RentalRepositoryException as error:
             print(str(error))
 
+    def rentals_command_4(self):
+        movie_id = input("Enter movie id: ").strip()
+        date = input("Enter the first day of the period, of the form: dd.mm.yyyy: ").strip()
+        until = input("Enter the last day of the period, of the form: dd.mm.yyyy, or leave empty for one day: ").strip()
+        try:
+            if self.__rental_service.is_movie_available(movie_id, date, until or None):
+                print("The movie is available.")
+            else:
+                print("The movie is rented in that period.")
+        except (MovieRepositoryException, RentalRepositoryException) as error:
+            print(str(error))
+
+    def rentals_command_5(self):
+        try:
+            movies = self.__rental_service.find_available_movies()
+            if len(movies) == 0:
+                print("No movie is available.")
+            for movie in movies:
+                print(str(movie))
+        except MovieRepositoryException as error:
+            print(str(error))
+
     def handle_rentals(self):
         command = input().strip().lower()
         if command == '1':
@@ -263,6 +318,10 @@ class Console:
             self.rentals_command_2()
         elif command == '3':
             self.rentals_command_3()
+        elif command == '4':
+            self.rentals_command_4()
+        elif command == '5':
+            self.rentals_command_5()
         elif command == 'b':
             pass
         else:
@@ -300,6 +359,37 @@ class Console:
         except RentalRepositoryException as rre:
             print(str(rre))
 
+    def statistics_command_4(self):
+        k = input("Enter the number of movies to display: ").strip()
+        try:
+            statistics = self.__rental_service.get_movie_statistics_top_k(k)
+            self.print_statistics(statistics, "- the number of days rented")
+        except (MovieRepositoryException, RentalRepositoryException) as mre:
+            print(str(mre))
+
+    def statistics_command_5(self):
+        k = input("Enter the number of clients to display: ").strip()
+        try:
+            statistics = self.__rental_service.get_client_statistics_top_k(k)
+            self.print_statistics(statistics, "- the number of movie rental days of the client")
+        except (ClientRepositoryException, RentalRepositoryException) as cre:
+            print(str(cre))
+
+    def statistics_command_6(self):
+        k = input("Enter the number of rentals to display: ").strip()
+        try:
+            statistics = self.__rental_service.get_rental_statistics_top_k(k)
+            self.print_statistics(statistics, "- the number of days of delay for the currently rented movie")
+        except RentalRepositoryException as rre:
+            print(str(rre))
+
+    def statistics_command_7(self):
+        try:
+            statistics = self.__rental_service.get_genre_statistics
+            self.print_statistics(statistics, "- the number of days the movies of the genre were rented")
+        except (MovieRepositoryException, RentalRepositoryException) as mre:
+            print(str(mre))
+
     def handle_statistics(self):
         command = input().strip().lower()
         if command == '1':
@@ -308,6 +398,14 @@ class Console:
             self.statistics_command_2()
         elif command == '3':
             self.statistics_command_3()
+        elif command == '4':
+            self.statistics_command_4()
+        elif command == '5':
+            self.statistics_command_5()
+        elif command == '6':
+            self.statistics_command_6()
+        elif command == '7':
+            self.statistics_command_7()
         elif command == 'b':
             pass
         else:
@@ -351,6 +449,10 @@ class Console:
                     self.__undo_redo_service.redo()
                 except UndoRedoServiceException as error:
                     print(str(error))
+            elif command == '7':
+                stats = self.__undo_redo_service.history_stats()
+                print(str(stats["undo_steps"]) + " steps to undo, " + str(stats["redo_steps"]) + " to redo, about " +
+                      str(stats["estimated_bytes"]) + " bytes (" + str(stats["evicted_steps"]) + " old steps dropped)")
             elif command == 'x':
                 print("You exited the program.")
                 return
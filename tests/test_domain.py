@@ -1,6 +1,8 @@
+import datetime
+import pickle
 import unittest
 
-from src.domain.entities import Movie, Client, Rental, UndoRedoEntity
+from src.domain.entities import Movie, Client, Rental, UndoRedoEntity, date_to_ordinal
 from src.domain.validators import MiscellaneousValidator, ClientValidator, MovieValidator, RentalValidator, \
     MovieValidatorException, ClientValidatorException, RentalValidatorException, MiscellaneousValidatorException
 from src.repository.client_repository import ClientRepository
@@ -61,6 +63,49 @@ class TestRental(unittest.TestCase):
         self.assertEqual(rental.returned_date, "12.12.2002")
         self.assertIsInstance(str(rental), str)
 
+    def test_date_ordinals(self):
+        rental = Rental('1', '2', '3', "10.10.2010", "1.2.2011", "N.A.")
+        self.assertEqual(rental.rented_ordinal, datetime.date(2010, 10, 10).toordinal())
+        self.assertEqual(rental.due_ordinal, datetime.date(2011, 2, 1).toordinal())
+        self.assertEqual(rental.returned_ordinal, None)
+        rental.returned_date = "12.12.2012"
+        self.assertEqual(rental.returned_ordinal, datetime.date(2012, 12, 12).toordinal())
+        rental.rented_date = "32.12.2012"
+        self.assertEqual(rental.rented_ordinal, None)
+
+        copy = pickle.loads(pickle.dumps(Rental('1', '2', '3', "10.10.2010", "1.2.2011", "N.A.")))
+        self.assertEqual(copy.rented_ordinal, datetime.date(2010, 10, 10).toordinal())
+        self.assertEqual(copy.due_date, "1.2.2011")
+
+    def test_slots_and_pickle(self):
+        rental = Rental('1', '2', '3', "10.10.2010", "1.2.2011", "N.A.")
+        movie = Movie('2', "title", "description", "genre")
+        client = Client('3', "name")
+        for entity in [rental, movie, client, UndoRedoEntity(len, 'x')]:
+            self.assertFalse(hasattr(entity, '__dict__'))
+        self.assertEqual(str(pickle.loads(pickle.dumps(rental))), str(rental))
+        self.assertEqual(str(pickle.loads(pickle.dumps(movie))), str(movie))
+        self.assertEqual(str(pickle.loads(pickle.dumps(client))), str(client))
+
+        # entities pickled before the classes were slotted carry their __dict__ as state
+        legacy_rental = Rental.__new__(Rental)
+        legacy_rental.__setstate__({'_Rental__rental_id': '1', '_Rental__movie_id': '2', '_Rental__client_id': '3',
+                                    '_Rental__rented_date': "10.10.2010", '_Rental__due_date': "1.2.2011",
+                                    '_Rental__returned_date': "N.A."})
+        self.assertEqual(str(legacy_rental), str(rental))
+        self.assertEqual(legacy_rental.due_ordinal, rental.due_ordinal)
+        legacy_client = Client.__new__(Client)
+        legacy_client.__setstate__({'_Client__client_id': '3', '_Client__name': "name"})
+        self.assertEqual(str(legacy_client), str(client))
+
+    def test_date_to_ordinal(self):
+        for date in ["10.10.2010", "1.1.2020", "01.01.2020", "29.02.2020", "31.12.9999", "1.12.0001"]:
+            expected = datetime.datetime.strptime(date, "%d.%m.%Y").toordinal()
+            self.assertEqual(date_to_ordinal(date), expected)
+        for date in ["", "N.A.", "abc", "32.10.2010", "29.02.2021", "15.10.99", "1.1.20201", "1..2020", "0.1.2020",
+                     "1.13.2020", "-1.1.2020", "1.1.2020.", None, 15]:
+            self.assertEqual(date_to_ordinal(date), None)
+
 
 class TestValidators(unittest.TestCase):
     def test_miscellaneous_validator(self):
@@ -43,6 +43,16 @@ class TestIterableDataStructure(unittest.TestCase):
         item = my_list2.pop()
         self.assertEqual(item, 22)
 
+    def test_remove_all(self):
+        my_list = MyIterator()
+        first, second, third = [1], [2], [3]
+        my_list.append(first)
+        my_list.append(second)
+        my_list.append(third)
+        my_list.remove_all([third, first])
+        self.assertEqual(len(my_list), 1)
+        self.assertIs(my_list[0], second)
+
     def test_my_sort(self):
         my_list = MyIterator()
         my_list.append(1)
@@ -58,6 +68,56 @@ class TestIterableDataStructure(unittest.TestCase):
         my_sort(my_list, lambda x, y: x >= y)
         self.assertEqual(str(my_list), '[4, 3, 2, 1, 1, 1]')
 
+    def test_my_sort_strict_comparison(self):
+        my_list = [3, 1, 2, 3, 1]
+        my_sort(my_list, lambda x, y: x < y)
+        self.assertEqual(my_list, [1, 1, 2, 3, 3])
+
+        my_sort(my_list, lambda x, y: x > y)
+        self.assertEqual(my_list, [3, 3, 2, 1, 1])
+
+    def test_my_sort_is_stable(self):
+        pairs = [(2, 'a'), (1, 'b'), (2, 'c'), (3, 'd'), (1, 'e'), (2, 'f'), (3, 'g'), (3, 'h'), (1, 'i')]
+        expected_ascending = sorted(pairs, key=lambda pair: pair[0])
+        expected_descending = sorted(pairs, key=lambda pair: pair[0], reverse=True)
+
+        my_list = MyIterator()
+        for pair in pairs:
+            my_list.append(pair)
+        my_sort(my_list, lambda x, y: x[0] <= y[0])
+        self.assertEqual(list(my_list[:]), expected_ascending)
+
+        my_list = list(pairs)
+        my_sort(my_list, lambda x, y: x[0] < y[0])
+        self.assertEqual(my_list, expected_ascending)
+
+        my_list = list(pairs)
+        my_sort(my_list, lambda x, y: x[0] >= y[0])
+        self.assertEqual(my_list, expected_descending)
+
+        my_list = list(pairs)
+        my_sort(my_list, key=lambda pair: pair[0])
+        self.assertEqual(my_list, expected_ascending)
+
+        my_list = list(pairs)
+        my_sort(my_list, key=lambda pair: pair[0], reverse=True)
+        self.assertEqual(my_list, expected_descending)
+
+        my_list = list(reversed(pairs))
+        my_sort(my_list, lambda x, y: x[0] <= y[0], reverse=True)
+        self.assertEqual(my_list, sorted(reversed(pairs), key=lambda pair: pair[0], reverse=True))
+
+    def test_my_sort_large(self):
+        my_list = [(index * 7919) % 1000 for index in range(5000)]
+        expected = sorted(my_list)
+        my_sort(my_list, lambda x, y: x <= y)
+        self.assertEqual(my_list, expected)
+
+        my_list = []
+        my_sort(my_list, lambda x, y: x <= y)
+        self.assertEqual(my_list, [])
+        self.assertRaises(ValueError, my_sort, [2, 1])
+
     def test_my_filter(self):
         my_list = MyIterator()
         my_list.append(1)
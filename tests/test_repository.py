@@ -1,14 +1,22 @@
+import datetime
+import os
+import pickle
+import tempfile
+import time
 import unittest
 
-from src.domain.entities import Client, Movie, Rental
+from src.domain.entities import Client, Movie, Rental, date_to_ordinal
 from src.domain.validators import ClientValidator, MovieValidator, RentalValidator
 from src.repository.client_repository import ClientRepository, ClientRepositoryException, ClientTextFileRepository, \
-    ClientBinaryFileRepository
+    ClientBinaryFileRepository, ClientSqliteRepository
 from src.repository.movie_repository import MovieRepository, MovieRepositoryException, MovieTextFileRepository, \
-    MovieBinaryFileRepository
+    MovieBinaryFileRepository, MovieSqliteRepository
 from src.repository.rental_repository import RentalRepository, RentalRepositoryException, RentalTextFileRepository, \
-    RentalBinaryFileRepository
+    RentalBinaryFileRepository, RentalColumnarRepository, RentalSqliteRepository
+from src.repository.sqlite_connection_pool import SqliteConnectionPool
+from src.repository.struct_record_file import StructRecordFile
 from src.repository.undo_redo_repository import UndoRedoRepository
+from src.repository.write_behind_buffer import WriteBehindBuffer
 
 
 class TestClientRepository(unittest.TestCase):
@@ -51,6 +59,54 @@ class TestClientRepository(unittest.TestCase):
         self.assertRaises(ClientRepositoryException, self.repo.update_entity_by_id, '-5', client)
         self.repo.update_entity_by_id('15', Client('15', "new"))
 
+    def test_id_index(self):
+        client = Client('15', "abc")
+        self.repo.add_entity(client)
+        self.assertIs(self.repo.find_by_id('15'), client)
+        self.repo.update_entity_by_id('15', Client('16', "new"))
+        self.assertEqual(self.repo.find_by_id('15'), None)
+        self.assertIs(self.repo.find_by_id('16'), client)
+        self.assertEqual(client.name, "new")
+        self.repo.remove_by_id('16')
+        self.assertEqual(self.repo.find_by_id('16'), None)
+
+        other = Client('17', "other")
+        self.repo.add_entity(client)
+        self.repo.add_entity(other)
+        self.assertRaises(ClientRepositoryException, self.repo.update_entity_by_id, '17', Client('16', "taken"))
+        self.assertIs(self.repo.find_by_id('16'), client)
+        self.assertIs(self.repo.find_by_id('17'), other)
+        self.assertEqual(other.name, "other")
+
+        self.assertRaises(ClientRepositoryException, self.repo.add_entity, Client('17', "again"))
+        self.assertIs(self.repo.find_by_id('17'), other)
+        self.assertEqual([client.client_id for client in self.repo.get_all_entities], ['16', '17'])
+
+    def test_bulk_load(self):
+        self.repo.add_entity(Client('1', "John"))
+        loaded, rejected = self.repo.bulk_load([Client('2', "Jane"), Client('-3', "Jim"), Client('1', "Joe"),
+                                                Client('4', "Jack"), Client('4', "Jill")])
+        self.assertEqual([client.client_id for client in loaded], ['2', '4'])
+        self.assertEqual([position for position, client, error in rejected], [1, 2, 4])
+        self.assertEqual([client.client_id for client in self.repo.get_all_entities], ['1', '2', '4'])
+        self.assertEqual(self.repo.find_by_id('4').name, "Jack")
+
+    def test_find_by_name_fragment(self):
+        mariah = Client('1', "Mariah Jones")
+        marian = Client('2', "Marian")
+        self.repo.add_entity(mariah)
+        self.repo.bulk_load([marian, Client('3', "Ion Vasile")])
+        self.assertEqual(self.repo.find_by_name_fragment("ARI"), [mariah, marian])
+        self.assertEqual(self.repo.find_by_name_fragment("h jo"), [mariah])
+        self.assertEqual(self.repo.find_by_name_fragment("arix"), [])
+        self.assertIsNone(self.repo.find_by_name_fragment("ar"))
+
+        self.repo.update_entity_by_id('1', Client('4', "Sandy"))
+        self.assertEqual(self.repo.find_by_name_fragment("ari"), [marian])
+        self.assertEqual(self.repo.find_by_name_fragment("and"), [mariah])
+        self.repo.remove_by_id('2')
+        self.assertEqual(self.repo.find_by_name_fragment("ari"), [])
+
     def test_get_all_entities(self):
         with self.assertRaises(ClientRepositoryException):
             self.repo.get_all_entities()
@@ -153,6 +209,66 @@ class TestMovieRepository(unittest.TestCase):
         self.assertRaises(MovieRepositoryException, self.repo.update_entity_by_id, '-5', movie)
         self.repo.update_entity_by_id('15', Movie('15', "new", "a", "b"))
 
+    def test_id_index(self):
+        movie = Movie('15', "abc", "a", "b")
+        self.repo.add_entity(movie)
+        self.assertIs(self.repo.find_by_id('15'), movie)
+        self.repo.update_entity_by_id('15', Movie('16', "new", "a", "b"))
+        self.assertEqual(self.repo.find_by_id('15'), None)
+        self.assertIs(self.repo.find_by_id('16'), movie)
+        self.repo.remove_by_id('16')
+        self.assertEqual(self.repo.find_by_id('16'), None)
+
+        other = Movie('17', "other", "a", "b")
+        self.repo.add_entity(movie)
+        self.repo.add_entity(other)
+        self.assertRaises(MovieRepositoryException, self.repo.update_entity_by_id, '17', Movie('16', "taken", "a", "b"))
+        self.assertIs(self.repo.find_by_id('16'), movie)
+        self.assertEqual(self.repo.find_by_words("title", "other"), [other])
+
+        self.assertRaises(MovieRepositoryException, self.repo.add_entity, Movie('17', "again", "a", "b"))
+        self.assertIs(self.repo.find_by_id('17'), other)
+        self.assertEqual([movie.movie_id for movie in self.repo.get_all_entities], ['16', '17'])
+        self.assertEqual(self.repo.find_by_words("title", "again"), [])
+
+    def test_find_by_words(self):
+        first = Movie('1', "The Lord of the Rings", "Fellowship", "fantasy")
+        second = Movie('2', "Lords of Dogtown", "Skateboarding", "drama")
+        self.repo.add_entity(first)
+        self.repo.bulk_load([second])
+        self.assertEqual(self.repo.find_by_words("title", "lord"), [first])
+        self.assertEqual(self.repo.find_by_words("title", "LORD", prefix=True), [first, second])
+        self.assertEqual(self.repo.find_by_words("title", "of the"), [first])
+        self.assertIsNone(self.repo.find_by_words("title", "!"))
+        self.assertRaises(MovieRepositoryException, self.repo.find_by_words, "movie_id", "1")
+
+        self.repo.update_entity_by_id('1', Movie('3', "The Hobbit", "Fellowship", "fantasy"))
+        self.assertEqual(self.repo.find_by_words("title", "lord", prefix=True), [second])
+        self.assertEqual(self.repo.find_by_words("title", "hobbit"), [first])
+        self.repo.remove_by_id('2')
+        self.assertEqual(self.repo.find_by_words("title", "lord", prefix=True), [])
+        self.assertEqual(self.repo.find_by_words("genre", "fantasy"), [first])
+
+        azure = Movie('4', "Azure", "a", "b")
+        apple = Movie('5', "Apple", "a", "b")
+        self.repo.add_entity(azure)
+        self.repo.add_entity(apple)
+        self.assertEqual(self.repo.find_by_words("title", "a", prefix=True), [azure, apple])  # as added
+
+    def test_find_by_genre(self):
+        first = Movie('1', "abc", "a", "drama")
+        second = Movie('2', "def", "a", "drama")
+        self.repo.add_entity(first)
+        self.repo.bulk_load([second, Movie('3', "ghi", "a", "comedy")])
+        self.assertEqual(self.repo.find_by_genre("drama"), [first, second])
+        self.assertEqual(self.repo.find_by_genre("Drama"), [])
+        self.assertEqual(self.repo.genre_counts(), {"drama": 2, "comedy": 1})
+
+        self.repo.update_entity_by_id('1', Movie('1', "abc", "a", "comedy"))
+        self.repo.remove_by_id('2')
+        self.assertEqual(self.repo.genre_counts(), {"comedy": 2})
+        self.assertEqual(self.repo.find_by_genre("drama"), [])
+
     def test_get_all_entities(self):
         with self.assertRaises(MovieRepositoryException):
             self.repo.get_all_entities()
@@ -262,6 +378,70 @@ class TestRentalRepository(unittest.TestCase):
         self.repo.remove_by_movie_id("14")
         self.repo.remove_by_client_id("100")
 
+    def test_client_and_movie_indexes(self):
+        self.repo.add_entity(Rental('14', '100', '17', "12.12.2012", "10.10.2020", "09.10.2020"))
+        self.repo.add_entity(Rental('15', '100', '18', "12.12.2012", "10.10.2020", "09.10.2020"))
+        self.repo.add_entity(Rental('16', '101', '17', "12.12.2012", "10.10.2020", "N.A."))
+        self.assertEqual([rental.rental_id for rental in self.repo.find_by_client_id('17')], ['14', '16'])
+        self.assertEqual([rental.rental_id for rental in self.repo.find_by_movie_id('100')], ['14', '15'])
+        self.assertEqual(self.repo.find_by_client_id('99'), [])
+
+        self.repo.update_entity_by_id('16', Rental('16', '100', '18', "12.12.2012", "10.10.2020", "N.A."))
+        self.assertEqual([rental.rental_id for rental in self.repo.find_by_client_id('17')], ['14'])
+        self.assertEqual([rental.rental_id for rental in self.repo.find_by_movie_id('100')], ['14', '15', '16'])
+        self.assertEqual(self.repo.find_by_movie_id('101'), [])
+
+        removed = self.repo.remove_by_client_id('18')
+        self.assertEqual([rental.rental_id for rental in removed], ['15', '16'])
+        self.assertEqual(len(self.repo.get_all_entities), 1)
+        self.assertEqual(self.repo.find_by_id('15'), None)
+        self.assertEqual([rental.rental_id for rental in self.repo.find_by_movie_id('100')], ['14'])
+
+        removed = self.repo.remove_by_movie_id('100')
+        self.assertEqual(len(removed), 1)
+        self.assertEqual(self.repo.find_by_client_id('17'), [])
+
+    def test_overdue_index(self):
+        self.repo.add_entity(Rental('1', '100', '17', "01.10.2020", "20.10.2020", "N.A."))
+        self.repo.add_entity(Rental('2', '100', '18', "01.10.2020", "10.10.2020", "N.A."))
+        self.repo.add_entity(Rental('3', '101', '17', "01.10.2020", "05.10.2020", "06.10.2020"))
+        self.repo.bulk_load([Rental('4', '101', '17', "01.10.2020", "15.10.2020", "N.A.")])
+        today = datetime.date(2020, 10, 20).toordinal()
+
+        def overdue(client_id=None):
+            return [rental.rental_id for rental in self.repo.find_overdue(today, client_id)]
+        self.assertEqual(overdue(), ['2', '4'])
+        self.assertEqual(overdue('17'), ['4'])
+        self.assertEqual(overdue('19'), [])
+
+        self.repo.update_entity_by_id('4', Rental('4', '101', '17', "01.10.2020", "15.10.2020", "16.10.2020"))
+        self.repo.update_entity_by_id('3', Rental('3', '101', '17', "01.10.2020", "05.10.2020", "N.A."))
+        self.assertEqual(overdue('17'), ['3'])
+        self.repo.remove_by_id('3')
+        self.repo.remove_by_client_id('18')
+        self.assertEqual(overdue(), [])
+
+    def test_availability_index(self):
+        def ordinal(day):
+            return datetime.date(2020, 10, day).toordinal()
+        self.repo.add_entity(Rental('1', '100', '17', "01.10.2020", "05.10.2020", "05.10.2020"))
+        self.repo.add_entity(Rental('2', '100', '18', "10.10.2020", "15.10.2020", "N.A."))
+        self.repo.add_entity(Rental('3', '101', '18', "01.10.2020", "25.10.2020", "20.10.2020"))
+        self.assertTrue(self.repo.is_movie_available('100', ordinal(5), ordinal(10)))
+        self.assertFalse(self.repo.is_movie_available('100', ordinal(4), ordinal(5)))
+        self.assertFalse(self.repo.is_movie_available('100', ordinal(20)))
+        self.assertFalse(self.repo.is_movie_available('101', ordinal(2), ordinal(3)))
+        self.assertTrue(self.repo.is_movie_available('101', ordinal(20)))
+        self.assertTrue(self.repo.is_movie_available('102', ordinal(1)))
+
+        self.repo.update_entity_by_id('2', Rental('2', '100', '18', "10.10.2020", "15.10.2020", "12.10.2020"))
+        self.assertTrue(self.repo.is_movie_available('100', ordinal(12)))
+        self.repo.update_entity_by_id('3', Rental('3', '100', '18', "01.10.2020", "25.10.2020", "20.10.2020"))
+        self.assertTrue(self.repo.is_movie_available('101', ordinal(1)))
+        self.assertFalse(self.repo.is_movie_available('100', ordinal(19), ordinal(20)))
+        self.repo.remove_by_movie_id('100')
+        self.assertTrue(self.repo.is_movie_available('100', ordinal(1)))
+
     def test_update_entity_by_id(self):
         with self.assertRaises(RentalRepositoryException):
             self.repo.update_entity_by_id('1000', Rental('14', '100', '17', "", "10.10.2020", "09.10.2020"))
@@ -270,6 +450,26 @@ class TestRentalRepository(unittest.TestCase):
         self.assertRaises(RentalRepositoryException, self.repo.update_entity_by_id, '-5', rental)
         self.repo.update_entity_by_id('14', Rental('14', '1', '7', "17.12.2012", "10.10.2020", "09.10.2020"))
 
+    def test_id_index(self):
+        rental = Rental('14', '100', '17', "12.12.2012", "10.10.2020", "09.10.2020")
+        self.repo.add_entity(rental)
+        self.assertIs(self.repo.find_by_id('14'), rental)
+        self.repo.update_entity_by_id('14', Rental('15', '100', '17', "12.12.2012", "10.10.2020", "09.10.2020"))
+        self.assertEqual(self.repo.find_by_id('14'), None)
+        self.assertIs(self.repo.find_by_id('15'), rental)
+        self.repo.remove_by_id('15')
+        self.assertEqual(self.repo.find_by_id('15'), None)
+
+        other = Rental('16', '100', '17', "12.12.2012", "10.10.2020", "N.A.")
+        self.repo.add_entity(rental)
+        self.repo.add_entity(other)
+        self.assertRaises(RentalRepositoryException, self.repo.update_entity_by_id, '16',
+                          Rental('15', '100', '17', "12.12.2012", "10.10.2020", "N.A."))
+        self.assertIs(self.repo.find_by_id('15'), rental)
+        self.assertIs(self.repo.find_by_id('16'), other)
+        self.assertEqual([overdue.rental_id for overdue in self.repo.find_overdue(date_to_ordinal("1.1.2021"))],
+                         ['16'])
+
     def test_get_all_entities(self):
         with self.assertRaises(RentalRepositoryException):
             self.repo.get_all_entities()
@@ -278,6 +478,92 @@ class TestRentalRepository(unittest.TestCase):
         all = self.repo.get_all_entities
 
 
+class TestRentalColumnarRepository(unittest.TestCase):
+    def setUp(self) -> None:
+        self.repo = RentalColumnarRepository(RentalValidator)
+
+    def tearDown(self) -> None:
+        pass
+
+    def test_add_find_remove(self):
+        with self.assertRaises(RentalRepositoryException):
+            self.repo.get_all_entities
+        self.assertEqual(self.repo.find_by_id('14'), None)
+        self.assertRaises(RentalRepositoryException, self.repo.find_by_id, 'abc')
+        self.assertRaises(RentalRepositoryException, self.repo.add_entity,
+                          Rental('-14', '100', '17', "12.12.2012", "10.10.2020", "09.10.2020"))
+        self.repo.add_entity(Rental('14', '100', '17', "12.12.2012", "10.10.2020", "9.10.2020"))
+        self.repo.add_entity(Rental('15', '101', '17', "1.2.2013", "10.10.2020", "N.A."))
+        self.repo.add_entity(Rental('16', '100', '18', "12.12.2012", "10.10.2020", "N.A."))
+        self.assertRaises(RentalRepositoryException, self.repo.add_entity,
+                          Rental('16', '100', '18', "12.12.2012", "10.10.2020", "N.A."))
+
+        self.assertEqual(len(self.repo.get_all_entities), 3)
+        self.assertEqual(str(self.repo.find_by_id('14')), str(Rental('14', '100', '17', "12.12.2012", "10.10.2020",
+                                                                     "9.10.2020")))
+        self.assertEqual(self.repo.find_by_id('15').rented_date, "1.2.2013")
+        self.assertEqual(self.repo.find_by_id('15').returned_date, "N.A.")
+        self.assertEqual([rental.rental_id for rental in self.repo.find_by_client_id('17')], ['14', '15'])
+        self.assertEqual([rental.rental_id for rental in self.repo.find_by_movie_id('100')], ['14', '16'])
+        self.assertEqual(self.repo.find_by_movie_id('abc'), [])
+
+        removed = self.repo.remove_by_id('14')
+        self.assertEqual(removed.rental_id, '14')
+        self.assertEqual(self.repo.find_by_id('14'), None)
+        self.assertEqual(sorted(rental.rental_id for rental in self.repo.get_all_entities), ['15', '16'])
+        self.assertRaises(RentalRepositoryException, self.repo.remove_by_id, '14')
+
+        removed = self.repo.remove_by_client_id('17')
+        self.assertEqual([rental.rental_id for rental in removed], ['15'])
+        self.assertEqual(self.repo.find_by_id('16').client_id, '18')
+        self.assertEqual(len(self.repo.remove_by_movie_id('100')), 1)
+        with self.assertRaises(RentalRepositoryException):
+            self.repo.get_all_entities
+
+    def test_update_entity_by_id(self):
+        self.repo.add_entity(Rental('14', '100', '17', "12.12.2012", "10.10.2020", "N.A."))
+        self.repo.add_entity(Rental('15', '100', '17', "12.12.2012", "10.10.2020", "N.A."))
+        with self.assertRaises(RentalRepositoryException):
+            self.repo.update_entity_by_id('14', Rental('14', '100', '17', "", "10.10.2020", "N.A."))
+        with self.assertRaises(RentalRepositoryException):
+            self.repo.update_entity_by_id('14', Rental('15', '100', '17', "12.12.2012", "10.10.2020", "N.A."))
+        with self.assertRaises(RentalRepositoryException):
+            self.repo.update_entity_by_id('14', Rental('99999999999999999999', '1', '2', "1.1.2000", "1.1.2001",
+                                                       "N.A."))
+        self.assertEqual(self.repo.find_by_id('14').movie_id, '100')
+
+        self.repo.update_entity_by_id('14', Rental('20', '1', '7', "17.12.2012", "10.10.2020", "09.10.2020"))
+        self.assertEqual(self.repo.find_by_id('14'), None)
+        rental = self.repo.find_by_id('20')
+        self.assertEqual((rental.movie_id, rental.client_id, rental.rented_date, rental.returned_date),
+                         ('1', '7', "17.12.2012", "09.10.2020"))
+
+    def test_statistics_match_rental_repository(self):
+        rental_repository = RentalRepository(RentalValidator)
+        rentals = [Rental('1', '1', '1', "10.10.2010", "11.10.2010", "20.10.2010"),
+                   Rental('2', '1', '2', "1.1.2020", "11.10.2020", "N.A."),
+                   Rental('3', '2', '2', "05.03.2021", "11.10.2030", "N.A."),
+                   Rental('4', '3', '1', "05.03.2021", "11.10.2030", "07.03.2021")]
+        for rental in rentals:
+            self.repo.add_entity(rental)
+            rental_repository.add_entity(rental)
+
+        today = datetime.date.today().toordinal()
+        self.assertEqual(self.repo.days_rented_per_movie(today), rental_repository.days_rented_per_movie(today))
+        self.assertEqual(self.repo.days_rented_per_client(today), rental_repository.days_rented_per_client(today))
+        self.assertEqual(self.repo.days_rented_by_movie_id('1', today),
+                         rental_repository.days_rented_by_movie_id('1', today))
+        self.assertEqual([rental.rental_id for rental in self.repo.find_overdue(today)],
+                         [rental.rental_id for rental in rental_repository.find_overdue(today)])
+        self.assertEqual([rental.rental_id for rental in self.repo.find_overdue(today, '2')],
+                         [rental.rental_id for rental in rental_repository.find_overdue(today, '2')])
+        for movie_id, start, end in [('1', "15.10.2010", None), ('1', "20.10.2010", "25.10.2010"),
+                                     ('2', "01.01.2021", "05.03.2021"), ('3', "06.03.2021", None)]:
+            start, end = date_to_ordinal(start), date_to_ordinal(end)
+            self.assertEqual(self.repo.is_movie_available(movie_id, start, end),
+                             rental_repository.is_movie_available(movie_id, start, end))
+
+
 # TODO: add tests to this class (file repo)
 class TestRentalTextFileRepository(unittest.TestCase):
     def setUp(self) -> None:
@@ -344,6 +630,455 @@ class TestRentalBinaryFileRepository(unittest.TestCase):
         pass
 
 
+class TestLogStructuredTextFileRepositories(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.clients_file = os.path.join(self.directory.name, "clients.txt")
+        self.rentals_file = os.path.join(self.directory.name, "rentals.txt")
+        open(self.clients_file, 'w').close()
+        open(self.rentals_file, 'w').close()
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    @staticmethod
+    def read_lines(file_name):
+        with open(file_name) as file_pointer:
+            return file_pointer.read().splitlines()
+
+    def test_changes_are_logged_and_replayed(self):
+        repo = ClientTextFileRepository(ClientValidator, self.clients_file, log_structured=True)
+        repo.add_entity(Client('1', "John"))
+        repo.add_entity(Client('2', "Jane"))
+        repo.update_entity_by_id('1', Client('3', "John Doe"))
+        repo.remove_by_id('2')
+        self.assertEqual(self.read_lines(self.clients_file), [])
+        self.assertEqual(self.read_lines(self.clients_file + ".log")[1:],
+                         ["A,1,John", "A,2,Jane", "U,1,3,John Doe", "D,2"])
+
+        reloaded = ClientTextFileRepository(ClientValidator, self.clients_file, log_structured=True)
+        self.assertEqual([str(client) for client in reloaded.get_all_entities], [str(Client('3', "John Doe"))])
+
+        reloaded.compact()
+        self.assertEqual(self.read_lines(self.clients_file), ["3,John Doe"])
+        self.assertEqual(len(self.read_lines(self.clients_file + ".log")), 1)  # only the snapshot record
+        reloaded = ClientTextFileRepository(ClientValidator, self.clients_file)
+        self.assertEqual(reloaded.find_by_id('3').name, "John Doe")
+
+    def test_replay_after_interrupted_compaction(self):
+        repo = ClientTextFileRepository(ClientValidator, self.clients_file, log_structured=True)
+        repo.add_entity(Client('5', "John"))
+        repo.update_entity_by_id('5', Client('6', "John"))
+        repo.add_entity(Client('5', "Jane"))
+        repo._rewrite_file()  # the snapshot was replaced, but the log was not emptied
+        reloaded = ClientTextFileRepository(ClientValidator, self.clients_file, log_structured=True)
+        self.assertEqual([(client.client_id, client.name) for client in reloaded.get_all_entities],
+                         [('6', "John"), ('5', "Jane")])
+
+        reloaded.add_entity(Client('7', "Jim"))  # logged after the emptied log's snapshot record
+        reloaded = ClientTextFileRepository(ClientValidator, self.clients_file, log_structured=True)
+        self.assertEqual(len(reloaded.get_all_entities), 3)
+
+    def test_partially_written_record(self):
+        repo = ClientTextFileRepository(ClientValidator, self.clients_file, log_structured=True)
+        repo.add_entity(Client('1', "John"))
+        with open(self.clients_file + ".log", 'a') as file_pointer:
+            file_pointer.write("A,5")  # a crash while the record was appended
+        reloaded = ClientTextFileRepository(ClientValidator, self.clients_file, log_structured=True)
+        self.assertEqual([client.client_id for client in reloaded.get_all_entities], ['1'])
+        reloaded.add_entity(Client('2', "Jane"))
+        self.assertEqual(self.read_lines(self.clients_file + ".log")[1:], ["A,1,John", "A,2,Jane"])
+
+        with open(self.clients_file + ".log", 'a') as file_pointer:
+            file_pointer.write("A,3\nA,4,Jim\n")
+        with self.assertRaises(ClientRepositoryException) as context:
+            ClientTextFileRepository(ClientValidator, self.clients_file, log_structured=True)
+        self.assertIn("line 4", str(context.exception))
+
+    def test_bulk_load(self):
+        repo = ClientTextFileRepository(ClientValidator, self.clients_file)
+        repo.add_entity(Client('1', "John"))
+        repo.bulk_load([Client('2', "Jane"), Client('1', "Joe"), Client('3', "Jim")])
+        self.assertEqual(self.read_lines(self.clients_file), ["1,John", "2,Jane", "3,Jim"])
+
+        repo = ClientTextFileRepository(ClientValidator, self.clients_file, log_structured=True)
+        repo.bulk_load([Client('4', "Jack")])
+        self.assertEqual(self.read_lines(self.clients_file + ".log")[1:], ["A,4,Jack"])
+        self.assertEqual(len(ClientTextFileRepository(ClientValidator, self.clients_file,
+                                                      log_structured=True).get_all_entities), 4)
+
+    def test_iter_file_entities(self):
+        with open(self.clients_file, 'w') as file_pointer:
+            file_pointer.write("1,John\n2,Jane\n")
+        clients = ClientTextFileRepository.iter_file_entities(self.clients_file)
+        self.assertEqual(str(next(clients)), str(Client('1', "John")))
+        self.assertEqual([client.name for client in clients], ["Jane"])
+
+    def test_bad_lines_are_reported(self):
+        with open(self.clients_file, 'w') as file_pointer:
+            file_pointer.write("1,John\n-2,Jane\n")
+        with self.assertRaises(ClientRepositoryException) as context:
+            ClientTextFileRepository(ClientValidator, self.clients_file)
+        self.assertIn("line 2", str(context.exception))
+
+    def test_threshold_compaction_and_cascade(self):
+        repo = RentalTextFileRepository(RentalValidator, self.rentals_file, log_structured=True,
+                                        compaction_threshold=3)
+        repo.add_entity(Rental('1', '10', '20', "10.10.2010", "11.10.2010", "N.A."))
+        repo.add_entity(Rental('2', '11', '20', "10.10.2010", "11.10.2010", "N.A."))
+        repo.add_entity(Rental('3', '11', '21', "10.10.2010", "11.10.2010", "N.A."))
+        self.assertEqual(len(self.read_lines(self.rentals_file)), 3)
+        self.assertEqual(self.read_lines(self.rentals_file + ".log")[1:], [])
+
+        repo.remove_by_client_id('20')
+        self.assertEqual(self.read_lines(self.rentals_file + ".log")[1:], ["D,1", "D,2"])
+        reloaded = RentalTextFileRepository(RentalValidator, self.rentals_file, log_structured=True)
+        self.assertEqual([rental.rental_id for rental in reloaded.get_all_entities], ['3'])
+
+
+class TestStructBinaryFileRepositories(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.clients_file = os.path.join(self.directory.name, "clients.bin")
+        self.movies_file = os.path.join(self.directory.name, "movies.bin")
+        self.rentals_file = os.path.join(self.directory.name, "rentals.bin")
+        for file_name in [self.clients_file, self.movies_file, self.rentals_file]:
+            open(file_name, 'wb').close()
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_in_place_updates_and_tombstones(self):
+        repo = ClientBinaryFileRepository(ClientValidator, self.clients_file)
+        self.assertEqual(os.path.getsize(self.clients_file), 0)
+        repo.add_entity(Client('1', "John"))
+        repo.add_entity(Client('2', "Jane"))
+        repo.add_entity(Client('3', "Jim"))
+        size = os.path.getsize(self.clients_file)
+        repo.update_entity_by_id('1', Client('4', "John Doe"))
+        repo.remove_by_id('2')
+        self.assertEqual(os.path.getsize(self.clients_file), size)
+
+        reloaded = ClientBinaryFileRepository(ClientValidator, self.clients_file)
+        self.assertEqual([str(client) for client in reloaded.get_all_entities],
+                         [str(Client('4', "John Doe")), str(Client('3', "Jim"))])
+
+        reloaded.remove_by_id('3')  # more tombstones than records: the file is compacted
+        self.assertLess(os.path.getsize(self.clients_file), size)
+        reloaded = ClientBinaryFileRepository(ClientValidator, self.clients_file)
+        self.assertEqual([str(client) for client in reloaded.get_all_entities], [str(Client('4', "John Doe"))])
+
+    def test_interrupted_rewrite(self):
+        repo = ClientBinaryFileRepository(ClientValidator, self.clients_file)
+        for client_id, name in [('1', "John"), ('2', "Jane"), ('3', "Jim")]:
+            repo.add_entity(Client(client_id, name))
+        old_files = {}
+        for file_name in [self.clients_file, self.clients_file + ".heap"]:
+            with open(file_name, 'rb') as file_pointer:
+                old_files[file_name] = file_pointer.read()
+        repo.remove_by_id('1')
+        repo.remove_by_id('2')  # more tombstones than records: the files are rewritten
+
+        # the rewrite was committed, but the heap and the records were not replaced yet
+        os.replace(self.clients_file + ".heap", self.clients_file + ".heap.tmp")
+        os.replace(self.clients_file, self.clients_file + ".new")
+        for file_name, data in old_files.items():
+            with open(file_name, 'wb') as file_pointer:
+                file_pointer.write(data)
+        reloaded = ClientBinaryFileRepository(ClientValidator, self.clients_file)
+        self.assertEqual([str(client) for client in reloaded.get_all_entities], [str(Client('3', "Jim"))])
+        self.assertFalse(os.path.exists(self.clients_file + ".new"))
+
+        # a rewrite that was not committed
+        for extension in [".tmp", ".heap.tmp"]:
+            with open(self.clients_file + extension, 'wb') as file_pointer:
+                file_pointer.write(b"partial")
+        reloaded = ClientBinaryFileRepository(ClientValidator, self.clients_file)
+        self.assertEqual([str(client) for client in reloaded.get_all_entities], [str(Client('3', "Jim"))])
+        self.assertFalse(os.path.exists(self.clients_file + ".tmp"))
+
+    def test_updates_do_not_grow_the_heap(self):
+        repo = ClientBinaryFileRepository(ClientValidator, self.clients_file)
+        repo.add_entity(Client('1', "John"))
+        repo.add_entity(Client('2', "Jane"))
+        for index in range(50):
+            repo.update_entity_by_id('1', Client('1', "John " + str(index % 10)))
+        self.assertLessEqual(os.path.getsize(self.clients_file + ".heap"), 2 * len("John 0Jane"))
+        self.assertEqual(os.path.getsize(self.clients_file),
+                         StructRecordFile.HEADER.size + 2 * repo._records.record_size)
+
+        reloaded = ClientBinaryFileRepository(ClientValidator, self.clients_file)
+        self.assertEqual([str(client) for client in reloaded.get_all_entities],
+                         [str(Client('1', "John 9")), str(Client('2', "Jane"))])
+        self.assertEqual(reloaded._records.unused_heap_size, os.path.getsize(self.clients_file + ".heap") - 10)
+        reloaded.remove_by_id('2')
+        self.assertEqual(reloaded._records.unused_heap_size, 0)  # rewritten: "Jane" tips the unused bytes over
+
+    def test_movies_and_rentals(self):
+        repo = MovieBinaryFileRepository(MovieValidator, self.movies_file)
+        repo.add_entity(Movie('1', "Titlé", "Description, with comma", "Genre"))
+        reloaded = MovieBinaryFileRepository(MovieValidator, self.movies_file)
+        self.assertEqual(str(reloaded.find_by_id('1')), str(Movie('1', "Titlé", "Description, with comma", "Genre")))
+
+        repo = RentalBinaryFileRepository(RentalValidator, self.rentals_file)
+        repo.add_entity(Rental('1', '10', '20', "10.10.2010", "11.10.2010", "N.A."))
+        repo.add_entity(Rental('2', '11', '20', "1.2.2010", "11.02.2010", "5.02.2010"))
+        repo.add_entity(Rental('3', '11', '21', "10.10.2010", "11.10.2010", "12.10.2010"))
+        repo.remove_by_client_id('21')
+        reloaded = RentalBinaryFileRepository(RentalValidator, self.rentals_file)
+        self.assertEqual([str(rental) for rental in reloaded.get_all_entities],
+                         [str(Rental('1', '10', '20', "10.10.2010", "11.10.2010", "N.A.")),
+                          str(Rental('2', '11', '20', "1.2.2010", "11.02.2010", "5.02.2010"))])
+        self.assertEqual(len(reloaded.find_by_client_id('20')), 2)
+
+    def test_pickled_files_are_converted(self):
+        with open(self.clients_file, 'wb') as file_pointer:
+            pickle.dump(Client('1', "John"), file_pointer)
+            pickle.dump(Client('2', "Jane"), file_pointer)
+        repo = ClientBinaryFileRepository(ClientValidator, self.clients_file)
+        self.assertEqual(len(repo.get_all_entities), 2)
+        with open(self.clients_file, 'rb') as file_pointer:
+            self.assertEqual(file_pointer.read(4), StructRecordFile.MAGIC)
+        reloaded = ClientBinaryFileRepository(ClientValidator, self.clients_file)
+        self.assertEqual(reloaded.find_by_id('2').name, "Jane")
+
+    def test_iter_file_entities(self):
+        repo = RentalBinaryFileRepository(RentalValidator, self.rentals_file)
+        for rental_id in range(1, 6):
+            repo.add_entity(Rental(str(rental_id), '10', '20', "10.10.2010", "11.10.2010", "N.A."))
+        repo.remove_by_id('2')
+        rentals = RentalBinaryFileRepository.iter_file_entities(self.rentals_file)
+        self.assertEqual(str(next(rentals)), str(Rental('1', '10', '20', "10.10.2010", "11.10.2010", "N.A.")))
+        self.assertEqual([rental.rental_id for rental in rentals], ['3', '4', '5'])
+        records = StructRecordFile(self.rentals_file, RentalBinaryFileRepository._RECORD_FIELDS)
+        self.assertEqual([slot for slot, values in records.iter_records(chunk_size=2)], [0, 2, 3, 4])
+
+        with open(self.clients_file, 'wb') as file_pointer:
+            pickle.dump(Client('1', "John"), file_pointer)
+            pickle.dump(Client('2', "Jane"), file_pointer)
+        self.assertEqual([client.name for client in ClientBinaryFileRepository.iter_file_entities(self.clients_file)],
+                         ["John", "Jane"])
+
+    def test_ids_too_large(self):
+        repo = ClientBinaryFileRepository(ClientValidator, self.clients_file)
+        self.assertRaises(ClientRepositoryException, repo.add_entity, Client(str(2 ** 64), "John"))
+        self.assertIsNone(repo.find_by_id(str(2 ** 64)))
+
+    def test_bulk_load(self):
+        repo = RentalBinaryFileRepository(RentalValidator, self.rentals_file)
+        repo.add_entity(Rental('1', '10', '20', "10.10.2010", "11.10.2010", "N.A."))
+        loaded, rejected = repo.bulk_load([Rental('2', '10', '21', "10.10.2010", "11.10.2010", "N.A."),
+                                           Rental(str(2 ** 64), '10', '21', "10.10.2010", "11.10.2010", "N.A."),
+                                           Rental('3', '11', '21', "1.10.2010", "11.10.2010", "12.10.2010")])
+        self.assertEqual(len(loaded), 2)
+        self.assertEqual([position for position, rental, error in rejected], [1])
+        self.assertIsNone(repo.find_by_id(str(2 ** 64)))
+
+        reloaded = RentalBinaryFileRepository(RentalValidator, self.rentals_file)
+        self.assertEqual([rental.rental_id for rental in reloaded.get_all_entities], ['1', '2', '3'])
+        self.assertEqual(len(reloaded.find_by_client_id('21')), 2)
+
+    def test_memory_mapped(self):
+        repo = MovieBinaryFileRepository(MovieValidator, self.movies_file, memory_mapped=True)
+        self.assertRaises(MovieRepositoryException, lambda: repo.get_all_entities)
+        for movie_id in range(1, 5):
+            repo.add_entity(Movie(str(movie_id), "Title " + str(movie_id), "Description", "Genre"))
+        repo.remove_by_id('2')
+
+        mapped = MovieBinaryFileRepository(MovieValidator, self.movies_file, memory_mapped=True)
+        movies = mapped.get_all_entities
+        self.assertEqual(len(movies), 3)
+        self.assertEqual([movie.movie_id for movie in movies], ['1', '3', '4'])
+        self.assertEqual(movies[-1].title, "Title 4")
+        self.assertEqual(mapped.find_by_id('3').title, "Title 3")
+        self.assertIsNone(mapped.find_by_id('2'))
+        self.assertRaises(MovieRepositoryException, mapped.find_by_id, 'abc')
+        self.assertRaises(MovieRepositoryException, mapped.find_by_id, '-5')
+
+        mapped.update_entity_by_id('3', Movie('3', "New title", "Description", "Genre"))
+        self.assertEqual(mapped.find_by_id('3').title, "New title")
+        self.assertEqual([movie.movie_id for movie in movies], ['1', '3', '4'])  # handed out before the update
+        self.assertEqual(movies[0].title, "Title 1")
+        reloaded = MovieBinaryFileRepository(MovieValidator, self.movies_file)
+        self.assertEqual(reloaded.find_by_id('3').title, "New title")
+
+        repo = RentalBinaryFileRepository(RentalValidator, self.rentals_file)
+        repo.add_entity(Rental('1', '10', '20', "10.10.2010", "11.10.2010", "N.A."))
+        mapped = RentalBinaryFileRepository(RentalValidator, self.rentals_file, memory_mapped=True)
+        self.assertEqual(str(mapped.get_all_entities[0]),
+                         str(Rental('1', '10', '20', "10.10.2010", "11.10.2010", "N.A.")))
+        rentals = mapped.get_all_entities
+        self.assertEqual(len(mapped.find_by_client_id('20')), 1)
+        self.assertEqual(rentals[0].rental_id, '1')
+        mapped = RentalBinaryFileRepository(RentalValidator, self.rentals_file, memory_mapped=True)
+        self.assertRaises(RentalRepositoryException, mapped.find_by_id, 'abc')
+        self.assertRaises(RentalRepositoryException, mapped.find_by_id, '-5')
+        self.assertEqual(mapped.find_by_id('1').client_id, '20')
+
+
+class TestSqliteRepositories(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.database = os.path.join(self.directory.name, "movie_rental.db")
+        self.connection_pool = SqliteConnectionPool(self.database)
+
+    def tearDown(self) -> None:
+        self.connection_pool.close()
+        self.directory.cleanup()
+
+    def test_clients_and_movies(self):
+        repo = ClientSqliteRepository(ClientValidator, self.connection_pool)
+        self.assertRaises(ClientRepositoryException, lambda: repo.get_all_entities)
+        self.assertRaises(ClientRepositoryException, repo.find_by_id, "abc")
+        repo.add_entity(Client('1', "John"))
+        repo.add_entity(Client('2', "Jane"))
+        self.assertRaises(ClientRepositoryException, repo.add_entity, Client('1', "John"))
+        repo.update_entity_by_id('1', Client('3', "John Doe"))
+        self.assertRaises(ClientRepositoryException, repo.update_entity_by_id, '3', Client('2', "John"))
+        self.assertEqual(repo.remove_by_id('2').name, "Jane")
+        self.assertRaises(ClientRepositoryException, repo.remove_by_id, '2')
+
+        reloaded = ClientSqliteRepository(ClientValidator, SqliteConnectionPool(self.database))
+        self.assertEqual([str(client) for client in reloaded.get_all_entities], [str(Client('3', "John Doe"))])
+
+        repo = MovieSqliteRepository(MovieValidator, self.connection_pool)
+        repo.add_entity(Movie('1', "Title", "Description", "Genre"))
+        repo.update_entity_by_id('1', Movie('1', "New title", "Description", "Genre"))
+        self.assertEqual(repo.find_by_id('1').title, "New title")
+        self.assertIsNone(repo.find_by_id('2'))
+        repo.add_entity(Movie('2', "Title", "Description", "Drama"))
+        self.assertEqual([movie.movie_id for movie in repo.find_by_genre("Genre")], ['1'])
+        self.assertEqual(repo.genre_counts(), {"Genre": 1, "Drama": 1})
+
+    def test_rental_queries(self):
+        repo = RentalSqliteRepository(RentalValidator, self.connection_pool)
+        repo.add_entity(Rental('1', '10', '20', "10.10.2010", "20.10.2010", "N.A."))
+        repo.add_entity(Rental('2', '11', '20', "01.10.2010", "11.10.2010", "05.10.2010"))
+        repo.add_entity(Rental('3', '11', '21', "10.10.2010", "11.10.2010", "N.A."))
+        today = datetime.date(2010, 10, 15).toordinal()
+
+        self.assertEqual(repo.days_rented_per_movie(today), {'10': 5, '11': 9})
+        self.assertEqual(repo.days_rented_per_client(today), {'20': 9, '21': 5})
+        self.assertEqual(repo.days_rented_by_movie_id('11', today), 9)
+        self.assertEqual(repo.days_rented_by_client_id('22', today), 0)
+        self.assertEqual([rental.rental_id for rental in repo.find_overdue(today)], ['3'])
+        self.assertEqual([rental.rental_id for rental in repo.find_overdue(today, '21')], ['3'])
+        self.assertEqual(repo.find_overdue(today, '20'), [])
+        self.assertFalse(repo.is_movie_available('10', today))
+        self.assertTrue(repo.is_movie_available('11', date_to_ordinal("06.10.2010"), date_to_ordinal("10.10.2010")))
+        self.assertFalse(repo.is_movie_available('11', date_to_ordinal("01.10.2010"), date_to_ordinal("02.10.2010")))
+        self.assertEqual([rental.rental_id for rental in repo.find_by_client_id('20')], ['1', '2'])
+
+        repo.update_entity_by_id('3', Rental('3', '11', '21', "10.10.2010", "11.10.2010", "12.10.2010"))
+        self.assertEqual(repo.find_overdue(today), [])
+        self.assertEqual([rental.rental_id for rental in repo.remove_by_movie_id('11')], ['2', '3'])
+        self.assertEqual([rental.rental_id for rental in repo.get_all_entities], ['1'])
+
+
+class TestWriteBehindBuffer(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.clients_file = os.path.join(self.directory.name, "clients.txt")
+        self.rentals_file = os.path.join(self.directory.name, "rentals.bin")
+        open(self.clients_file, 'w').close()
+        open(self.rentals_file, 'wb').close()
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    @staticmethod
+    def read_lines(file_name):
+        with open(file_name) as file_pointer:
+            return file_pointer.read().splitlines()
+
+    def test_text_files(self):
+        buffer = WriteBehindBuffer(max_operations=3)
+        repo = ClientTextFileRepository(ClientValidator, self.clients_file, write_buffer=buffer)
+        repo.add_entity(Client('1', "John"))
+        repo.add_entity(Client('2', "Jane"))
+        self.assertEqual(buffer.pending_count, 2)
+        self.assertEqual(self.read_lines(self.clients_file), [])
+        repo.add_entity(Client('3', "Jim"))  # third write: the buffer is flushed
+        self.assertEqual(buffer.pending_count, 0)
+        self.assertEqual(self.read_lines(self.clients_file), ["1,John", "2,Jane", "3,Jim"])
+
+        repo.add_entity(Client('4', "Joe"))
+        repo.remove_by_id('1')  # the file is rewritten, the pending line is dropped
+        buffer.flush()
+        self.assertEqual(self.read_lines(self.clients_file), ["2,Jane", "3,Jim", "4,Joe"])
+
+        repo = ClientTextFileRepository(ClientValidator, self.clients_file, log_structured=True, write_buffer=buffer)
+        repo.update_entity_by_id('2', Client('2', "Jane Doe"))
+        buffer.mark_boundary()
+        self.assertEqual(self.read_lines(self.clients_file + ".log")[1:], ["U,2,2,Jane Doe"])
+
+    def test_binary_files(self):
+        buffer = WriteBehindBuffer(max_operations=1000, flush_on_undo=False)
+        repo = RentalBinaryFileRepository(RentalValidator, self.rentals_file, write_buffer=buffer)
+        for rental_id in range(1, 6):
+            repo.add_entity(Rental(str(rental_id), '10', '20', "10.10.2010", "11.10.2010", "N.A."))
+        repo.update_entity_by_id('2', Rental('2', '10', '20', "1.10.2010", "11.10.2010", "N.A."))
+        repo.remove_by_id('3')
+        buffer.mark_boundary()
+        self.assertEqual(os.path.getsize(self.rentals_file), 0)
+
+        buffer.flush()
+        reloaded = RentalBinaryFileRepository(RentalValidator, self.rentals_file)
+        self.assertEqual([rental.rental_id for rental in reloaded.get_all_entities], ['1', '2', '4', '5'])
+        self.assertEqual(reloaded.find_by_id('2').rented_date, "1.10.2010")
+
+    def test_heap_is_written_before_the_records(self):
+        buffer = WriteBehindBuffer(max_operations=1000, flush_on_undo=False)
+        repo = ClientBinaryFileRepository(ClientValidator, self.clients_file, write_buffer=buffer)
+        for client_id in range(1, 5):
+            repo.add_entity(Client(str(client_id), "John"))
+        buffer.flush()
+        heap_size = os.path.getsize(self.clients_file + ".heap")
+
+        repo.remove_by_id('1')  # the records file gets the first pending write
+        repo.add_entity(Client('5', "Jane"))  # then the heap, which the new record points into
+        os.remove(self.clients_file)
+        os.mkdir(self.clients_file)  # the records can not be written: a crash after the first file is written
+        self.assertRaises(OSError, buffer.flush)
+        self.assertEqual(os.path.getsize(self.clients_file + ".heap"), heap_size + len("Jane"))
+        os.rmdir(self.clients_file)
+
+    def test_flush_interval(self):
+        buffer = WriteBehindBuffer(max_delay=10)
+        repo = ClientTextFileRepository(ClientValidator, self.clients_file, write_buffer=buffer)
+        repo.add_entity(Client('1', "John"))
+        for attempt in range(200):
+            if buffer.pending_count == 0:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.read_lines(self.clients_file), ["1,John"])
+
+    def test_hold_and_release(self):
+        buffer = WriteBehindBuffer(max_operations=2, max_delay=100)
+        repo = ClientTextFileRepository(ClientValidator, self.clients_file, write_buffer=buffer)
+        buffer.hold()
+        for client_id in range(1, 4):
+            repo.add_entity(Client(str(client_id), "John"))
+        buffer.mark_boundary()
+        time.sleep(0.2)  # neither max_operations, the undo boundary nor the timer flush a held buffer
+        self.assertEqual(buffer.pending_count, 3)
+        self.assertIsNone(ClientTextFileRepository(ClientValidator, self.clients_file).find_by_id('1'))
+        self.assertEqual(repo.find_by_id('3').name, "John")
+
+        buffer.release()
+        self.assertEqual(buffer.pending_count, 0)
+        reopened = ClientTextFileRepository(ClientValidator, self.clients_file)
+        self.assertEqual([client.client_id for client in reopened.get_all_entities], ['1', '2', '3'])
+
+        repo.add_entity(Client('4', "Jane"))  # flushed by the timer
+        self.assertIsNone(ClientTextFileRepository(ClientValidator, self.clients_file).find_by_id('4'))
+        for attempt in range(200):
+            if buffer.pending_count == 0:
+                break
+            time.sleep(0.01)
+        self.assertEqual(ClientTextFileRepository(ClientValidator, self.clients_file).find_by_id('4').name, "Jane")
+
+
 class TestUndoRedoRepository(unittest.TestCase):
     def setUp(self) -> None:
         self.repo = UndoRedoRepository()
@@ -382,3 +1117,68 @@ class TestUndoRedoRepository(unittest.TestCase):
         self.repo.add_redo_converse(1)
         self.repo.clear_redo()
         self.assertEqual(self.repo.is_redo_empty(), True)
+
+    def test_bounded_history(self):
+        repo = UndoRedoRepository(max_steps=3)
+        for step in range(5):
+            repo.add_undo_operation([step])
+            repo.add_undo_converse([step])
+        self.assertEqual(repo.undo_operations, [4])
+        self.assertEqual([repo._undo_operations[index] for index in range(3)], [[2], [3], [4]])
+        operations, converses = repo.remove_undo()
+        repo.add_redo_operation(converses)
+        repo.add_redo_converse(operations)
+        stats = repo.stats()
+        self.assertEqual((stats["undo_steps"], stats["redo_steps"], stats["evicted_steps"]), (2, 1, 2))
+
+        step_size = stats["estimated_bytes"] // 3
+        repo = UndoRedoRepository(max_bytes=step_size * 2)
+        for step in range(4):
+            repo.add_undo_operation([step])
+            repo.add_undo_converse([step])
+        self.assertEqual(repo.stats()["undo_steps"], 2)
+        self.assertLessEqual(repo.stats()["estimated_bytes"], step_size * 2)
+        repo.remove_undo()
+        repo.remove_undo()
+        self.assertEqual(repo.stats()["estimated_bytes"], 0)
+
+        repo = UndoRedoRepository(max_steps=2)
+        repo.add_undo_operation([0])
+        repo.add_undo_converse([0])
+        for step in range(1, 4):
+            repo.add_redo_operation([step])
+            repo.add_redo_converse([step])
+        self.assertEqual(repo.redo_operations, [3])
+        self.assertEqual(repo.undo_operations, [0])
+        stats = repo.stats()
+        self.assertEqual((stats["undo_steps"], stats["redo_steps"], stats["evicted_steps"]), (1, 1, 2))
+
+        repo = UndoRedoRepository(max_bytes=1)
+        repo.add_undo_operation([1])
+        repo.add_undo_converse([1])
+        self.assertFalse(repo.is_undo_empty())  # the last step is always kept
+
+    def test_history_file(self):
+        directory = tempfile.TemporaryDirectory()
+        file_name = os.path.join(directory.name, "history.log")
+        repo = UndoRedoRepository(file_name=file_name)
+        for step in range(3):
+            repo.add_undo_operation([(2, str(step))])
+            repo.add_undo_converse([(1, str(step), "name, with comma")])
+        operations, converses = repo.remove_undo()
+        repo.add_redo_operation(converses)
+        repo.add_redo_converse(operations)
+
+        reloaded = UndoRedoRepository(max_steps=2, file_name=file_name)
+        self.assertEqual(reloaded.undo_operations, [(2, '1')])
+        self.assertEqual(reloaded.redo_operations, [(1, '2', "name, with comma")])
+        self.assertEqual(reloaded.stats()["undo_steps"], 1)
+        reloaded.clear_redo()
+        reloaded.remove_undo()
+        with open(file_name) as file_pointer:
+            self.assertEqual(len(file_pointer.readlines()), 4)  # compacted to 2 steps when loaded, then 2 records
+
+        reloaded = UndoRedoRepository(file_name=file_name)
+        self.assertTrue(reloaded.is_undo_empty())
+        self.assertTrue(reloaded.is_redo_empty())
+        directory.cleanup()
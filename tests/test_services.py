@@ -1,12 +1,21 @@
+import datetime
+import os
+import tempfile
 import unittest
 
 from services.assign_random_service import AssignRandom
 from src.domain.entities import Rental
 from src.domain.validators import ClientValidator, MovieValidator, RentalValidator
-from src.repository.client_repository import ClientRepository, ClientRepositoryException
-from src.repository.movie_repository import MovieRepository, MovieRepositoryException
-from src.repository.rental_repository import RentalRepository, RentalRepositoryException
+from src.repository.client_repository import ClientRepository, ClientRepositoryException, ClientSqliteRepository, \
+    ClientTextFileRepository
+from src.repository.movie_repository import MovieRepository, MovieRepositoryException, MovieSqliteRepository, \
+    MovieTextFileRepository
+from src.repository.rental_repository import RentalRepository, RentalRepositoryException, RentalColumnarRepository, \
+    RentalSqliteRepository, RentalTextFileRepository
+from src.repository.sqlite_connection_pool import SqliteConnectionPool
+from src.repository.rental_statistics import is_vectorization_available
 from src.repository.undo_redo_repository import UndoRedoRepository
+from src.repository.write_behind_buffer import WriteBehindBuffer
 from src.services.client_service import ClientService
 from src.services.movie_service import MovieService
 from src.services.rental_service import RentalService
@@ -90,6 +99,14 @@ class TestClientService(unittest.TestCase):
         with self.assertRaises(ClientRepositoryException):
             self.client_service.search_by_attribute("", "")
 
+    def test_search_by_name(self):
+        self.client_service.add_client("1", "Mariah Jones")
+        self.client_service.add_client("2", "Marian")
+        self.client_service.add_client("3", "Ari")
+        for search, client_ids in [("ari", ["1", "2", "3"]), ("AN", ["2"]), ("h Jones", ["1"]), ("xyz", [])]:
+            search_results = self.client_service.search_by_attribute("name", search)
+            self.assertEqual([client.client_id for client in search_results], client_ids)
+
     def test_assign_random(self):
         self.client_service.assign_random()
         all = self.client_service.list_clients
@@ -170,6 +187,37 @@ class TestMovieService(unittest.TestCase):
         with self.assertRaises(MovieRepositoryException):
             self.movie_service.search_by_attribute("", "")
 
+    def test_search_by_attribute_match(self):
+        self.movie_service.add_movie("1", "Star Wars", "space opera", "sci-fi")
+        self.movie_service.add_movie("2", "Starship Troopers", "bugs in space", "sci-fi")
+        self.movie_service.add_movie("3", "Mustard", "a condiment", "comedy")
+        connection_pool = SqliteConnectionPool(":memory:")
+        movie_repository = MovieSqliteRepository(self.movie_validator, connection_pool)
+        movie_repository.bulk_load(self.movie_service.list_movies)
+        scanning_service = MovieService(movie_repository, self.rental_repository)
+
+        for movie_service in [self.movie_service, scanning_service]:
+            def titles(search, match):
+                return [movie.title for movie in movie_service.search_by_attribute("title", search, match)]
+            self.assertEqual(titles("star", "substring"), ["Star Wars", "Starship Troopers", "Mustard"])
+            self.assertEqual(titles("star", "word"), ["Star Wars"])
+            self.assertEqual(titles("star", "prefix"), ["Star Wars", "Starship Troopers"])
+            self.assertEqual(titles("wars star", "word"), ["Star Wars"])
+            self.assertEqual(titles("-", "word"), [])
+            self.assertEqual([movie.movie_id for movie in movie_service.search_by_attribute("genre", "sci", "word")],
+                             ["1", "2"])
+            with self.assertRaises(MovieRepositoryException):
+                movie_service.search_by_attribute("title", "star", "regex")
+
+            movie_service.update_movie("1", "1", "Starry Star Wars", "space opera", "sci-fi")
+            self.assertEqual(titles("star", "prefix"), ["Starry Star Wars", "Starship Troopers"])
+            self.assertEqual(titles("starr", "prefix"), ["Starry Star Wars"])
+            movie_service.update_movie("1", "4", "Starry Star Wars", "space opera", "sci-fi")  # keeps its place
+            self.assertEqual(titles("star", "prefix"), ["Starry Star Wars", "Starship Troopers"])
+            self.assertEqual([movie.movie_id for movie in movie_service.search_by_attribute("genre", "sci", "word")],
+                             ["4", "2"])
+        connection_pool.close()
+
     def test_assign_random(self):
         self.movie_service.assign_random()
         all = self.movie_service.list_movies
@@ -234,7 +282,8 @@ class TestRentalService(unittest.TestCase):
         self.rental_service.assign_random()
 
         movie_id = self.rental_service.list_rentals[0].movie_id
-        client_id = self.rental_service.list_rentals[0].client_id
+        client_id = "123123"  # a new client, the random rentals may be overdue
+        self.client_service.add_client(client_id, "John")
         self.rental_service.add_rental("123123", movie_id, client_id, "10.10.2010", "11.10.2010", "N.A.")
 
     def test_return_movie(self):
@@ -248,7 +297,8 @@ class TestRentalService(unittest.TestCase):
 
         self.rental_service.assign_random()
         movie_id = self.rental_service.list_rentals[0].movie_id
-        client_id = self.rental_service.list_rentals[0].client_id
+        client_id = "123123"  # a new client, the random rentals may be overdue
+        self.client_service.add_client(client_id, "John")
         self.rental_service.add_rental("123123", movie_id, client_id, "10.10.2010", "11.10.2010", "N.A.")
         self.rental_service.return_movie("123123")
         with self.assertRaises(RentalRepositoryException):
@@ -281,7 +331,8 @@ class TestRentalService(unittest.TestCase):
         self.rental_service.list_rentals[0].returned_date = "10.10.2100"
         rental_id = self.rental_service.list_rentals[0].rental_id
         movie_id = self.rental_service.list_rentals[0].movie_id
-        client_id = self.rental_service.list_rentals[0].client_id
+        client_id = "123123"  # a new client, the random rentals may be overdue
+        self.client_service.add_client(client_id, "John")
         self.rental_service.add_rental("123123", movie_id, client_id, "10.10.2010", "11.10.2010", "N.A.")
 
         stats2 = self.rental_service.get_movie_statistics
@@ -299,7 +350,8 @@ class TestRentalService(unittest.TestCase):
         self.rental_service.list_rentals[0].returned_date = "10.10.2100"
         rental_id = self.rental_service.list_rentals[0].rental_id
         movie_id = self.rental_service.list_rentals[0].movie_id
-        client_id = self.rental_service.list_rentals[0].client_id
+        client_id = "123123"  # a new client, the random rentals may be overdue
+        self.client_service.add_client(client_id, "John")
         self.rental_service.add_rental("123123", movie_id, client_id, "10.10.2010", "11.10.2010", "N.A.")
 
         stats1 = self.rental_service.get_client_statistics
@@ -317,18 +369,192 @@ class TestRentalService(unittest.TestCase):
         self.rental_service.list_rentals[0].returned_date = "10.10.2100"
         rental_id = self.rental_service.list_rentals[0].rental_id
         movie_id = self.rental_service.list_rentals[0].movie_id
-        client_id = self.rental_service.list_rentals[0].client_id
+        client_id = "123123"  # a new client, the random rentals may be overdue
+        self.client_service.add_client(client_id, "John")
         self.rental_service.add_rental("123123", movie_id, client_id, "10.10.2010", "11.10.2010", "N.A.")
 
         stats3 = self.rental_service.get_rental_statistics
         self.assertNotEqual(len(stats3), 0)
 
+    def test_rental_statistics_ties(self):
+        self.client_service.add_client("1", "bob")
+        self.client_service.add_client("2", "ann")
+        self.movie_service.add_movie("1", "ggg", "fff", "yyy")
+        self.movie_service.add_movie("2", "ggg", "fff", "yyy")
+        self.rental_service.add_rental("9", "1", "1", "10.10.2010", "11.10.2010", "N.A.")
+        self.rental_service.add_rental("10", "2", "2", "10.10.2010", "11.10.2010", "N.A.")
+        self.assertEqual([movie.movie_id for days, movie in self.rental_service.get_rental_statistics], ["1", "2"])
+        self.rental_service.return_movie("9")
+        self.rental_service.un_return_movie("9")  # an update keeps the rental's place
+        self.assertEqual([movie.movie_id for days, movie in self.rental_service.get_rental_statistics], ["1", "2"])
+
+    def test_add_rental_when_overdue(self):
+        self.client_service.add_client("1", "bob")
+        self.movie_service.add_movie("1", "ggg", "fff", "yyy")
+        self.movie_service.add_movie("2", "ggg", "fff", "yyy")
+        self.rental_service.add_rental("1", "1", "1", "10.10.2010", "11.10.2010", "N.A.")
+        with self.assertRaises(RentalRepositoryException):
+            self.rental_service.add_rental("2", "2", "1", "1.1.2020", "11.10.2100", "N.A.")
+        self.assertIsNone(self.rental_repository.find_by_id("2"))
+
+        self.rental_service.return_movie("1")
+        self.rental_service.add_rental("2", "2", "1", "1.1.2020", "11.10.2100", "N.A.")
+        self.rental_service.add_rental("3", "1", "1", "1.1.2021", "11.10.2100", "N.A.")  # not due yet
+
+    def test_bulk_load(self):
+        loaded, rejected = self.client_service.bulk_load([["1", "John"], ["2", "Jane"], ["2", "Joe"], ["3"]])
+        self.assertEqual(len(loaded), 2)
+        self.assertEqual([position for position, row, error in rejected], [2, 3])
+        loaded, rejected = self.movie_service.bulk_load([["1", "Title", "Description", "Genre"],
+                                                         ["abc", "Title", "Description", "Genre"]])
+        self.assertEqual(len(loaded), 1)
+        self.assertEqual(rejected[0][1], ["abc", "Title", "Description", "Genre"])
+
+        loaded, rejected = self.rental_service.bulk_load([
+            ["1", "1", "1", "10.10.2010", "11.10.2010", "N.A."],
+            ["2", "5", "1", "10.10.2010", "11.10.2010", "N.A."],
+            ["3", "1", "5", "10.10.2010", "11.10.2010", "N.A."],
+            ["4", "1", "2", "12.10.2010", "11.10.2010", "N.A."],
+            ["5", "1", "2", "10.10.2010", "31.02.2010", "N.A."],
+            ["1", "1", "2", "10.10.2010", "11.10.2010", "N.A."],
+            ["6", "1", "2", "10.10.2010", "11.10.2010", "12.10.2010"]])
+        self.assertEqual([rental.rental_id for rental in loaded], ["1", "6"])
+        self.assertEqual([position for position, row, error in rejected], [1, 2, 3, 4, 5])
+        self.assertEqual(len(self.rental_service.list_rentals), 2)
+        self.assertEqual(len(self.rental_repository.find_by_client_id("2")), 1)
+
+    def test_statistics_top_k(self):
+        with self.assertRaises(MovieRepositoryException):
+            self.rental_service.get_movie_statistics_top_k(3)
+
+        self.movie_service.assign_random()
+        self.client_service.assign_random()
+        self.rental_service.assign_random()
+        movie_id = self.rental_service.list_rentals[0].movie_id
+        client_id = "123123"  # a new client, the random rentals may be overdue
+        self.client_service.add_client(client_id, "John")
+        self.rental_service.add_rental("123123", movie_id, client_id, "10.10.2010", "11.10.2010", "N.A.")
+
+        def as_text(statistics):
+            # the SQLite repositories return new entities on every query
+            return [(days, str(entity)) for days, entity in statistics]
+
+        for k in [1, 3, "5", 100]:
+            top_movies = self.rental_service.get_movie_statistics_top_k(k)
+            self.assertEqual(as_text(top_movies), as_text(self.rental_service.get_movie_statistics[:int(k)]))
+            top_clients = self.rental_service.get_client_statistics_top_k(k)
+            self.assertEqual(as_text(top_clients), as_text(self.rental_service.get_client_statistics[:int(k)]))
+            top_rentals = self.rental_service.get_rental_statistics_top_k(k)
+            self.assertEqual(as_text(top_rentals), as_text(self.rental_service.get_rental_statistics[:int(k)]))
+
+        with self.assertRaises(RentalRepositoryException):
+            self.rental_service.get_movie_statistics_top_k(0)
+        with self.assertRaises(RentalRepositoryException):
+            self.rental_service.get_client_statistics_top_k("-2")
+        with self.assertRaises(RentalRepositoryException):
+            self.rental_service.get_rental_statistics_top_k("abc")
+
+    def test_genres(self):
+        with self.assertRaises(MovieRepositoryException):
+            self.movie_service.genre_counts()
+        self.movie_service.add_movie("1", "Title", "Description", "drama")
+        self.movie_service.add_movie("2", "Title", "Description", "drama")
+        self.movie_service.add_movie("3", "Title", "Description", "comedy")
+        self.client_service.add_client("1", "John")
+        self.assertEqual(self.movie_service.genre_counts(), [("comedy", 1), ("drama", 2)])
+        self.assertEqual([movie.movie_id for movie in self.movie_service.filter_by_genre("drama")], ["1", "2"])
+        with self.assertRaises(MovieRepositoryException):
+            self.movie_service.filter_by_genre("")
+
+        with self.assertRaises(RentalRepositoryException):
+            self.rental_service.get_genre_statistics
+        self.rental_service.add_rental("1", "1", "1", "10.10.2010", "20.10.2010", "15.10.2010")
+        self.rental_service.add_rental("2", "2", "1", "10.10.2010", "20.10.2010", "12.10.2010")
+        self.rental_service.add_rental("3", "3", "1", "10.10.2010", "20.10.2010", "11.10.2010")
+        self.assertEqual(self.rental_service.get_genre_statistics, [[7, "drama"], [1, "comedy"]])
+
+    def test_availability(self):
+        self.movie_service.add_movie("1", "Title", "Description", "drama")
+        self.movie_service.add_movie("2", "Title", "Description", "drama")
+        self.client_service.add_client("1", "John")
+        self.rental_service.add_rental("1", "1", "1", "10.10.2010", "20.10.2010", "15.10.2010")
+        self.rental_service.add_rental("2", "2", "1", "10.10.2010", "20.10.2100", "N.A.")
+        self.assertFalse(self.rental_service.is_movie_available("1", "14.10.2010"))
+        self.assertTrue(self.rental_service.is_movie_available("1", "15.10.2010", "1.1.2020"))
+        self.assertFalse(self.rental_service.is_movie_available("1", "1.10.2010", "10.10.2010"))
+        self.assertFalse(self.rental_service.is_movie_available("2", "1.1.2020"))
+        self.assertEqual([movie.movie_id for movie in self.rental_service.find_available_movies()], ["1"])
+        self.assertEqual([movie.movie_id for movie in self.rental_service.find_available_movies("1.10.2010")],
+                         ["1", "2"])
+        with self.assertRaises(RentalRepositoryException):
+            self.rental_service.is_movie_available("1", "15.10.2010", "14.10.2010")
+        with self.assertRaises(RentalRepositoryException):
+            self.rental_service.is_movie_available("3", "15.10.2010")
+
+        self.rental_service.add_rental("3", "1", "1", "12.10.2010", "20.10.2010", "N.A.")  # not enforced by default
+        self.rental_service.remove_rental("3")
+        rental_service = RentalService(self.client_repository, self.movie_repository, self.rental_repository,
+                                       enforce_availability=True)
+        with self.assertRaises(RentalRepositoryException):
+            rental_service.add_rental("3", "1", "1", "12.10.2010", "20.10.2010", "N.A.")
+        rental_service.add_rental("3", "1", "1", "16.10.2010", "20.10.2010", "N.A.")
+        loaded, rejected = rental_service.bulk_load([["4", "2", "1", "1.10.2010", "5.10.2010", "5.10.2010"],
+                                                     ["5", "2", "1", "1.10.2011", "5.10.2011", "5.10.2011"]])
+        self.assertEqual([rental.rental_id for rental in loaded], ["4"])
+        with self.assertRaises(RentalRepositoryException):
+            rental_service.un_return_movie("1")  # rented again from the 16th
+
+    def expected_days_rented(self, attribute, key):
+        today = datetime.date.today()
+        days_rented = 0
+        for rental in self.rental_repository.get_all_entities[:]:
+            if getattr(rental, attribute) == key:
+                returned_date = today
+                if rental.returned_date != "N.A.":
+                    returned_date = datetime.datetime.strptime(rental.returned_date, "%d.%m.%Y").date()
+                days_rented += (returned_date - datetime.datetime.strptime(rental.rented_date, "%d.%m.%Y").date()).days
+        return days_rented
+
+    def assert_statistics_are_up_to_date(self):
+        try:
+            movie_statistics = self.rental_service.get_movie_statistics
+            client_statistics = self.rental_service.get_client_statistics
+        except RentalRepositoryException:
+            return
+        for days_rented, movie in movie_statistics:
+            self.assertEqual(days_rented, self.expected_days_rented("movie_id", movie.movie_id))
+        for days_rented, client in client_statistics:
+            self.assertEqual(days_rented, self.expected_days_rented("client_id", client.client_id))
+
+    def test_statistics_are_maintained(self):
+        for index in range(1, 4):
+            self.client_service.add_client(str(index), "client " + str(index))
+            self.movie_service.add_movie(str(index), "title", "description", "genre")
+        self.rental_service.add_rental("1", "1", "1", "10.10.2010", "11.10.2010", "20.10.2010")
+        self.rental_service.add_rental("2", "1", "2", "1.1.2020", "11.10.2030", "N.A.")
+        self.rental_service.add_rental("3", "2", "2", "05.03.2021", "11.10.2030", "N.A.")
+        self.rental_service.add_rental("4", "3", "1", "05.03.2021", "11.10.2030", "07.03.2021")
+        self.assert_statistics_are_up_to_date()
+        self.assertEqual(self.rental_service.get_movie_statistics[-1][0], 2)
+
+        self.rental_service.return_movie("2")
+        self.assert_statistics_are_up_to_date()
+        self.rental_service.un_return_movie("2")
+        self.assert_statistics_are_up_to_date()
+        self.rental_service.remove_rental("4")
+        self.assert_statistics_are_up_to_date()
+        self.client_service.remove_client("2")
+        self.assert_statistics_are_up_to_date()
+        self.movie_service.remove_movie("1")
+        self.assert_statistics_are_up_to_date()
+
     def test_remove_rental(self):
         self.movie_service.assign_random()
         self.client_service.assign_random()
         self.rental_service.assign_random()
         movie_id = self.rental_service.list_rentals[0].movie_id
-        client_id = self.rental_service.list_rentals[0].client_id
+        client_id = "123123"  # a new client, the random rentals may be overdue
+        self.client_service.add_client(client_id, "John")
         self.rental_service.add_rental("123123", movie_id, client_id, "10.10.2010", "11.10.2010", "N.A.")
         self.rental_service.remove_rental("123123")
         self.assertEqual(self.rental_repository.find_by_id("123123"), None)
@@ -338,7 +564,8 @@ class TestRentalService(unittest.TestCase):
         self.client_service.assign_random()
         self.rental_service.assign_random()
         movie_id = self.rental_service.list_rentals[0].movie_id
-        client_id = self.rental_service.list_rentals[0].client_id
+        client_id = "123123"  # a new client, the random rentals may be overdue
+        self.client_service.add_client(client_id, "John")
         self.rental_service.add_rental("123123", movie_id, client_id, "10.10.2010", "11.10.2010", "N.A.")
         self.rental_service.return_movie("123123")
         self.rental_service.un_return_movie("123123")
@@ -346,6 +573,90 @@ class TestRentalService(unittest.TestCase):
         self.assertEqual(rental.returned_date, "N.A.")
 
 
+class TestRentalServiceColumnar(TestRentalService):
+    """
+    The rental service tests, run against the columnar rental repository.
+    """
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.rental_repository = RentalColumnarRepository(self.rental_validator)
+        self.client_service = ClientService(self.client_repository, self.rental_repository)
+        self.movie_service = MovieService(self.movie_repository, self.rental_repository)
+        self.rental_service = RentalService(self.client_repository, self.movie_repository, self.rental_repository)
+
+
+class TestRentalServiceSqlite(TestRentalService):
+    """
+    The rental service tests, run against the SQLite repositories (in memory).
+    """
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.connection_pool = SqliteConnectionPool(":memory:")
+        self.client_repository = ClientSqliteRepository(self.client_validator, self.connection_pool)
+        self.movie_repository = MovieSqliteRepository(self.movie_validator, self.connection_pool)
+        self.rental_repository = RentalSqliteRepository(self.rental_validator, self.connection_pool)
+        self.client_service = ClientService(self.client_repository, self.rental_repository)
+        self.movie_service = MovieService(self.movie_repository, self.rental_repository)
+        self.rental_service = RentalService(self.client_repository, self.movie_repository, self.rental_repository)
+
+    def tearDown(self) -> None:
+        self.connection_pool.close()
+
+
+class TestRentalServiceVectorized(TestRentalServiceColumnar):
+    """
+    The rental service tests, with the NumPy statistics over the columnar repository (the plain Python ones if NumPy
+    is not installed).
+    """
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.rental_service = RentalService(self.client_repository, self.movie_repository, self.rental_repository,
+                                            vectorized=True)
+
+    @unittest.skipUnless(is_vectorization_available(), "NumPy is not installed")
+    def test_vectorized_statistics_match(self):
+        self.movie_service.assign_random()
+        self.client_service.assign_random()
+        self.rental_service.assign_random()
+        movie_id = self.rental_service.list_rentals[0].movie_id
+        client_id = "123123"  # a new client, the random rentals may be overdue
+        self.client_service.add_client(client_id, "John")
+        self.rental_service.add_rental("123124", movie_id, client_id, "10.10.2010", "11.10.2010", "N.A.")
+        self.rental_service.return_movie("123124")
+        self.rental_service.add_rental("123123", movie_id, client_id, "10.10.2010", "11.10.2010", "N.A.")
+
+        plain_service = RentalService(self.client_repository, self.movie_repository, self.rental_repository)
+        self.assertEqual(self.rental_service.get_movie_statistics, plain_service.get_movie_statistics)
+        self.assertEqual(self.rental_service.get_client_statistics, plain_service.get_client_statistics)
+        self.assertEqual([[days, movie.movie_id] for days, movie in self.rental_service.get_rental_statistics],
+                         [[days, movie.movie_id] for days, movie in plain_service.get_rental_statistics])
+
+    def test_vectorized_flag(self):
+        class CountingRentalRepository(RentalRepository):
+            queries = 0
+
+            def days_rented_per_movie(self, today_ordinal):
+                self.queries += 1
+                return super().days_rented_per_movie(today_ordinal)
+
+        rental_repository = CountingRentalRepository(self.rental_validator)
+        self.movie_service.add_movie("1", "Title", "Description", "drama")
+        self.client_service.add_client("1", "John")
+        rental_repository.add_entity(Rental("1", "1", "1", "10.10.2010", "20.10.2010", "15.10.2010"))
+        rental_repository.add_entity(Rental("2", "1", "1", "10.10.2010", "20.10.2010", "N.A."))
+
+        plain_service = RentalService(self.client_repository, self.movie_repository, rental_repository)
+        vectorized_service = RentalService(self.client_repository, self.movie_repository, rental_repository,
+                                           vectorized=True)
+        self.assertEqual(vectorized_service.get_movie_statistics, plain_service.get_movie_statistics)
+        self.assertEqual(rental_repository.queries, 1 if is_vectorization_available() else 2)
+        self.assertEqual(vectorized_service.get_client_statistics, plain_service.get_client_statistics)
+        self.assertEqual(vectorized_service.get_rental_statistics, plain_service.get_rental_statistics)
+
+
 class TestUndoRedoService(unittest.TestCase):
     def setUp(self) -> None:
         self.client_validator = ClientValidator
@@ -390,6 +701,130 @@ class TestUndoRedoService(unittest.TestCase):
         self.undo_redo_service.undo()
         self.undo_redo_service.redo()
 
+    def test_removed_rentals_are_restored(self):
+        self.client_service.add_client("1", "bob")
+        self.client_service.add_client("2", "jim")
+        self.movie_service.add_movie("3", "ggg", "fff", "yyy")
+        for rental_id in ["10", "11", "12"]:
+            self.rental_service.add_rental(rental_id, "3", "1", "10.10.2010", "11.10.2010", "12.10.2010")
+        self.rental_service.add_rental("13", "3", "2", "10.10.2010", "11.10.2010", "N.A.")
+
+        removed_client, removed_rentals = self.client_service.remove_client("1")
+        self.undo_redo_service.remove_client_handler(removed_client, removed_rentals)
+        removed_movie, removed_rentals = self.movie_service.remove_movie("3")
+        self.undo_redo_service.remove_movie_handler(removed_movie, removed_rentals)
+        self.assertRaises(RentalRepositoryException, lambda: self.rental_service.list_rentals)
+
+        self.undo_redo_service.undo()
+        self.assertEqual([rental.rental_id for rental in self.rental_service.list_rentals], ["13"])
+        self.undo_redo_service.undo()
+        self.assertEqual(sorted(rental.rental_id for rental in self.rental_service.list_rentals),
+                         ["10", "11", "12", "13"])
+        self.assertEqual(self.rental_repository.find_by_id("11").returned_date, "12.10.2010")
+        self.undo_redo_service.redo()
+        self.assertEqual([rental.rental_id for rental in self.rental_service.list_rentals], ["13"])
+
+    def test_history_stats(self):
+        self.undo_redo_service = UndoRedoService(UndoRedoRepository(max_steps=2), self.client_service,
+                                                 self.movie_service, self.rental_service)
+        for client_id in ["1", "2", "3"]:
+            self.client_service.add_client(client_id, "bob")
+            self.undo_redo_service.add_client_handler(client_id, "bob")
+        self.undo_redo_service.undo()
+        stats = self.undo_redo_service.history_stats()
+        self.assertEqual((stats["undo_steps"], stats["redo_steps"], stats["evicted_steps"]), (1, 1, 1))
+        self.assertGreater(stats["estimated_bytes"], 0)
+        self.undo_redo_service.undo()
+        self.assertRaises(UndoRedoServiceException, self.undo_redo_service.undo)
+        self.assertEqual(len(self.client_service.list_clients), 1)
+
+    def test_history_is_replayed_after_restart(self):
+        directory = tempfile.TemporaryDirectory()
+        file_names = [os.path.join(directory.name, name) for name in ["clients.txt", "movies.txt", "rentals.txt"]]
+        for file_name in file_names:
+            open(file_name, 'w').close()
+
+        def start():
+            client_repository = ClientTextFileRepository(self.client_validator, file_names[0])
+            movie_repository = MovieTextFileRepository(self.movie_validator, file_names[1])
+            rental_repository = RentalTextFileRepository(self.rental_validator, file_names[2])
+            client_service = ClientService(client_repository, rental_repository)
+            movie_service = MovieService(movie_repository, rental_repository)
+            rental_service = RentalService(client_repository, movie_repository, rental_repository)
+            undo_redo_repository = UndoRedoRepository(file_name=os.path.join(directory.name, "history.log"))
+            return client_service, movie_service, rental_service, \
+                UndoRedoService(undo_redo_repository, client_service, movie_service, rental_service)
+
+        client_service, movie_service, rental_service, undo_redo_service = start()
+        client_service.add_client("1", "bob")
+        undo_redo_service.add_client_handler("1", "bob")
+        movie_service.add_movie("2", "title", "description, with comma", "genre")
+        undo_redo_service.add_movie_handler("2", "title", "description, with comma", "genre")
+        rental_service.add_rental("3", "2", "1", "10.10.2010", "11.10.2010", "N.A.")
+        undo_redo_service.add_rental_handler("3", "2", "1", "10.10.2010", "11.10.2010", "N.A.")
+        removed_movie, removed_rentals = movie_service.remove_movie("2")
+        undo_redo_service.remove_movie_handler(removed_movie, removed_rentals)
+
+        client_service, movie_service, rental_service, undo_redo_service = start()
+        undo_redo_service.undo()
+        self.assertEqual(movie_service.list_movies[0].description, "description, with comma")
+        self.assertEqual(rental_service.list_rentals[0].rental_id, "3")
+        undo_redo_service.undo()
+        undo_redo_service.undo()
+        undo_redo_service.undo()
+        self.assertRaises(ClientRepositoryException, lambda: client_service.list_clients)
+
+        client_service, movie_service, rental_service, undo_redo_service = start()
+        undo_redo_service.redo()
+        self.assertEqual(client_service.list_clients[0].name, "bob")
+        directory.cleanup()
+
+    def test_transaction(self):
+        with self.undo_redo_service.transaction():
+            self.client_service.add_client("1", "bob")
+            self.undo_redo_service.add_client_handler("1", "bob")
+            self.movie_service.add_movie("2", "ggg", "fff", "yyy")
+            self.undo_redo_service.add_movie_handler("2", "ggg", "fff", "yyy")
+            self.rental_service.add_rental("3", "2", "1", "10.10.2010", "11.10.2010", "N.A.")
+            self.undo_redo_service.add_rental_handler("3", "2", "1", "10.10.2010", "11.10.2010", "N.A.")
+            self.assertRaises(UndoRedoServiceException, self.undo_redo_service.undo)
+        self.assertEqual(self.undo_redo_service.history_stats()["undo_steps"], 1)
+
+        self.undo_redo_service.undo()
+        self.assertRaises(ClientRepositoryException, lambda: self.client_service.list_clients)
+        self.assertRaises(MovieRepositoryException, lambda: self.movie_service.list_movies)
+        self.assertRaises(RentalRepositoryException, lambda: self.rental_service.list_rentals)
+        self.undo_redo_service.redo()
+        self.assertEqual(self.rental_service.list_rentals[0].rental_id, "3")
+
+        self.undo_redo_service.undo()
+        with self.assertRaises(ClientRepositoryException):
+            with self.undo_redo_service.transaction():
+                self.client_service.add_client("1", "bob")
+                self.undo_redo_service.add_client_handler("1", "bob")
+                self.client_service.add_client("1", "bob")  # validated against the client added before it
+        self.assertRaises(ClientRepositoryException, lambda: self.client_service.list_clients)
+        self.assertEqual(self.undo_redo_service.history_stats()["redo_steps"], 1)  # rolled back: redo is kept
+
+    def test_transaction_is_written_once(self):
+        directory = tempfile.TemporaryDirectory()
+        file_name = os.path.join(directory.name, "clients.txt")
+        open(file_name, 'w').close()
+        write_buffer = WriteBehindBuffer(max_operations=2)
+        client_repository = ClientTextFileRepository(self.client_validator, file_name, write_buffer=write_buffer)
+        client_service = ClientService(client_repository, self.rental_repository)
+        undo_redo_service = UndoRedoService(self.undo_redo_repository, client_service, self.movie_service,
+                                            self.rental_service, write_buffer)
+        with undo_redo_service.transaction():
+            for client_id in ["1", "2", "3"]:
+                client_service.add_client(client_id, "bob")
+                undo_redo_service.add_client_handler(client_id, "bob")
+            self.assertEqual(os.path.getsize(file_name), 0)
+        self.assertEqual(write_buffer.pending_count, 0)
+        with open(file_name) as file_pointer:
+            self.assertEqual(file_pointer.read().splitlines(), ["1,bob", "2,bob", "3,bob"])
+        directory.cleanup()
+
     def test_update_client_handler(self):
         self.assertRaises(UndoRedoServiceException, self.undo_redo_service.undo)
         self.assertRaises(UndoRedoServiceException, self.undo_redo_service.redo)
@@ -526,3 +961,8 @@ class TestAssignRandom(unittest.TestCase):
             for rental2 in rentals:
                 if rental1 != rental2:
                     self.assertNotEqual(rental1.rental_id, rental2.rental_id)
+
+    def test_assign_random_is_one_undo_step(self):
+        self.assign_random.assign_random_clients()
+        self.undo_redo_service.undo()
+        self.assertRaises(ClientRepositoryException, lambda: self.client_service.list_clients)